@@ -0,0 +1,161 @@
+import os
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+'''
+Control de admisión de peticiones. Limita cuántas peticiones de cada clase de ruta se atienden a la vez,
+de forma que una ráfaga no se quede esperando en el threadpool y en el pool de conexiones de la base de datos.
+Las peticiones que no tienen hueco esperan en una cola acotada; si la cola está llena, o la espera supera
+el tiempo máximo, se responde inmediatamente 503 con la cabecera Retry-After.
+
+Clases de ruta:
+    heavy: informes costosos (GET /fee_report/, GET /inscriptions/).
+    write: peticiones que modifican datos (POST, PUT, PATCH, DELETE).
+    cheap: el resto de lecturas CRUD.
+
+Configuración por variables de entorno (<CLASE> es CHEAP, HEAVY o WRITE):
+    ADMISSION_<CLASE>_LIMIT: peticiones simultáneas permitidas.
+    ADMISSION_<CLASE>_QUEUE: peticiones que pueden esperar en cola.
+    ADMISSION_QUEUE_TIMEOUT: segundos máximos de espera en cola (por defecto 5).
+    ADMISSION_RETRY_AFTER: valor de la cabecera Retry-After en segundos (por defecto 1).
+'''
+
+# Rutas de lectura consideradas informes costosos
+HEAVY_PATHS = ("/fee_report/", "/inscriptions/")
+
+# Rutas que no pasan por el control de admisión (estado del propio control y métricas, que deben responder
+# también con el servidor saturado, documentación y el canal de cambios, cuyas conexiones duran indefinidamente)
+EXEMPT_PATHS = ("/admission/", "/metrics", "/docs", "/redoc", "/openapi.json", "/changes/stream")
+
+DEFAULT_LIMITS = {
+    "cheap": (10, 50),
+    "heavy": (2, 4),
+    "write": (4, 20),
+}
+
+
+def classify_request(method: str, path: str) -> str:
+    # Devuelve la clase de ruta de una petición
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write"
+    if path in HEAVY_PATHS:
+        return "heavy"
+    return "cheap"
+
+
+class Gate:
+    '''Semáforo con cola de espera acotada para una clase de ruta.'''
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> bool:
+        # Hay hueco y nadie esperando: se entra directamente
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # Al liberar un hueco, release() lo transfiere a este waiter sin decrementar in_flight
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except BaseException:
+            # Espera cancelada (p. ej. el cliente cerró la conexión): si ya se le había
+            # transferido un hueco, se devuelve para no perderlo
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None, queue_timeout: float = 5.0, retry_after: int = 1):
+        limits = limits or DEFAULT_LIMITS
+        self.gates = {name: Gate(limit, max_queue) for name, (limit, max_queue) in limits.items()}
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        limits = {}
+        for name, (limit, max_queue) in DEFAULT_LIMITS.items():
+            limits[name] = (
+                int(os.getenv(f"ADMISSION_{name.upper()}_LIMIT", str(limit))),
+                int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", str(max_queue))),
+            )
+        return cls(
+            limits,
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5")),
+            retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "1")),
+        )
+
+    def snapshot(self) -> dict:
+        return {name: gate.snapshot() for name, gate in self.gates.items()}
+
+
+# Controlador compartido por el middleware y el endpoint de estado
+admission_controller = AdmissionController.from_env()
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.controller.gates[classify_request(scope["method"], scope["path"])]
+        if not await gate.acquire(self.controller.queue_timeout):
+            response = JSONResponse(
+                {"detail": "Servidor ocupado, inténtelo de nuevo más tarde"},
+                status_code=503,
+                headers={"Retry-After": str(self.controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
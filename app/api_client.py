@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import importlib.util
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+'''
+Cliente de la API para la GUI (modo API, ver gui.py).
+
+Con GUI_API_URL definida, la GUI no abre conexiones a la base de datos: todas las operaciones pasan por la API,
+donde están el pool de conexiones, las cachés (informes, idempotencia) y la lógica de negocio. Todas las
+peticiones de un proceso de Streamlit comparten un único httpx.Client, que mantiene abiertas las conexiones
+(keep-alive) y, si está instalado el paquete h2 y el servidor o el proxy delante de la API lo admiten, usa HTTP/2
+para multiplexar las peticiones sobre una sola conexión. Los reintentos de conexión no duplican altas: cada
+POST lleva su propia Idempotency-Key.
+
+Los errores de la API se convierten en ApiError con el código y el detalle de la respuesta; los "no encontrado"
+de las consultas, actualizaciones y bajas devuelven None o False, como las funciones CRUD.
+
+Configuración por variables de entorno:
+    GUI_API_URL: URL base de la API (p. ej. http://api:8000); sin ella la GUI usa la base de datos directamente.
+    GUI_API_TIMEOUT: tiempo máximo de cada petición en segundos (por defecto 10).
+    GUI_API_CONNECT_TIMEOUT: tiempo máximo para abrir una conexión (por defecto 3).
+    GUI_API_MAX_CONNECTIONS: conexiones abiertas a la vez como máximo (por defecto 20).
+    GUI_API_HTTP2: 0 desactiva HTTP/2 (por defecto activo si está instalado h2).
+'''
+
+# IDs por consulta por lotes (límite de la API, ver routes.MAX_BATCH_IDS)
+MAX_BATCH_IDS = 500
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+    def __str__(self) -> str:
+        return f"{self.status_code}: {self.detail}"
+
+
+def _record(data: Optional[dict]) -> Optional[SimpleNamespace]:
+    # Los registros se devuelven con acceso por atributo, como los objetos del ORM
+    return SimpleNamespace(**data) if data is not None else None
+
+
+def _cursor_params(after: Optional[Tuple]) -> dict:
+    if after is None:
+        return {}
+    value, last_id = after
+    return {"after_value": str(value), "after_id": last_id}
+
+
+class ApiClient:
+    def __init__(self, base_url: str = "", timeout: float = 10.0, connect_timeout: float = 3.0,
+                 max_connections: int = 20, http2: Optional[bool] = None, client: Optional[httpx.Client] = None):
+        if client is None:
+            if http2 is None:
+                http2 = importlib.util.find_spec("h2") is not None
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            client = httpx.Client(
+                base_url=base_url,
+                timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                # Un reintento si falla la conexión (p. ej. una conexión keep-alive cerrada por el servidor)
+                transport=httpx.HTTPTransport(http2=http2, limits=limits, retries=1),
+            )
+        self._client = client
+
+    @classmethod
+    def from_env(cls) -> "ApiClient":
+        return cls(
+            base_url=os.environ["GUI_API_URL"],
+            timeout=float(os.getenv("GUI_API_TIMEOUT", "10")),
+            connect_timeout=float(os.getenv("GUI_API_CONNECT_TIMEOUT", "3")),
+            max_connections=int(os.getenv("GUI_API_MAX_CONNECTIONS", "20")),
+            http2=None if os.getenv("GUI_API_HTTP2", "1") != "0" else False,
+        )
+
+    def close(self):
+        self._client.close()
+
+    def _request(self, method: str, path: str, not_found: Any = ApiError, **kwargs) -> Any:
+        if method == "POST":
+            kwargs.setdefault("headers", {})["Idempotency-Key"] = uuid.uuid4().hex
+        response = self._client.request(method, path, **kwargs)
+        if response.status_code == 404 and not_found is not ApiError:
+            return not_found
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise ApiError(response.status_code, detail)
+        return response.json()
+
+    # Estudiantes
+
+    def search_students(self, query: str, skip: int = 0, limit: int = 50) -> dict:
+        result = self._request("GET", "/students/search", params={"q": query, "skip": skip, "limit": limit})
+        result["items"] = [_record(item) for item in result["items"]]
+        return result
+
+    def get_student(self, student_id: int) -> Optional[SimpleNamespace]:
+        return _record(self._request("GET", f"/students/{student_id}", not_found=None))
+
+    def create_student(self, student: dict) -> SimpleNamespace:
+        return _record(self._request("POST", "/students/", json=student))
+
+    def update_student(self, student_id: int, student: dict) -> Optional[SimpleNamespace]:
+        return _record(self._request("PUT", f"/students/{student_id}", json=student, not_found=None))
+
+    def delete_student(self, student_id: int) -> bool:
+        return self._request("DELETE", f"/students/{student_id}", not_found=False) is not False
+
+    # Inscripciones
+
+    def get_inscriptions_by_student(self, student_id: int) -> List[dict]:
+        return self._request("GET", f"/students/{student_id}/inscriptions", not_found=[])
+
+    def get_inscriptions_page(self, after: Optional[Tuple] = None, limit: int = 50, **filters) -> dict:
+        params = {key: value for key, value in filters.items() if value not in (None, "")}
+        return self._request("GET", "/inscriptions/page", params={**params, **_cursor_params(after), "limit": limit})
+
+    def create_inscription(self, inscription: dict) -> SimpleNamespace:
+        return _record(self._request("POST", "/inscriptions/", json=inscription))
+
+    def delete_inscription(self, inscription_id: int) -> bool:
+        return self._request("DELETE", f"/inscriptions/{inscription_id}", not_found=False) is not False
+
+    # Tarifas
+
+    def get_student_fee(self, student_id: int) -> Optional[float]:
+        return self._request("GET", f"/students/{student_id}/fee", not_found=None)
+
+    def get_fee_report_page(self, after: Optional[Tuple] = None, limit: int = 50, **filters) -> dict:
+        params = {key: value for key, value in filters.items() if value not in (None, "")}
+        return self._request("GET", "/fee_report/page", params={**params, **_cursor_params(after), "limit": limit})
+
+    def fee_report(self, wait: float = 60.0, poll_interval: float = 0.5) -> List[dict]:
+        # Informe completo a través de la cola de informes de la API, que lo reutiliza mientras no cambien los datos
+        job = self._request("POST", "/reports/fees")
+        deadline = time.monotonic() + wait
+        while job["status"] in ("pending", "running"):
+            if time.monotonic() > deadline:
+                raise ApiError(504, "El informe de tarifas no terminó a tiempo")
+            time.sleep(poll_interval)
+            job = self._request("GET", f"/reports/{job['id']}")
+        if job["status"] != "done":
+            raise ApiError(500, job.get("error") or "Error al generar el informe de tarifas")
+        return job["result"]
+
+    def analytics(self) -> dict:
+        return self._request("GET", "/analytics/")
+
+    # Catálogos: instrumentos, profesores y niveles
+
+    def list_instruments(self) -> List[dict]:
+        return self._request("GET", "/instruments/", not_found=[])
+
+    def create_instrument(self, name: str, price: float) -> SimpleNamespace:
+        return _record(self._request("POST", "/instruments/", json={"name": name, "price": str(price)}))
+
+    def update_instrument(self, instrument_id: int, name: Optional[str] = None,
+                          price: Optional[float] = None) -> Optional[SimpleNamespace]:
+        body = {"name": name, "price": None if price is None else str(price)}
+        return _record(self._request("PUT", f"/instruments/{instrument_id}", json=body, not_found=None))
+
+    def delete_instrument(self, instrument_id: int) -> bool:
+        return self._request("DELETE", f"/instruments/{instrument_id}", not_found=False) is not False
+
+    def list_teachers(self) -> List[dict]:
+        return self._request("GET", "/teachers/", not_found=[])
+
+    def create_teacher(self, teacher: dict) -> SimpleNamespace:
+        return _record(self._request("POST", "/teachers/", json=teacher))
+
+    def update_teacher(self, teacher_id: int, teacher: dict) -> Optional[SimpleNamespace]:
+        return _record(self._request("PUT", f"/teachers/{teacher_id}", json=teacher, not_found=None))
+
+    def delete_teacher(self, teacher_id: int) -> bool:
+        return self._request("DELETE", f"/teachers/{teacher_id}", not_found=False) is not False
+
+    def list_levels(self) -> List[dict]:
+        # Niveles con el nombre de su instrumento, con una consulta por lotes de los instrumentos (?ids=)
+        levels = self._request("GET", "/levels/", not_found=[])
+        instrument_ids = sorted({level["instruments_id"] for level in levels})
+        names: Dict[int, str] = {}
+        for start in range(0, len(instrument_ids), MAX_BATCH_IDS):
+            chunk = instrument_ids[start:start + MAX_BATCH_IDS]
+            batch = self._request("GET", "/instruments/", params={"ids": ",".join(map(str, chunk))})
+            names.update({instrument["id"]: instrument["name"] for instrument in batch["items"]})
+        return [{"level_id": level["id"], "instrument_name": names.get(level["instruments_id"]), "level": level["level"]}
+                for level in sorted(levels, key=lambda level: level["id"])]
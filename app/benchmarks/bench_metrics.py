@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+'''
+Benchmark del coste de las métricas: tiempo de una observación aislada y sobrecarga del middleware de
+métricas por petición, comparando la misma aplicación ASGI con y sin MetricsMiddleware (sin red ni base de
+datos, para aislar el coste del propio middleware).
+
+Uso (desde el directorio app):
+    python benchmarks/bench_metrics.py --requests 20000
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from metrics import Histogram, Counter, MetricsMiddleware  # noqa: E402
+
+
+class _Route:
+    path = "/students/{student_id}"
+
+
+async def bare_app(scope, receive, send):
+    # Aplicación mínima: fija la ruta como haría FastAPI y responde 200 sin cuerpo
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def run_requests(app, count: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for i in range(count):
+        scope = {"type": "http", "method": "GET", "path": f"/students/{i}", "headers": []}
+        await app(scope, receive, send)
+    return time.perf_counter() - started
+
+
+def per_call_ns(func, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de las métricas de Prometheus")
+    parser.add_argument("--requests", type=int, default=20000, help="Peticiones por ronda")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    histogram = Histogram("bench_seconds", "Benchmark", ("method", "route"))
+    counter = Counter("bench_total", "Benchmark", ("method", "route", "status"))
+    print(f"Histogram.observe: {per_call_ns(lambda: histogram.observe(0.012, ('GET', '/students/')), args.requests):.0f} ns")
+    print(f"Counter.inc:       {per_call_ns(lambda: counter.inc(('GET', '/students/', '200')), args.requests):.0f} ns")
+
+    instrumented = MetricsMiddleware(bare_app)
+    bare, measured = [], []
+    for _ in range(args.rounds):
+        bare.append(asyncio.run(run_requests(bare_app, args.requests)))
+        measured.append(asyncio.run(run_requests(instrumented, args.requests)))
+    bare_us = statistics.median(bare) / args.requests * 1e6
+    measured_us = statistics.median(measured) / args.requests * 1e6
+    print(f"Petición sin métricas: {bare_us:.2f} µs")
+    print(f"Petición con métricas: {measured_us:.2f} µs (sobrecarga {measured_us - bare_us:.2f} µs por petición)")
+
+
+if __name__ == "__main__":
+    main()
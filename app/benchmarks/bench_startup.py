@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+'''
+Benchmark del tiempo de arranque (importación) de la API (main) y de la GUI (gui) con python -X importtime.
+
+Cada punto de entrada se importa varias veces en un proceso nuevo; se toma la mediana del tiempo acumulado de
+su importación y se compara con su presupuesto. También se muestran las importaciones directas más costosas,
+para localizar qué conviene diferir. Termina con código 1 si algún punto de entrada supera su presupuesto o
+no se puede importar, así que se puede usar en CI.
+
+Uso (desde el directorio app):
+    python benchmarks/bench_startup.py --runs 5 --api-budget 2.0 --gui-budget 3.0
+
+Si no se define DATABASE_URL se usa una base de datos SQLite temporal (main crea las tablas al importarse).
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Punto de entrada -> (módulo, presupuesto por defecto en segundos)
+ENTRY_POINTS = {
+    "api": ("main", 2.0),
+    "gui": ("gui", 3.0),
+}
+
+
+def parse_importtime(output: str):
+    # Líneas "import time: propio | acumulado | módulo"; la sangría del nombre indica la profundidad
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((depth, int(cumulative), name.strip()))
+    return modules
+
+
+def direct_imports(modules, module: str):
+    # Importaciones hechas directamente por el módulo: las de un nivel más que preceden a su línea
+    index = max(i for i, (depth, _, name) in enumerate(modules) if depth == 0 and name == module)
+    children = []
+    for depth, cumulative, name in reversed(modules[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative, name))
+    return sorted(children, reverse=True)
+
+
+def measure(module: str, env: dict, workdir: str):
+    # Se ejecuta en un directorio temporal para que los ficheros de log de la aplicación no queden en app
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+    total = next(cumulative for depth, cumulative, name in reversed(modules) if depth == 0 and name == module)
+    return total / 1e6, direct_imports(modules, module)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la API y de la GUI")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="importaciones directas más costosas a mostrar")
+    parser.add_argument("--only", choices=sorted(ENTRY_POINTS))
+    for entry, (_, budget) in ENTRY_POINTS.items():
+        parser.add_argument(f"--{entry}-budget", type=float, default=budget, help=f"presupuesto en segundos (por defecto {budget})")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    tmpdir = tempfile.TemporaryDirectory()
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmpdir.name, 'startup.db')}")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [APP_DIR, env.get("PYTHONPATH")]))
+
+    failed = False
+    for entry, (module, _) in ENTRY_POINTS.items():
+        if args.only and entry != args.only:
+            continue
+        budget = getattr(args, f"{entry}_budget")
+        try:
+            runs = [measure(module, env, tmpdir.name) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{entry} ({module}): no se pudo importar: {e}")
+            failed = True
+            continue
+        seconds = statistics.median(total for total, _ in runs)
+        verdict = "OK" if seconds <= budget else "SUPERA EL PRESUPUESTO"
+        failed |= seconds > budget
+        print(f"{entry} ({module}): {seconds:.3f} s (mediana de {args.runs}, presupuesto {budget:.1f} s) {verdict}")
+        for cumulative, name in runs[-1][1][:args.top]:
+            print(f"    {cumulative / 1e6:7.3f} s  {name}")
+
+    tmpdir.cleanup()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import threading
+import statistics
+import argparse
+
+import httpx
+
+'''
+Benchmark de rendimiento del servidor con 1 y N workers sobre los endpoints de lectura más usados.
+
+Uso (desde el directorio app):
+    python benchmarks/bench_workers.py --workers 4 --duration 10 --concurrency 32
+
+Si no se define DATABASE_URL se crea una base de datos SQLite temporal con datos de prueba.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+HOT_ENDPOINTS = ["/students/", "/instruments/", "/levels/", "/students/1", "/students/1/fee"]
+
+
+def seed_database(database_url: str, students: int = 500):
+    # Crea datos de prueba en una base de datos vacía
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from datetime import date
+    from models import Base, Student, Instrument, Level, Inscription
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        if session.query(Student).first():
+            return
+        instruments = [Instrument(name=f"Instrumento {i}", price=35 + i) for i in range(10)]
+        session.add_all(instruments)
+        session.flush()
+        levels = [Level(instruments_id=instrument.id, level="Iniciación") for instrument in instruments]
+        session.add_all(levels)
+        session.flush()
+        for i in range(students):
+            student = Student(first_name=f"Alumno{i}", last_name="Prueba", age=20, phone="600000000", mail=f"a{i}@test.com")
+            session.add(student)
+            session.flush()
+            session.add(Inscription(student_id=student.id, level_id=levels[i % len(levels)].id, registration_date=date(2024, 9, 1)))
+        session.commit()
+    engine.dispose()
+
+
+def start_server(workers: int, port: int, env: dict) -> subprocess.Popen:
+    env = dict(env, WEB_CONCURRENCY=str(workers), APP_PORT=str(port), APP_HOST="127.0.0.1")
+    process = subprocess.Popen([sys.executable, "server.py"], cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Esperar a que el servidor acepte peticiones
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/test/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("El servidor no arrancó a tiempo")
+
+
+def run_load(port: int, duration: float, concurrency: int) -> dict:
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(index: int):
+        local = []
+        local_errors = 0
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+            i = index
+            while time.perf_counter() < stop_at:
+                path = HOT_ENDPOINTS[i % len(HOT_ENDPOINTS)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    if client.get(path).status_code >= 500:
+                        local_errors += 1
+                except httpx.HTTPError:
+                    local_errors += 1
+                local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        "errors": errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark 1 worker frente a N workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if "DATABASE_URL" not in env:
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed_database(env["DATABASE_URL"])
+
+    for workers in sorted({1, args.workers}):
+        process = start_server(workers, args.port, env)
+        try:
+            result = run_load(args.port, args.duration, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        print(f"workers={workers:<3} requests={result['requests']:<7} rps={result['rps']:.1f} "
+              f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms errors={result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
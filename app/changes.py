@@ -0,0 +1,228 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Base, TableVersion, ChangeLogEntry
+
+'''
+Seguimiento de cambios en los datos. Cada tabla tiene un contador de versión que aumenta cada vez que se
+confirma (commit) una transacción que la ha modificado, tanto con el ORM (add, delete, cambios en objetos)
+como con sentencias UPDATE/DELETE masivas. Los borrados que la base de datos propaga con ON DELETE CASCADE
+también cuentan como cambios en las tablas dependientes.
+
+Sirve para invalidar cachés: un resultado calculado con la versión v de unas tablas sigue siendo válido
+mientras data_version() de esas tablas devuelva v. Esos contadores son del proceso; las cachés que comparten
+varios procesos (workers de la API, GUI) usan db_version(), la versión guardada en la tabla table_versions,
+que aumenta en la misma transacción que los cambios confirmados por cualquier proceso. Los cambios hechos con
+SQL fuera de una sesión del ORM (p. ej. la consola SQL) no la actualizan.
+
+Además, cada registro creado, modificado o borrado se anota como un cambio (tabla, id, operación) y, al
+confirmar la transacción, los cambios se entregan a los suscriptores del proceso registrados con on_commit().
+Si el id no se conoce (INSERT masivo) se entrega como None. Los cambios de las tablas de LOGGED_TABLES se
+guardan también en la tabla change_log, en la misma transacción, con la versión compartida de la tabla: así
+los ve cualquier proceso (el canal de cambios en tiempo real de cada worker la lee, ver feed.py).
+'''
+
+logger = logging.getLogger("music_app")
+
+# Operaciones de un cambio
+CREATED, UPDATED, DELETED = "created", "updated", "deleted"
+
+# Tablas cuyos cambios se guardan en change_log; las internas (claves de idempotencia, informes, etc.) no
+LOGGED_TABLES = ("students", "teachers", "instruments", "levels", "packs", "inscriptions",
+                 "packs_instruments", "teachers_instruments")
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_listeners: List[Callable] = []
+
+
+def _cascade_targets() -> Dict[str, List]:
+    # Claves foráneas con ON DELETE CASCADE agrupadas por la tabla a la que apuntan
+    targets: Dict[str, List] = {}
+    for table in Base.metadata.tables.values():
+        for fk in table.foreign_keys:
+            if (fk.ondelete or "").upper() == "CASCADE":
+                targets.setdefault(fk.column.table.name, []).append(fk)
+    return targets
+
+
+_CASCADES = _cascade_targets()
+
+
+def data_version(tables: Iterable[str]) -> Tuple[int, ...]:
+    # Versión actual de las tablas indicadas, en el orden recibido
+    with _lock:
+        return tuple(_versions.get(name, 0) for name in tables)
+
+
+def db_version(db, tables: Iterable[str]) -> Tuple[int, ...]:
+    # Versión de las tablas guardada en la base de datos, en el orden recibido; db es una sesión o una conexión
+    tables = list(tables)
+    rows = dict(db.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+    ).all())
+    return tuple(rows.get(name, 0) for name in tables)
+
+
+def bump_versions(connection, tables: Iterable[str]):
+    # Incrementa la versión guardada de las tablas; en orden para que dos transacciones no se bloqueen entre sí
+    tables = sorted(set(tables))
+    versions = TableVersion.__table__
+    increment = update(versions).values(version=versions.c.version + 1)
+    result = connection.execute(increment.where(versions.c.table_name.in_(tables)))
+    if result.rowcount == len(tables):
+        return
+    # Tablas sin fila (creadas después que table_versions)
+    existing = set(connection.execute(select(versions.c.table_name).where(versions.c.table_name.in_(tables))).scalars())
+    for name in tables:
+        if name in existing:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(versions).values(table_name=name, version=1))
+        except IntegrityError:
+            # Otra transacción ha creado la fila a la vez
+            connection.execute(increment.where(versions.c.table_name == name))
+
+
+def mark_changed(tables: Iterable[str]) -> Dict[str, int]:
+    # Registrar un cambio confirmado en las tablas; devuelve la nueva versión de cada una
+    tables = list(tables)
+    with _lock:
+        for name in tables:
+            _versions[name] = _versions.get(name, 0) + 1
+        return {name: _versions[name] for name in tables}
+
+
+def on_commit(listener: Callable):
+    '''
+    Registra listener(changes), que recibe tras cada commit la lista de cambios confirmados como
+    diccionarios {"entity", "id", "op", "version"}. Se llama en el hilo que hizo el commit.
+    '''
+    _listeners.append(listener)
+
+
+def _pending(session: Session) -> Dict[Tuple[str, Optional[int]], str]:
+    return session.info.setdefault("pending_changes", {})
+
+
+def _record(session: Session, table: str, ids: Iterable[Optional[int]], op: str):
+    pending = _pending(session)
+    for row_id in ids:
+        key = (table, row_id)
+        # Un registro creado y modificado en la misma transacción sigue siendo una creación
+        if not (pending.get(key) == CREATED and op == UPDATED):
+            pending[key] = op
+
+
+def _record_deletes(session: Session, table: str, ids: List[int]):
+    # Anota los borrados y los que la base de datos hará en cascada; se llama antes de ejecutar el DELETE
+    _record(session, table, ids, DELETED)
+    if not ids:
+        return
+    for fk in _CASCADES.get(table, ()):
+        child = fk.parent.table
+        child_ids = session.connection().execute(
+            select(*child.primary_key.columns).where(fk.parent.in_(ids))
+        ).scalars().all()
+        _record_deletes(session, child.name, list(child_ids))
+
+
+def _identity(obj) -> Optional[int]:
+    # En after_flush los objetos nuevos aún no tienen identity key, pero sí la clave primaria asignada
+    state = inspect(obj)
+    return state.mapper.primary_key_from_instance(obj)[0]
+
+
+@event.listens_for(Session, "before_flush")
+def _track_deletes(session, flush_context, instances):
+    for obj in session.deleted:
+        _record_deletes(session, obj.__table__.name, [_identity(obj)])
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in session.new:
+        _record(session, obj.__table__.name, [_identity(obj)], CREATED)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            _record(session, obj.__table__.name, [_identity(obj)], UPDATED)
+    # Objetos borrados por las cascadas del ORM durante el flush
+    for obj in session.deleted:
+        _record(session, obj.__table__.name, [_identity(obj)], DELETED)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_statement(orm_execute_state):
+    # UPDATE/DELETE/INSERT masivos (db.execute(delete(...))) no pasan por el flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    session = orm_execute_state.session
+    statement = orm_execute_state.statement
+    table = statement.table
+    if orm_execute_state.is_insert:
+        _record(session, table.name, [None], CREATED)
+        return
+    # Los ids afectados se consultan antes de ejecutar la sentencia, con el mismo WHERE
+    query = select(*table.primary_key.columns)
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    ids = list(session.connection().execute(query).scalars().all())
+    if orm_execute_state.is_delete:
+        _record_deletes(session, table.name, ids)
+    else:
+        _record(session, table.name, ids, UPDATED)
+
+
+@event.listens_for(Session, "before_commit")
+def _persist_versions(session):
+    # Las versiones compartidas se incrementan dentro de la transacción que se confirma
+    session.flush()
+    pending = session.info.get("pending_changes")
+    if pending:
+        connection = session.connection()
+        bump_versions(connection, {table for table, _ in pending})
+        _log_changes(connection, pending)
+
+
+def _log_changes(connection, pending: Dict[Tuple[str, Optional[int]], str]):
+    # Cambios de las tablas publicadas, con la versión que acaban de alcanzar, para los demás procesos
+    logged = [(table, row_id, op) for (table, row_id), op in pending.items() if table in LOGGED_TABLES]
+    if not logged:
+        return
+    tables = list(dict.fromkeys(table for table, _, _ in logged))
+    versions = dict(zip(tables, db_version(connection, tables)))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    connection.execute(insert(ChangeLogEntry.__table__), [
+        {"entity": table, "entity_id": row_id, "op": op, "version": versions[table], "created_at": now}
+        for table, row_id, op in logged
+    ])
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    pending = session.info.pop("pending_changes", None)
+    if not pending:
+        return
+    versions = mark_changed(list(dict.fromkeys(table for table, _ in pending)))
+    changes = [
+        {"entity": table, "id": row_id, "op": op, "version": versions[table]}
+        for (table, row_id), op in pending.items()
+    ]
+    for listener in _listeners:
+        try:
+            listener(changes)
+        except Exception:
+            # El commit ya se ha hecho: un fallo al notificar no debe llegar a la operación que lo hizo
+            logger.exception("Error al notificar los cambios confirmados")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop("pending_changes", None)
@@ -0,0 +1,201 @@
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional
+    zstandard = None
+
+'''
+Middleware de compresión de respuestas. Comprime con gzip (y con brotli o zstd si las librerías están
+instaladas) las respuestas que superan un tamaño mínimo, eligiendo la codificación según la cabecera
+Accept-Encoding del cliente. Las respuestas en streaming se comprimen bloque a bloque a medida que se envían.
+
+Configuración por variables de entorno:
+    COMPRESSION_MINIMUM_SIZE: tamaño mínimo en bytes para comprimir (por defecto 1024).
+    COMPRESSION_LEVEL: nivel de compresión de gzip (por defecto 6).
+    COMPRESSION_ENCODINGS: codificaciones permitidas por orden de preferencia (por defecto "br,zstd,gzip").
+'''
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        # wbits = 16 + MAX_WBITS genera cabecera y cola en formato gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # Z_SYNC_FLUSH permite que el cliente descomprima cada bloque sin esperar al final
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        # brotli usa una escala de calidad de 0 a 11
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+# Codificaciones soportadas según las librerías disponibles
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    # Devuelve un diccionario {codificación: q} a partir de la cabecera Accept-Encoding
+    accepted = {}
+    for item in value.split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, raw = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def select_encoding(accept_encoding: str, preferred: List[str]) -> Optional[str]:
+    # Elige la codificación con mayor q; en caso de empate manda el orden de preferencia del servidor
+    accepted = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in preferred:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, level: int = 6,
+                 encodings: Optional[List[str]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.encodings = [e for e in (encodings or ["br", "zstd", "gzip"]) if e in ENCODERS]
+
+    @classmethod
+    def options_from_env(cls) -> dict:
+        return {
+            "minimum_size": int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+            "level": int(os.getenv("COMPRESSION_LEVEL", "6")),
+            "encodings": [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(",") if e.strip()],
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+            if encoding is not None:
+                responder = CompressionResponder(self.app, ENCODERS[encoding](self.level), self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app: ASGIApp, encoder, minimum_size: int):
+        self.app = app
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.send = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Retrasar la cabecera hasta saber si la respuesta se comprime
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            # Los eventos SSE se envían tal cual para que lleguen al cliente sin esperar a llenar un bloque
+            self.passthrough = ("content-encoding" in headers
+                                or headers.get("content-type", "").startswith("text/event-stream"))
+            return
+
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        if not self.started:
+            self.started = True
+            if not more_body and len(body) < self.minimum_size:
+                # Respuesta pequeña: no compensa comprimirla
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                # En streaming no se conoce la longitud final
+                del headers["Content-Length"]
+                message["body"] = self.encoder.compress(body)
+            else:
+                message["body"] = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        # Resto de bloques de una respuesta en streaming
+        message["body"] = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        await self.send(message)
@@ -0,0 +1,8 @@
+from tracing import instrument_module
+from crud import (students_crud, inscriptions_crud, instruments_crud, levels_crud, packs_crud, teacher_crud,
+                  teacher_instruments_crud, pack_instruments_crud)
+
+# Spans para las funciones CRUD de las peticiones trazadas (ver tracing.py)
+for _module in (students_crud, inscriptions_crud, instruments_crud, levels_crud, packs_crud, teacher_crud,
+                teacher_instruments_crud, pack_instruments_crud):
+    instrument_module(_module)
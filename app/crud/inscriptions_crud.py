@@ -1,13 +1,15 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, select, func
-from models import Student, Inscription, Level, Instrument, Pack, PacksInstruments
+from sqlalchemy import and_, or_, select, func
+from models import Student, Inscription, Level, Instrument, Pack, PacksInstruments, name_search_filter
 from schemas import StudentCreate, InscriptionCreate
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 import logging
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from fastapi import HTTPException
+from outbox import record_event
+from metrics import FEE_REPORT_DURATION
 import logging
 
 '''
@@ -19,6 +21,15 @@ Se calcula tarifas por alumno y por inscripción y se genera un informe de factu
 # Obtener el logger configurado
 logger = logging.getLogger("music_app")
 
+# Datos de una inscripción que se publican en el outbox
+def inscription_payload(inscription: Inscription) -> dict:
+    return {
+        "id": inscription.id,
+        "student_id": inscription.student_id,
+        "level_id": inscription.level_id,
+        "registration_date": inscription.registration_date,
+    }
+
 # Crear una nueva inscripción
 def create_inscription(db: Session, inscription: InscriptionCreate):
     # Comprobar si exite el estudiante
@@ -50,6 +61,8 @@ def create_inscription(db: Session, inscription: InscriptionCreate):
     
     try:
         db.add(db_inscription)
+        db.flush()
+        record_event(db, "inscription.created", "inscription", db_inscription.id, inscription_payload(db_inscription))
         db.commit()
         db.refresh(db_inscription)
         logger.info("Inscripción creada con éxito")
@@ -60,11 +73,11 @@ def create_inscription(db: Session, inscription: InscriptionCreate):
         raise HTTPException(status_code=400, detail="Error de integridad al crear la inscripción")
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear la inscripción: {str(e)}")
+        logger.error("Error de base de datos al crear la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear la inscripción: {str(e)}")
+        logger.error("Error inesperado al crear la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Consultar Inscripción por ID
@@ -80,10 +93,10 @@ def get_inscription(db: Session, inscription_id: int):
         return result
 
     except SQLAlchemyError as e:
-        logger.error(f"Error al obtener la inscripción: {str(e)}")
+        logger.error("Error al obtener la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener la inscripción: {str(e)}")
+        logger.error("Error inesperado al obtener la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Consultar todas las inscripciones
@@ -113,14 +126,14 @@ def get_inscriptions(db: Session):
                 'registration_date': inscription.registration_date.strftime('%Y-%m-%d'),
                 'instrument_price': float(instrument.price)
             })
-        logger.info(f"Recuperadas con éxito {len(inscriptions)} inscripciones")
+        logger.info("Recuperadas con éxito %s inscripciones", len(inscriptions))
         return inscriptions
 
     except SQLAlchemyError as e:
-        logger.error(f"Error al obtener inscripciones: {str(e)}")
+        logger.error("Error al obtener inscripciones: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener inscripciones: {str(e)}")
+        logger.error("Error inesperado al obtener inscripciones: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Consultar inscripciones por id de estudiante
@@ -162,12 +175,12 @@ def get_inscriptions_by_student(db: Session, student_id: int):
         return inscriptions
 
     except SQLAlchemyError as e:
-        logger.error(f"Error al obtener inscripciones para el estudiante: {str(e)}")
+        logger.error("Error al obtener inscripciones para el estudiante: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except HTTPException:
         raise  # Re-raise HTTPException to maintain status code and detail
     except Exception as e:
-        logger.error(f"Error inesperado al obtener inscripciones: {str(e)}")
+        logger.error("Error inesperado al obtener inscripciones: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Actualizar una inscripción
@@ -204,6 +217,7 @@ def update_inscription(db: Session, inscription_id: int, inscription_data: dict)
         for key, value in inscription_data.items():
             setattr(db_inscription, key, value)
 
+        record_event(db, "inscription.updated", "inscription", db_inscription.id, inscription_payload(db_inscription))
         db.commit()
         db.refresh(db_inscription)
         logger.info("Inscripción actualizada con éxito")
@@ -211,11 +225,11 @@ def update_inscription(db: Session, inscription_id: int, inscription_data: dict)
 
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar la inscripción: {str(e)}")
+        logger.error("Error de base de datos al actualizar la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar la inscripción: {str(e)}")
+        logger.error("Error inesperado al actualizar la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Eliminar una inscripción
@@ -228,20 +242,83 @@ def delete_inscription(db: Session, inscription_id: int) -> bool:
             raise HTTPException(status_code=404, detail="Inscripción no encontrada")
 
         db.delete(db_inscription)
+        record_event(db, "inscription.deleted", "inscription", db_inscription.id, inscription_payload(db_inscription))
         db.commit()
         logger.info("Inscripción eliminada con éxito")
         return True
     
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar la inscripción: {str(e)}")
+        logger.error("Error de base de datos al eliminar la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar la inscripción: {str(e)}")
+        logger.error("Error inesperado al eliminar la inscripción: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
+# Recuperar, con una sola consulta, el primer pack de cada instrumento
+def get_packs_by_instrument(db: Session, instrument_ids) -> Dict[int, Pack]:
+    packs = {}
+    if not instrument_ids:
+        return packs
+    rows = (
+        db.query(PacksInstruments.instrument_id, Pack)
+        .join(Pack, PacksInstruments.packs_id == Pack.id)
+        .filter(PacksInstruments.instrument_id.in_(set(instrument_ids)))
+        .order_by(PacksInstruments.id)
+    )
+    for instrument_id, pack in rows:
+        packs.setdefault(instrument_id, pack)
+    return packs
+
+# Calcular el desglose de la tarifa a partir de datos ya cargados (sin consultas adicionales)
+def compute_fee_breakdown(student: Student, instruments: List[Instrument], packs_by_instrument: Dict[int, Pack]) -> Dict:
+    # Se agrupan las inscripciones por pack; dentro de cada pack la segunda clase más cara
+    # tiene el descuento 1 y las siguientes el descuento 2
+    pack_inscriptions = {}
+    for position, instrument in enumerate(instruments):
+        pack = packs_by_instrument.get(instrument.id)
+        pack_id = pack.id if pack else None
+        pack_inscriptions.setdefault(pack_id, []).append((position, instrument, pack))
+
+    subtotal = Decimal('0.00')
+    lines = [None] * len(instruments)
+    for pack_id, insc_list in pack_inscriptions.items():
+        insc_list.sort(key=lambda x: x[1].price, reverse=True)
+
+        for i, (position, instrument, pack) in enumerate(insc_list):
+            base_price = Decimal(instrument.price)
+            price = base_price
+            discount = Decimal('0')
+
+            if pack:
+                if i == 1:
+                    discount = Decimal(pack.discount_1)
+                elif i > 1:
+                    discount = Decimal(pack.discount_2)
+                price -= price * discount / 100
+
+            subtotal += price
+            lines[position] = {
+                'instrument_id': instrument.id,
+                'instrument_name': instrument.name,
+                'base_price': float(base_price),
+                'pack': pack.pack if pack else None,
+                'discount': float(discount),
+                'price': float(price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)),
+            }
+
+    # Aplicar descuento familiar
+    total_fee = subtotal * Decimal('0.90') if student.family_id else subtotal
+
+    return {
+        'lines': lines,
+        'subtotal': subtotal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+        'family_discount': bool(student.family_id),
+        'total_fee': total_fee.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+    }
+
 # Calcular tarifas de estudiantes
 def calculate_student_fees(db: Session, student_id: int) -> Decimal:
     try:
@@ -250,63 +327,105 @@ def calculate_student_fees(db: Session, student_id: int) -> Decimal:
         if not student:
             logger.warning("Estudiante no encontrado")
             return None
-            
-        # Recupera las inscripciones del estudiante
-        inscriptions = db.query(Inscription).filter(Inscription.student_id == student_id).all()
-        if not inscriptions:
+
+        # Recupera los instrumentos de las inscripciones del estudiante con una sola consulta, una fila por
+        # inscripción: dos niveles del mismo instrumento se cobran dos veces
+        rows = (
+            db.query(Inscription.id, Instrument)
+            .join(Level, Inscription.level_id == Level.id)
+            .join(Instrument, Level.instruments_id == Instrument.id)
+            .filter(Inscription.student_id == student_id)
+            .order_by(Inscription.id)
+            .all()
+        )
+        instruments = [instrument for _, instrument in rows]
+        if not instruments:
             logger.info("No se encontraron inscripciones para el estudiante")
             return Decimal('0.00')
-        #se inicializan dos variables, una para recoger el precio y otra para agrupar inscripciones por packs
-        total_fee = Decimal('0.00')
-        pack_inscriptions = {}
-
-        # recoge el instrumento por cada inscripción. Para ello hay que llegar al precio, que está en la tabla instrumento
-        for inscription in inscriptions:
-            instrument = inscription.level.instrument
-            if not instrument:
-                logger.warning("Instrumento no encontrado para la inscripción")
-                raise HTTPException(status_code=404, detail="Instrumento no encontrado")
-        # recoge el pack al que pertenece cada instrumento        
-            pack = db.query(Pack).join(PacksInstruments).filter(PacksInstruments.instrument_id == instrument.id).first()
-            pack_id = pack.id if pack else None
 
-            if pack_id not in pack_inscriptions:
-                pack_inscriptions[pack_id] = []
-            pack_inscriptions[pack_id].append((instrument, pack))
+        # recoge el pack al que pertenece cada instrumento
+        packs_by_instrument = get_packs_by_instrument(db, [instrument.id for instrument in instruments])
 
-        for pack_id, insc_list in pack_inscriptions.items():
-            insc_list.sort(key=lambda x: x[0].price, reverse=True)
+        final_fee = compute_fee_breakdown(student, instruments, packs_by_instrument)['total_fee']
+        logger.info("Tarifas calculadas con éxito")        
+        return final_fee
 
-            for i, (instrument, pack) in enumerate(insc_list):
-                price = Decimal(instrument.price)
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al calcular las tarifas: %s", e)
+        raise HTTPException(status_code=500, detail="Error en la base de datos")
 
-                if pack:
-                    if i == 1:
-                        discount = Decimal(pack.discount_1)
-                        price -= price * discount / 100
-                    elif i > 1:
-                        discount = Decimal(pack.discount_2)
-                        price -= price * discount / 100
+    except Exception as e:
+        logger.error("Error inesperado al calcular las tarifas: %s", e)
+        raise HTTPException(status_code=500, detail="Error inesperado")
 
-                total_fee += price
+# Panel de un estudiante: perfil, inscripciones, desglose de la tarifa y packs aplicables
+def get_student_dashboard(db: Session, student_id: int):
+    try:
+        # 1ª consulta: el estudiante
+        student = db.scalars(select(Student).where(Student.id == student_id)).first()
+        if student is None:
+            logger.warning("Estudiante no encontrado")
+            return None
 
-        # Aplicar descuento familiar
-        if student.family_id:
-            total_fee *= Decimal('0.90')
+        # 2ª consulta: inscripciones con su nivel e instrumento
+        rows = (
+            db.query(Inscription, Level, Instrument)
+            .join(Level, Inscription.level_id == Level.id)
+            .join(Instrument, Level.instruments_id == Instrument.id)
+            .filter(Inscription.student_id == student_id)
+            .order_by(Inscription.registration_date.desc())
+            .all()
+        )
 
-        final_fee = total_fee.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        logger.info("Tarifas calculadas con éxito")        
-        return final_fee
+        # 3ª consulta: packs que incluyen alguno de los instrumentos del estudiante
+        instrument_ids = {instrument.id for _, _, instrument in rows}
+        packs = []
+        packs_by_instrument = {}
+        if instrument_ids:
+            pack_rows = (
+                db.query(PacksInstruments.instrument_id, Pack)
+                .join(Pack, PacksInstruments.packs_id == Pack.id)
+                .filter(PacksInstruments.instrument_id.in_(instrument_ids))
+                .order_by(PacksInstruments.id)
+            )
+            for instrument_id, pack in pack_rows:
+                packs_by_instrument.setdefault(instrument_id, pack)
+                if pack not in packs:
+                    packs.append(pack)
+
+        inscriptions = [{
+            'inscription_id': inscription.id,
+            'student_id': student.id,
+            'student_name': f"{student.first_name} {student.last_name}",
+            'instrument_name': instrument.name,
+            'level': level.level,
+            'registration_date': inscription.registration_date.strftime('%Y-%m-%d'),
+            'instrument_price': float(instrument.price)
+        } for inscription, level, instrument in rows]
+
+        fee = compute_fee_breakdown(student, [instrument for _, _, instrument in rows], packs_by_instrument)
+        for line, (inscription, level, _) in zip(fee['lines'], rows):
+            line['inscription_id'] = inscription.id
+            line['level'] = level.level
+
+        logger.info("Panel del estudiante recuperado con éxito")
+        return {
+            'student': student,
+            'inscriptions': inscriptions,
+            'fee': fee,
+            'packs': packs,
+        }
 
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al calcular las tarifas: {str(e)}")
+        logger.error("Error de base de datos al obtener el panel del estudiante: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
 
     except Exception as e:
-        logger.error(f"Error inesperado al calcular las tarifas: {str(e)}")
+        logger.error("Error inesperado al obtener el panel del estudiante: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Generar informe de tarifas
+@FEE_REPORT_DURATION.timed
 def generate_fee_report(db: Session):
     try:
         student_query = (
@@ -323,7 +442,7 @@ def generate_fee_report(db: Session):
             try:
                 fee_value = calculate_student_fees(db, student.id)
             except HTTPException as e:
-                logger.warning("Omitiendo estudiante debido a error: {e.detail}")
+                logger.warning("Omitiendo estudiante debido a error: %s", e.detail)
                 continue  # Skip this student if there's an issue calculating fees
             
             report.append({
@@ -338,9 +457,187 @@ def generate_fee_report(db: Session):
         return report
 
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al generar el informe de tarifas: {str(e)}")
+        logger.error("Error de base de datos al generar el informe de tarifas: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
 
     except Exception as e:
-        logger.error(f"Error inesperado al generar el informe de tarifas: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error inesperado")
\ No newline at end of file
+        logger.error("Error inesperado al generar el informe de tarifas: %s", e)
+        raise HTTPException(status_code=500, detail="Error inesperado")
+
+# Vistas paginadas por keyset (GUI). Cada página se pide con el cursor (valor de la columna de orden, id) de la
+# última fila de la página anterior; el orden, los filtros y el límite se aplican en SQL. Con los órdenes que
+# tienen índice (fecha o id de la inscripción, apellido o id del estudiante en el informe de tarifas) la
+# consulta salta directamente a la siguiente página en el índice en lugar de recorrer las anteriores como
+# OFFSET. Los demás órdenes (instrumento, nivel, número de inscripciones) son columnas de otra tabla o
+# calculadas: cada página ordena todas las filas que cumplen los filtros, así que su coste crece con la tabla.
+PAGE_SIZE = 50
+
+# Columnas por las que se pueden ordenar las inscripciones
+INSCRIPTION_SORTS = {
+    "registration_date": Inscription.registration_date,
+    "student": Student.last_name,
+    "instrument": Instrument.name,
+    "level": Level.level,
+    "inscription_id": Inscription.id,
+}
+
+def _parse_cursor(column, cursor: Optional[Tuple]) -> Optional[Tuple]:
+    # Los cursores recibidos por la API llegan como texto: el valor se convierte al tipo de la columna de orden
+    if cursor is None:
+        return None
+    value, last_id = cursor
+    python_type = column.type.python_type
+    try:
+        if not isinstance(value, python_type):
+            value = date.fromisoformat(value) if python_type is date else python_type(value)
+        return value, int(last_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="Cursor de paginación no válido")
+
+def _after_cursor(column, id_column, cursor: Tuple, descending: bool):
+    # Filas posteriores al cursor (valor, id) en el orden (columna, id)
+    value, last_id = cursor
+    if descending:
+        return or_(column < value, and_(column == value, id_column < last_id))
+    return or_(column > value, and_(column == value, id_column > last_id))
+
+def _ordered_page(stmt, column, id_column, descending: bool, after: Optional[Tuple], limit: int):
+    if after is not None:
+        stmt = stmt.where(_after_cursor(column, id_column, after, descending))
+    if descending:
+        stmt = stmt.order_by(column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), id_column.asc())
+    # Se pide una fila de más para saber si hay otra página
+    return stmt.limit(limit + 1)
+
+def _student_filter(stmt, student: Optional[str]):
+    # Mismo criterio que la búsqueda de estudiantes (comienzo de cada palabra del nombre)
+    return stmt.where(*name_search_filter(student))
+
+# Página de inscripciones con filtros por estudiante, instrumento, nivel y fechas
+def get_inscriptions_page(db: Session, sort: str = "registration_date", descending: bool = True,
+                          student: Optional[str] = None, instrument: Optional[str] = None, level: Optional[str] = None,
+                          date_from: Optional[date] = None, date_to: Optional[date] = None,
+                          after: Optional[Tuple] = None, limit: int = PAGE_SIZE) -> Dict:
+    if sort not in INSCRIPTION_SORTS:
+        raise HTTPException(status_code=400, detail=f"Orden no válido: {sort}")
+    column = INSCRIPTION_SORTS[sort]
+    after = _parse_cursor(column, after)
+    try:
+        stmt = (
+            select(Inscription, Student, Level, Instrument, column.label("sort_value"))
+            .join(Student, Inscription.student_id == Student.id)
+            .join(Level, Inscription.level_id == Level.id)
+            .join(Instrument, Level.instruments_id == Instrument.id)
+        )
+        stmt = _student_filter(stmt, student)
+        if instrument:
+            stmt = stmt.where(Instrument.name.ilike(f"%{instrument}%"))
+        if level:
+            stmt = stmt.where(Level.level.ilike(f"%{level}%"))
+        if date_from:
+            stmt = stmt.where(Inscription.registration_date >= date_from)
+        if date_to:
+            stmt = stmt.where(Inscription.registration_date <= date_to)
+        rows = db.execute(_ordered_page(stmt, column, Inscription.id, descending, after, limit)).all()
+
+        items = [{
+            'inscription_id': inscription.id,
+            'student_id': student_row.id,
+            'student_name': f"{student_row.first_name} {student_row.last_name}",
+            'instrument_name': instrument_row.name,
+            'level': level_row.level,
+            'registration_date': inscription.registration_date.strftime('%Y-%m-%d'),
+            'instrument_price': float(instrument_row.price)
+        } for inscription, student_row, level_row, instrument_row, _ in rows[:limit]]
+        next_cursor = (rows[limit - 1].sort_value, rows[limit - 1][0].id) if len(rows) > limit else None
+        logger.info("Recuperada una página de %s inscripciones", len(items))
+        return {"items": items, "next_cursor": next_cursor}
+
+    except SQLAlchemyError as e:
+        logger.error("Error al obtener la página de inscripciones: %s", e)
+        raise HTTPException(status_code=500, detail="Error en la base de datos")
+    except Exception as e:
+        logger.error("Error inesperado al obtener la página de inscripciones: %s", e)
+        raise HTTPException(status_code=500, detail="Error inesperado")
+
+# Número de inscripciones por estudiante, para ordenar y filtrar el informe de tarifas en SQL
+def _inscription_counts():
+    return (
+        select(Inscription.student_id, func.count(Inscription.id).label("inscription_count"))
+        .group_by(Inscription.student_id)
+        .subquery()
+    )
+
+# Columnas por las que se puede ordenar el informe de tarifas (inscription_count se calcula en la consulta)
+FEE_REPORT_SORTS = {"student": Student.last_name, "student_id": Student.id, "inscription_count": None}
+
+# Página del informe de tarifas: las tarifas se calculan solo para los estudiantes de la página, con dos consultas
+def get_fee_report_page(db: Session, sort: str = "student", descending: bool = False, student: Optional[str] = None,
+                        family: Optional[bool] = None, min_inscriptions: int = 0,
+                        after: Optional[Tuple] = None, limit: int = PAGE_SIZE) -> Dict:
+    if sort not in FEE_REPORT_SORTS:
+        raise HTTPException(status_code=400, detail=f"Orden no válido: {sort}")
+    # Contar las inscripciones de todos los estudiantes solo hace falta para ordenar o filtrar por ese número;
+    # si no, se cuentan solo las de los estudiantes de la página (índice por student_id)
+    aggregate = sort == "inscription_count" or bool(min_inscriptions)
+    if aggregate:
+        counts = _inscription_counts()
+        inscription_count = func.coalesce(counts.c.inscription_count, 0)
+    else:
+        inscription_count = (
+            select(func.count(Inscription.id)).where(Inscription.student_id == Student.id).scalar_subquery()
+        )
+    column = inscription_count if sort == "inscription_count" else FEE_REPORT_SORTS[sort]
+    after = _parse_cursor(column, after)
+    try:
+        stmt = select(Student, inscription_count.label("inscription_count"), column.label("sort_value"))
+        if aggregate:
+            stmt = stmt.outerjoin(counts, counts.c.student_id == Student.id)
+        stmt = _student_filter(stmt, student)
+        if family is not None:
+            stmt = stmt.where(Student.family_id.is_(True) if family else or_(Student.family_id.is_(False), Student.family_id.is_(None)))
+        if min_inscriptions:
+            stmt = stmt.where(inscription_count >= min_inscriptions)
+        rows = db.execute(_ordered_page(stmt, column, Student.id, descending, after, limit)).all()
+        page = rows[:limit]
+
+        # Instrumentos de las inscripciones y packs de todos los estudiantes de la página
+        student_ids = [row[0].id for row in page]
+        instruments_by_student: Dict[int, List[Instrument]] = {}
+        if student_ids:
+            instrument_rows = (
+                db.query(Inscription.id, Inscription.student_id, Instrument)
+                .join(Level, Inscription.level_id == Level.id)
+                .join(Instrument, Level.instruments_id == Instrument.id)
+                .filter(Inscription.student_id.in_(student_ids))
+                .order_by(Inscription.id)
+            )
+            # Con el id de la inscripción cada fila es distinta: dos niveles del mismo instrumento se cobran dos veces
+            for _, student_id, instrument_row in instrument_rows:
+                instruments_by_student.setdefault(student_id, []).append(instrument_row)
+        packs_by_instrument = get_packs_by_instrument(
+            db, [i.id for instruments in instruments_by_student.values() for i in instruments])
+
+        items = []
+        for student_row, count, _ in page:
+            instruments = instruments_by_student.get(student_row.id, [])
+            fee = compute_fee_breakdown(student_row, instruments, packs_by_instrument)['total_fee'] if instruments else Decimal('0.00')
+            items.append({
+                'student_id': student_row.id,
+                'first_name': student_row.first_name,
+                'last_name': student_row.last_name,
+                'total_fee': float(fee),
+                'inscription_count': count,
+                'family_discount': 'Sí' if student_row.family_id else 'No'
+            })
+        next_cursor = (rows[limit - 1].sort_value, rows[limit - 1][0].id) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al obtener la página del informe de tarifas: %s", e)
+        raise HTTPException(status_code=500, detail="Error en la base de datos")
+    except Exception as e:
+        logger.error("Error inesperado al obtener la página del informe de tarifas: %s", e)
+        raise HTTPException(status_code=500, detail="Error inesperado")
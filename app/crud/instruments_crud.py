@@ -1,9 +1,11 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import delete
 from decimal import Decimal
 from typing import List, Optional
 from models import Instrument, Pack, Teacher
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from fastapi import HTTPException
+from outbox import record_event
 import logging
 
 
@@ -20,7 +22,7 @@ def create_instrument(db: Session, name: str, price: Decimal) -> Instrument:
     # Comprobar si el instrumento ya existe
     existing_instrument = db.query(Instrument).filter((Instrument.name) == (name).lower()).first()
     if existing_instrument:
-        logger.warning(f"Intento de crear un instrumento que ya existe: {name}")
+        logger.warning("Intento de crear un instrumento que ya existe: %s", name)
         raise HTTPException(status_code=400, detail=f"Ya existe un instrumento con el nombre '{name}'")
 
     # Crear el nuevo instrumento
@@ -35,15 +37,15 @@ def create_instrument(db: Session, name: str, price: Decimal) -> Instrument:
     except IntegrityError:
         # Si hay un error de integridad (por ejemplo, nombre duplicado), revertir los cambios
         db.rollback()
-        logger.error(f"Error de integridad al crear el instrumento: {name}")
+        logger.error("Error de integridad al crear el instrumento: %s", name)
         raise HTTPException(status_code=400, detail=f"Ya existe un instrumento con el nombre '{name}'")
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear el instrumento: {str(e)}")
+        logger.error("Error de base de datos al crear el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear el instrumento: {str(e)}")
+        logger.error("Error inesperado al crear el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Consultar instrumento por ID
@@ -52,10 +54,10 @@ def get_instrument(db: Session, instrument_id: int) -> Optional[Instrument]:
         logger.info("Instrumento recuperado con éxito")
         return db.query(Instrument).filter(Instrument.id == instrument_id).first()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener el instrumento: {str(e)}")
+        logger.error("Error de base de datos al obtener el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener el instrumento: {str(e)}")
+        logger.error("Error inesperado al obtener el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Consultar todos los instrumentos
@@ -64,10 +66,23 @@ def get_all_instruments(db: Session) -> List[Instrument]:
         logger.info("Todos los instrumentos recuperados con éxito")
         return db.query(Instrument).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener todos los instrumentos: {str(e)}")
+        logger.error("Error de base de datos al obtener todos los instrumentos: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener todos los instrumentos: {str(e)}")
+        logger.error("Error inesperado al obtener todos los instrumentos: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Consultar varios instrumentos por ID con una única consulta IN
+def get_instruments_by_ids(db: Session, instrument_ids: List[int]) -> List[Instrument]:
+    try:
+        instruments = db.query(Instrument).filter(Instrument.id.in_(instrument_ids)).all()
+        logger.info("Recuperados %s instrumentos por ID", len(instruments))
+        return instruments
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al obtener instrumentos por ID: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        logger.error("Error inesperado al obtener instrumentos por ID: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Actualizar un instrumento
@@ -77,7 +92,9 @@ def update_instrument(db: Session, instrument_id: int, name: Optional[str] = Non
         if instrument:
             if name:
                 instrument.name = name
-            if price is not None:
+            if price is not None and price != instrument.price:
+                record_event(db, "instrument.price_changed", "instrument", instrument.id,
+                             {"id": instrument.id, "price": price, "previous_price": instrument.price})
                 instrument.price = price
             
             try:
@@ -87,48 +104,53 @@ def update_instrument(db: Session, instrument_id: int, name: Optional[str] = Non
                 return instrument
             except IntegrityError:
                 db.rollback()
-                logger.error(f"Error de integridad al actualizar el instrumento: {name}")
+                logger.error("Error de integridad al actualizar el instrumento: %s", name)
                 raise HTTPException(status_code=400, detail=f"Ya existe un instrumento con el nombre '{name}'")
         return None
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar el instrumento: {str(e)}")
+        logger.error("Error de base de datos al actualizar el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar el instrumento: {str(e)}")
+        logger.error("Error inesperado al actualizar el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Eliminar un instrumento
 def delete_instrument(db: Session, instrument_id: int) -> bool:
     try:
-        instrument = get_instrument(db, instrument_id)
-        if instrument:
-            db.delete(instrument)
-            db.commit()
-            logger.info("Instrumento eliminado con éxito")
-            return True
-        logger.info("Instrumento no encontrado para eliminación")
-        return False
+        # Una sola sentencia: la base de datos borra las asociaciones con packs y profesores (ON DELETE CASCADE)
+        # y rechaza el borrado si hay niveles del instrumento (ON DELETE RESTRICT)
+        result = db.execute(delete(Instrument).where(Instrument.id == instrument_id))
+        if result.rowcount == 0:
+            logger.info("Instrumento no encontrado para eliminación")
+            return False
+        db.commit()
+        logger.info("Instrumento eliminado con éxito")
+        return True
+    except IntegrityError as e:
+        db.rollback()
+        logger.error("El instrumento %s tiene niveles asociados: %s", instrument_id, e)
+        raise HTTPException(status_code=400, detail="No se puede eliminar el instrumento porque está asociado a uno o más niveles")
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar el instrumento: {str(e)}")
+        logger.error("Error de base de datos al eliminar el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar el instrumento: {str(e)}")
+        logger.error("Error inesperado al eliminar el instrumento: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Consultar instrumentos por rango de precios
 def get_instruments_by_price_range(db: Session, min_price: Decimal, max_price: Decimal) -> List[Instrument]:
     try:
-        logger.info(f"Instrumentos en el rango de precios {min_price} - {max_price} recuperados con éxito")
+        logger.info("Instrumentos en el rango de precios %s - %s recuperados con éxito", min_price, max_price)
         return db.query(Instrument).filter(Instrument.price >= min_price, Instrument.price <= max_price).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener instrumentos por rango de precios {min_price} - {max_price}: {str(e)}")
+        logger.error("Error de base de datos al obtener instrumentos por rango de precios %s - %s: %s", min_price, max_price, e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener instrumentos por rango de precios {min_price} - {max_price}: {str(e)}")
+        logger.error("Error inesperado al obtener instrumentos por rango de precios %s - %s: %s", min_price, max_price, e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Consultar instrumentos por profesor
@@ -137,10 +159,10 @@ def get_instruments_by_teacher(db: Session, teacher_id: int) -> List[Instrument]
         logger.info("Instrumentos por profesor recuperados con éxito")
         return db.query(Instrument).join(Instrument.teachers).filter(Teacher.id == teacher_id).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener instrumentos por profesor: {str(e)}")
+        logger.error("Error de base de datos al obtener instrumentos por profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener instrumentos por profesor: {str(e)}")
+        logger.error("Error inesperado al obtener instrumentos por profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Consultar instrumentos por pack
@@ -149,8 +171,8 @@ def get_instruments_by_pack(db: Session, pack_id: int) -> List[Instrument]:
         logger.info("Instrumentos asociados al pack recuperados con éxito")
         return db.query(Instrument).join(Instrument.packs).filter(Pack.id == pack_id).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener instrumentos por pack: {str(e)}")
+        logger.error("Error de base de datos al obtener instrumentos por pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener instrumentos por pack: {str(e)}")
+        logger.error("Error inesperado al obtener instrumentos por pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
\ No newline at end of file
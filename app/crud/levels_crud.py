@@ -29,11 +29,11 @@ def get_level(db: Session, level_id: int) -> Optional[Level]:
         return result
     except SQLAlchemyError as e:
         # Manejar errores de base de datos, registrar el error y lanzar una excepción HTTP 500
-        logger.error(f"Error de base de datos al obtener el nivel: {str(e)}")
+        logger.error("Error de base de datos al obtener el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
         # Manejar otros errores, registrar el error y lanzar una excepción HTTP 500
-        logger.error(f"Error inesperado al obtener el nivel: {str(e)}")
+        logger.error("Error inesperado al obtener el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Listar todos los niveles
@@ -43,10 +43,24 @@ def get_levels(db: Session) -> List[Level]:
         logger.info("Todos los niveles recuperados con éxito")
         return db.scalars(stmt).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener los niveles: {str(e)}")
+        logger.error("Error de base de datos al obtener los niveles: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener los niveles: {str(e)}")
+        logger.error("Error inesperado al obtener los niveles: %s", e)
+        raise HTTPException(status_code=500, detail="Error inesperado")
+
+# Consultar varios niveles por ID con una única consulta IN
+def get_levels_by_ids(db: Session, level_ids: List[int]) -> List[Level]:
+    try:
+        stmt = select(Level).where(Level.id.in_(level_ids))
+        levels = db.scalars(stmt).all()
+        logger.info("Recuperados %s niveles por ID", len(levels))
+        return levels
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al obtener niveles por ID: %s", e)
+        raise HTTPException(status_code=500, detail="Error de base de datos")
+    except Exception as e:
+        logger.error("Error inesperado al obtener niveles por ID: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Crear un nuevo nivel
@@ -80,11 +94,11 @@ def create_level(db: Session, instruments_id: int, level: str) -> Optional[Level
         return new_level
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear el nivel: {str(e)}")
+        logger.error("Error de base de datos al crear el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear el nivel: {str(e)}")
+        logger.error("Error inesperado al crear el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Actualizar un nivel existente
@@ -114,11 +128,11 @@ def update_level(db: Session, level_id: int, **kwargs) -> Optional[Level]:
         return level
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar el nivel: {str(e)}")
+        logger.error("Error de base de datos al actualizar el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar el nivel: {str(e)}")
+        logger.error("Error inesperado al actualizar el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Eliminar un nivel existente
@@ -131,13 +145,13 @@ def delete_level(db: Session, level_id: int) -> bool:
 
         db.delete(level)
         db.commit()
-        logger.info(f"Nivel con ID {level_id} eliminado con éxito")
+        logger.info("Nivel con ID %s eliminado con éxito", level_id)
         return True
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar el nivel: {str(e)}")
+        logger.error("Error de base de datos al eliminar el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar el nivel: {str(e)}")
+        logger.error("Error inesperado al eliminar el nivel: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
\ No newline at end of file
@@ -5,6 +5,7 @@ from fastapi import HTTPException
 import logging
 
 from models import PacksInstruments, Pack, Instrument
+from outbox import record_event
 
 
 '''
@@ -26,10 +27,10 @@ def get_pack_instruments(db: Session, packs_instruments_id: int):
             raise HTTPException(status_code=404, detail="Pack de instrumentos no encontrado")
         return result
     except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos al obtener pack de instrumentos: {str(e)}")
+        logger.error("Error de base de datos al obtener pack de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error al obtener pack de instrumentos")
     except Exception as e:
-        logging.error(f"Error inesperado al obtener pack de instrumentos: {str(e)}")
+        logger.error("Error inesperado al obtener pack de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado al obtener pack de instrumentos")
 
 # Listar todos los packs de instrumentos
@@ -40,10 +41,10 @@ def get_packs_instruments(db: Session):
         logger.info("Todos packs de instrumentos recuperados con éxito")        
         return result
     except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos al obtener packs de instrumentos: {str(e)}")
+        logger.error("Error de base de datos al obtener packs de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error al obtener packs de instrumentos")
     except Exception as e:
-        logging.error(f"Error inesperado al obtener packs de instrumentos: {str(e)}")
+        logger.error("Error inesperado al obtener packs de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado al obtener packs de instrumentos")
 
 # Crear un nuevo paquete de instrumentos
@@ -77,20 +78,23 @@ def create_packs_instruments(db: Session, instrument_id: int, packs_id: int):
             packs_id=packs_id
         )
         db.add(new_pack_instruments)
+        db.flush()
+        record_event(db, "pack.instruments_changed", "pack", packs_id,
+                     {"pack_id": packs_id, "instrument_id": instrument_id, "change": "added"})
         db.commit()
         db.refresh(new_pack_instruments)  # Refrescar la instancia para obtener los datos actualizados de la base de datos
         logger.info("Combinación de instrumento y paquete creada con éxito")
         return new_pack_instruments
     except SQLAlchemyError as e:
         db.rollback()
-        logging.error(f"Error de base de datos al crear la combinación de instrumento y paquete: {str(e)}")
+        logger.error("Error de base de datos al crear la combinación de instrumento y paquete: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except HTTPException as e:
-        logger.error(f"Error de base de datos al crear combinación de instrumento y paquete: {str(e)}")
+        logger.error("Error de base de datos al crear combinación de instrumento y paquete: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")    
     except Exception as e:
         db.rollback()
-        logging.error(f"Error inesperado al crear la combinación de instrumento y paquete: {str(e)}")
+        logger.error("Error inesperado al crear la combinación de instrumento y paquete: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Actualizar pack de instrumentos
@@ -117,10 +121,16 @@ def update_packs_instruments(db: Session, packs_instruments_id: int, **kwargs):
                 raise HTTPException(status_code=404, detail="Paquete no encontrado")
 
         # Actualizar los campos de la combinación de paquete e instrumento
+        previous = (packs_instruments.packs_id, packs_instruments.instrument_id)
         for key, value in kwargs.items():
             if hasattr(packs_instruments, key):
                 setattr(packs_instruments, key, value)
 
+        if previous != (packs_instruments.packs_id, packs_instruments.instrument_id):
+            record_event(db, "pack.instruments_changed", "pack", previous[0],
+                         {"pack_id": previous[0], "instrument_id": previous[1], "change": "removed"})
+            record_event(db, "pack.instruments_changed", "pack", packs_instruments.packs_id,
+                         {"pack_id": packs_instruments.packs_id, "instrument_id": packs_instruments.instrument_id, "change": "added"})
         db.commit()
         db.refresh(packs_instruments)  # Refrescar la instancia para obtener los datos actualizados de la base de datos
         logger.info("Combinación pack e insturmento actualizado con éxito")
@@ -128,14 +138,14 @@ def update_packs_instruments(db: Session, packs_instruments_id: int, **kwargs):
 
     except SQLAlchemyError as e:
         db.rollback()
-        logging.error(f"Error de base de datos al actualizar la combinación de paquete e instrumento: {str(e)}")
+        logger.error("Error de base de datos al actualizar la combinación de paquete e instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except HTTPException as e:
-        logger.error(f"Error de base de datos al crear combinación de instrumento y paquete: {str(e)}")
+        logger.error("Error de base de datos al crear combinación de instrumento y paquete: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")    
     except Exception as e:
         db.rollback()
-        logging.error(f"Error inesperado al actualizar la combinación de paquete e instrumento: {str(e)}")
+        logger.error("Error inesperado al actualizar la combinación de paquete e instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Eliminar packs de instrumentos
@@ -149,17 +159,19 @@ def delete_packs_instruments(db: Session, packs_instruments_id: int) -> bool:
 
         # Eliminar el pack de instrumentos
         db.delete(packs_instruments)
+        record_event(db, "pack.instruments_changed", "pack", packs_instruments.packs_id,
+                     {"pack_id": packs_instruments.packs_id, "instrument_id": packs_instruments.instrument_id, "change": "removed"})
         db.commit()
         logger.info("Combinación pack e insturmento actualizado con éxito")        
         return True
     except HTTPException as e:
-        logger.error(f"Error de base de datos al crear combinación de instrumento y paquete: {str(e)}")
+        logger.error("Error de base de datos al crear combinación de instrumento y paquete: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")    
     except SQLAlchemyError as e:
         db.rollback()
-        logging.error(f"Error de base de datos al eliminar el pack de instrumentos: {str(e)}")
+        logger.error("Error de base de datos al eliminar el pack de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error de base de datos")
     except Exception as e:
         db.rollback()
-        logging.error(f"Error inesperado al eliminar el pack de instrumentos: {str(e)}")
+        logger.error("Error inesperado al eliminar el pack de instrumentos: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
\ No newline at end of file
@@ -5,6 +5,7 @@ from fastapi import HTTPException
 import logging
 from typing import Optional, List
 from models import Pack
+from outbox import record_event
 
 '''
 Cada función en este código está diseñada para interactuar con la base de datos a través de SQLAlchemy y manejar las operaciones 
@@ -25,10 +26,10 @@ def get_pack(db: Session, pack_id: int) -> Optional[Pack]:
         logger.info("Pack recuperado con éxito")
         return result
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener el pack: {str(e)}")
+        logger.error("Error de base de datos al obtener el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener el pack: {str(e)}")
+        logger.error("Error inesperado al obtener el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Listar todos los packs
@@ -38,12 +39,30 @@ def get_packs(db: Session) -> List[Pack]:
         logger.info("Todos los packs recuperados con éxito")
         return db.scalars(stmt).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener los packs: {str(e)}")
+        logger.error("Error de base de datos al obtener los packs: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener los packs: {str(e)}")
+        logger.error("Error inesperado al obtener los packs: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
+# Consultar varios packs por ID con una única consulta IN
+def get_packs_by_ids(db: Session, pack_ids: List[int]) -> List[Pack]:
+    try:
+        stmt = select(Pack).where(Pack.id.in_(pack_ids))
+        packs = db.scalars(stmt).all()
+        logger.info("Recuperados %s packs por ID", len(packs))
+        return packs
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al obtener packs por ID: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        logger.error("Error inesperado al obtener packs por ID: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Datos de un pack que se publican en el outbox
+def pack_payload(pack: Pack) -> dict:
+    return {"id": pack.id, "pack": pack.pack, "discount_1": pack.discount_1, "discount_2": pack.discount_2}
+
 # Crear un nuevo pack
 def create_pack(db: Session, pack: str, discount_1: float, discount_2: float) -> Optional[Pack]:
     stmt = select(Pack).where(Pack.pack == pack)
@@ -56,17 +75,19 @@ def create_pack(db: Session, pack: str, discount_1: float, discount_2: float) ->
     db.add(new_pack)
 
     try:
+        db.flush()
+        record_event(db, "pack.created", "pack", new_pack.id, pack_payload(new_pack))
         db.commit()
         db.refresh(new_pack)
         logger.info("Pack creado con éxito")
         return new_pack
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear el pack: {str(e)}")
+        logger.error("Error de base de datos al crear el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear el pack: {str(e)}")
+        logger.error("Error inesperado al crear el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Actualizar pack
@@ -81,19 +102,20 @@ def update_pack(db: Session, pack_id: int, **kwargs) -> Optional[Pack]:
             if hasattr(pack, key):
                 setattr(pack, key, value)
 
+        record_event(db, "pack.updated", "pack", pack.id, pack_payload(pack))
         db.commit()
         db.refresh(pack)
         logger.info("Pack actualizado con éxito")
         return pack
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar el pack: {str(e)}")
+        logger.error("Error de base de datos al actualizar el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar el pack: {str(e)}")
+        logger.error("Error inesperado al actualizar el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 #  Eliminar pack
@@ -105,16 +127,17 @@ def delete_pack(db: Session, pack_id: int) -> bool:
             raise HTTPException(status_code=404, detail="Pack no encontrado")
 
         db.delete(pack)
+        record_event(db, "pack.deleted", "pack", pack.id, {"id": pack.id})
         db.commit()
         logger.info("Pack eliminado con éxito")
         return True
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar el pack: {str(e)}")
+        logger.error("Error de base de datos al eliminar el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar el pack: {str(e)}")
+        logger.error("Error inesperado al eliminar el pack: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
\ No newline at end of file
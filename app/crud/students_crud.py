@@ -1,13 +1,16 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, select, func
-from models import Student, Inscription, Level, Instrument, Pack, PacksInstruments
+from sqlalchemy import and_, select, func, delete
+from models import Student, StudentSearchToken, Inscription, Level, Instrument, Pack, PacksInstruments, index_student_name, name_search_filter
 from schemas import StudentCreate, InscriptionCreate
 from typing import List, Dict
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
+import argparse
 import logging
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from fastapi import HTTPException
+from outbox import record_event
+from crud.inscriptions_crud import inscription_payload
 
 '''
 Cada función en este código está diseñada para interactuar con la base de datos a través de SQLAlchemy y manejar las operaciones 
@@ -17,6 +20,15 @@ logging para registrar las operaciones y posibles fallos.
 # Obtener el logger configurado
 logger = logging.getLogger("music_app")
 
+# Datos de un estudiante que se publican en el outbox
+def student_payload(student: Student) -> dict:
+    return {
+        "id": student.id,
+        "first_name": student.first_name,
+        "last_name": student.last_name,
+        "family_id": student.family_id,
+    }
+
 # Crear un nuevo estudiante
 def create_student(db: Session, student: StudentCreate):
     try:
@@ -28,38 +40,88 @@ def create_student(db: Session, student: StudentCreate):
         ).first()
         
         if existing_student:
-            logger.warning(f"Intento de crear un estudiante que ya existe: {student.first_name} {student.last_name}")
+            logger.warning("Intento de crear un estudiante que ya existe: %s %s", student.first_name, student.last_name)
             return None
 
         # Crear el nuevo estudiante
         db_student = Student(**student.model_dump())
         db.add(db_student)
+        db.flush()
+        record_event(db, "student.created", "student", db_student.id, student_payload(db_student))
         db.commit()
         db.refresh(db_student)
         logger.info("Estudiante creado con éxito")
         return db_student
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error al crear el estudiante: {str(e)}")
+        logger.error("Error al crear el estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear el estudiante: {str(e)}")
+        logger.error("Error inesperado al crear el estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Listar todos los estudiantes
 def get_students(db: Session, skip: int = 0, limit: int = 200):
     try:
         students = db.query(Student).offset(skip).limit(limit).all()
-        logger.info(f"Recuperados {len(students)} estudiantes")
+        logger.info("Recuperados %s estudiantes", len(students))
         return students
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos recuperando estudiantes: {str(e)}")
+        logger.error("Error de base de datos recuperando estudiantes: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado recuperando estudiantes: {str(e)}")
+        logger.error("Error inesperado recuperando estudiantes: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
+# Buscar estudiantes por nombre y apellido: cada término debe ser el comienzo de una palabra del nombre,
+# sin distinguir mayúsculas ni acentos (ver search.py). Una búsqueda vacía devuelve todos los estudiantes
+def search_students(db: Session, query: str, skip: int = 0, limit: int = 50) -> dict:
+    try:
+        stmt = select(Student).where(*name_search_filter(query))
+        # Se pide un registro de más para saber si hay otra página
+        stmt = stmt.order_by(Student.last_name, Student.first_name, Student.id).offset(skip).limit(limit + 1)
+        students = db.scalars(stmt).all()
+        logger.info("Búsqueda de estudiantes: %s resultados", min(len(students), limit))
+        return {"items": students[:limit], "skip": skip, "limit": limit, "has_more": len(students) > limit}
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos buscando estudiantes: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        logger.error("Error inesperado buscando estudiantes: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Guardar las palabras de búsqueda de los estudiantes que no las tienen (creados antes de existir la tabla).
+# Es una tarea de despliegue: la ejecuta server.py antes de lanzar los workers, o "python -m crud.students_crud
+# --backfill" desde el directorio app
+def backfill_search_tokens(db: Session, batch_size: int = 500) -> int:
+    indexed, last_id = 0, 0
+    while True:
+        # Por orden de id: un estudiante sin palabras (p. ej. nombre sin letras) no se vuelve a seleccionar
+        students = db.execute(
+            select(Student.id, Student.first_name, Student.last_name)
+            .where(Student.id > last_id)
+            .where(~select(StudentSearchToken.student_id).where(StudentSearchToken.student_id == Student.id).exists())
+            .order_by(Student.id)
+            .limit(batch_size)
+        ).all()
+        if not students:
+            break
+        try:
+            connection = db.connection()
+            for student_id, first_name, last_name in students:
+                index_student_name(connection, student_id, first_name, last_name)
+            db.commit()
+            indexed += len(students)
+        except IntegrityError:
+            # Otro proceso está guardando las mismas palabras a la vez: ese lote ya lo completa él
+            db.rollback()
+            logger.info("Palabras de búsqueda de los estudiantes %s-%s guardadas por otro proceso", students[0][0], students[-1][0])
+        last_id = students[-1][0]
+    if indexed:
+        logger.info("Palabras de búsqueda guardadas para %s estudiantes", indexed)
+    return indexed
+
 # Consultar estudiante por ID
 def get_student(db: Session, student_id: int):
     try:
@@ -68,10 +130,24 @@ def get_student(db: Session, student_id: int):
         logger.info("Estudiante recuperado con éxito")
         return result
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos recuperando estudiante: {str(e)}")
+        logger.error("Error de base de datos recuperando estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado en recuperando estudiante: {str(e)}")
+        logger.error("Error inesperado en recuperando estudiante: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Consultar varios estudiantes por ID con una única consulta IN
+def get_students_by_ids(db: Session, student_ids: List[int]) -> List[Student]:
+    try:
+        stmt = select(Student).where(Student.id.in_(student_ids))
+        students = db.scalars(stmt).all()
+        logger.info("Recuperados %s estudiantes por ID", len(students))
+        return students
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos recuperando estudiantes por ID: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        logger.error("Error inesperado recuperando estudiantes por ID: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Actualizar estudiante  
@@ -84,42 +160,110 @@ def update_student(db: Session, student_id: int, student_data: dict):
 
         for key, value in student_data.items():
             setattr(db_student, key, value)
+        record_event(db, "student.updated", "student", db_student.id, student_payload(db_student))
         db.commit()
         db.refresh(db_student)
         logger.info("Estudiante actualizado con éxito")
         return db_student
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar estudiante: {str(e)}")
+        logger.error("Error de base de datos al actualizar estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc:
-        logger.error(f"HTTPException al actualizar estudiante: {http_exc.detail}")
+        logger.error("HTTPException al actualizar estudiante: %s", http_exc.detail)
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar estudiante: {str(e)}")
+        logger.error("Error inesperado al actualizar estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
     
+# Inscripciones de los estudiantes, con los datos del evento inscription.deleted
+def _student_inscriptions(db: Session, student_ids: List[int]):
+    return db.execute(
+        select(Inscription.id, Inscription.student_id, Inscription.level_id, Inscription.registration_date)
+        .where(Inscription.student_id.in_(student_ids))
+        .order_by(Inscription.id)
+    ).all()
+
+def _record_deleted(db: Session, student_ids: List[int], inscriptions):
+    # Eventos del borrado de los estudiantes y de sus inscripciones, en la misma transacción
+    for inscription in inscriptions:
+        record_event(db, "inscription.deleted", "inscription", inscription.id, inscription_payload(inscription))
+    for student_id in student_ids:
+        record_event(db, "student.deleted", "student", student_id, {"id": student_id})
+
 # Eliminar estudiante
 def delete_student(db: Session, student_id: int):
     try:
-        db_student = db.query(Student).filter(Student.id == student_id).first()
-        if not db_student:
+        # Las inscripciones se borran en la base de datos (ON DELETE CASCADE); se leen antes para registrar sus eventos
+        inscriptions = _student_inscriptions(db, [student_id])
+        result = db.execute(delete(Student).where(Student.id == student_id))
+        if result.rowcount == 0:
             logger.info("Estudiante no encontrado")
             raise HTTPException(status_code=404, detail="Estudiante no encontrado")
 
-        db.delete(db_student)
+        _record_deleted(db, [student_id], inscriptions)
         db.commit()
         logger.info("Estudiante eliminado con éxito")
         return True
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar al estudiante: {str(e)}")
+        logger.error("Error de base de datos al eliminar al estudiante: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc: 
-        logger.error(f"HTTPException al eliminar: {http_exc.detail}")
+        logger.error("HTTPException al eliminar: %s", http_exc.detail)
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar el estudiante: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
\ No newline at end of file
+        logger.error("Error inesperado al eliminar el estudiante: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Número máximo de ids por sentencia DELETE en los borrados masivos
+BULK_DELETE_CHUNK = 500
+
+def delete_students_bulk(db: Session, student_ids: List[int], chunk_size: int = BULK_DELETE_CHUNK) -> int:
+    # Borra los estudiantes por bloques (y sus inscripciones, por ON DELETE CASCADE); devuelve cuántos se borraron.
+    # Cada bloque se confirma por separado para no mantener bloqueos largos sobre las tablas
+    try:
+        ids = list(dict.fromkeys(student_ids))
+        deleted = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk = db.scalars(select(Student.id).where(Student.id.in_(ids[start:start + chunk_size]))).all()
+            if not chunk:
+                continue
+            inscriptions = _student_inscriptions(db, chunk)
+            db.execute(delete(Student).where(Student.id.in_(chunk)).execution_options(synchronize_session=False))
+            _record_deleted(db, chunk, inscriptions)
+            db.commit()
+            deleted += len(chunk)
+        logger.info("%s estudiantes eliminados en bloque", deleted)
+        return deleted
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("Error de base de datos al eliminar estudiantes en bloque: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        db.rollback()
+        logger.error("Error inesperado al eliminar estudiantes en bloque: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de los estudiantes")
+    parser.add_argument("--backfill", action="store_true", help="Guardar las palabras de búsqueda que falten")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("Indique una tarea (--backfill)")
+
+    from db import engine, SessionLocal
+    from models import Base
+    from logging_config import setup_logger
+    setup_logger()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        backfill_search_tokens(db, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
 import logging
 from models import Teacher
-from typing import Optional
+from typing import Optional, List
 
 '''
 Cada función en este código está diseñada para interactuar con la base de datos a través de SQLAlchemy y manejar las operaciones 
@@ -25,10 +25,10 @@ def get_teacher(db: Session, teacher_id: int) -> Teacher:
             return None
         return result
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener el profesor: {str(e)}")
+        logger.error("Error de base de datos al obtener el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener el profesor: {str(e)}")
+        logger.error("Error inesperado al obtener el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Listar todos los profesores
@@ -38,10 +38,24 @@ def get_teachers(db: Session):
         logger.info("Todos los profesores recuperados con éxito")
         return db.scalars(stmt).all()
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener los profesores: {str(e)}")
+        logger.error("Error de base de datos al obtener los profesores: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener los profesores: {str(e)}")
+        logger.error("Error inesperado al obtener los profesores: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
+
+# Consultar varios profesores por ID con una única consulta IN
+def get_teachers_by_ids(db: Session, teacher_ids: List[int]) -> List[Teacher]:
+    try:
+        stmt = select(Teacher).where(Teacher.id.in_(teacher_ids))
+        teachers = db.scalars(stmt).all()
+        logger.info("Recuperados %s profesores por ID", len(teachers))
+        return teachers
+    except SQLAlchemyError as e:
+        logger.error("Error de base de datos al obtener profesores por ID: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    except Exception as e:
+        logger.error("Error inesperado al obtener profesores por ID: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Crear un nuevo profesor
@@ -70,17 +84,19 @@ def create_teacher(db: Session, teacher: Teacher) -> Teacher:
         return new_teacher
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear el profesor: {str(e)}")
+        logger.error("Error de base de datos al crear el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear el profesor: {str(e)}")
+        logger.error("Error inesperado al crear el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Actualizar un profesor
 def update_teacher(db: Session, teacher_id: int, new_teacher: dict) -> Teacher:
     try:
         teacher = get_teacher(db, teacher_id)
+        if teacher is None:
+            return None
         for key, value in new_teacher.items():
             if value:
                 setattr(teacher, key, value)
@@ -91,31 +107,33 @@ def update_teacher(db: Session, teacher_id: int, new_teacher: dict) -> Teacher:
         return teacher
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar el profesor: {str(e)}")
+        logger.error("Error de base de datos al actualizar el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc:
-        logger.error(f"HTTPException al actualizar el profesor: {http_exc.detail}")
+        logger.error("HTTPException al actualizar el profesor: %s", http_exc.detail)
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar el profesor: {str(e)}")
+        logger.error("Error inesperado al actualizar el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 # Eliminar un profesor
 def delete_teacher(db: Session, teacher_id: int) -> bool:
     try:
         teacher = get_teacher(db, teacher_id)
+        if teacher is None:
+            return False
         db.delete(teacher)
         db.commit()
         logger.info("Profesor eliminado con éxito")
         return True
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar el profesor: {str(e)}")
+        logger.error("Error de base de datos al eliminar el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar el profesor: {str(e)}")
+        logger.error("Error inesperado al eliminar el profesor: %s", e)
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
\ No newline at end of file
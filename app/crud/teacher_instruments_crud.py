@@ -27,11 +27,11 @@ def get_teacher_instruments(db: Session, teachers_instruments_id: int):
         return result
 
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener instrumentos de profesor: {str(e)}")
+        logger.error("Error de base de datos al obtener instrumentos de profesor: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     
     except Exception as e:
-        logger.error(f"Error inesperado al obtener instrumentos de profesor: {str(e)}")
+        logger.error("Error inesperado al obtener instrumentos de profesor: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Listar todas las relaciones de profesor-instrumento
@@ -39,13 +39,13 @@ def get_teachers_instruments(db: Session):
     try:
         stmt = select(TeachersInstruments)
         instruments = db.scalars(stmt).all()
-        logger.info(f"Relaciones profesor-instrumento obtenidas con éxito: {len(instruments)} relaciones")
+        logger.info("Relaciones profesor-instrumento obtenidas con éxito: %s relaciones", len(instruments))
         return instruments
     except SQLAlchemyError as e:
-        logger.error(f"Error de base de datos al obtener instrumentos de profesores: {str(e)}")
+        logger.error("Error de base de datos al obtener instrumentos de profesores: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
-        logger.error(f"Error inesperado al obtener instrumentos de profesores: {str(e)}")
+        logger.error("Error inesperado al obtener instrumentos de profesores: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Crear una nueva relación profesor-instrumento
@@ -85,12 +85,12 @@ def create_teachers_instruments(db: Session, teacher_id: int, instrument_id: int
 
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al crear relación profesor-instrumento: {str(e)}")
+        logger.error("Error de base de datos al crear relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al crear relación profesor-instrumento: {str(e)}")
+        logger.error("Error inesperado al crear relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
     
 # Actualizar relación profesor por instrumento
@@ -128,12 +128,12 @@ def update_teachers_instruments(db: Session, teachers_instruments_id: int, **kwa
 
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al actualizar relación profesor-instrumento: {str(e)}")
+        logger.error("Error de base de datos al actualizar relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
 
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al actualizar relación profesor-instrumento: {str(e)}")
+        logger.error("Error inesperado al actualizar relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
 
 # Eliminar relación profesor por instrumento
@@ -152,9 +152,9 @@ def delete_teacher_instruments(db: Session, teacher_instrument_id: int) -> bool:
         return True
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Error de base de datos al eliminar relación profesor-instrumento: {str(e)}")
+        logger.error("Error de base de datos al eliminar relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error en la base de datos")
     except Exception as e:
         db.rollback()
-        logger.error(f"Error inesperado al eliminar relación profesor-instrumento: {str(e)}")
+        logger.error("Error inesperado al eliminar relación profesor-instrumento: %s", e)
         raise HTTPException(status_code=500, detail="Error inesperado")
\ No newline at end of file
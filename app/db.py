@@ -1,16 +1,48 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+import sqlite3
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
 from models import Base
 
 load_dotenv()
 
+def engine_options(database_url: str) -> dict:
+    # Parámetros del pool de conexiones, configurables por entorno. Cada worker del servidor
+    # tiene su propio pool, así que el total de conexiones es workers * (pool_size + max_overflow).
+    # SQLite gestiona su propio pool y no admite estas opciones.
+    if database_url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+# SQLite no aplica las claves foráneas (ni sus ON DELETE) salvo que se active en cada conexión
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # Create the database and tables
-engine = create_engine(os.environ['DATABASE_URL'], echo=False)
+engine = create_engine(os.environ['DATABASE_URL'], echo=False, **engine_options(os.environ['DATABASE_URL']))
 Base.metadata.create_all(engine)
 
+# Si el proceso se bifurca después de crear el engine (por ejemplo, gunicorn con --preload),
+# el hijo no debe reutilizar las conexiones heredadas del padre: se crea un pool nuevo en cada worker.
+def _dispose_pool_after_fork():
+    engine.dispose(close=False)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_pool_after_fork)
+
 # Create a session
 SessionLocal = sessionmaker(bind=engine)
 # session = Session()
@@ -19,4 +51,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Factoría de sesiones para el trabajo que se ejecuta fuera de la petición (informes en segundo plano)
+def get_session_factory():
+    return SessionLocal
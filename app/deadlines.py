@@ -0,0 +1,218 @@
+import os
+import re
+import time
+import math
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from admission import classify_request, EXEMPT_PATHS
+
+'''
+Plazos (deadlines) por petición y timeouts de sentencias SQL.
+
+Cada petición recibe un plazo según su clase de ruta (ver admission.classify_request), que el cliente puede
+acortar con la cabecera X-Request-Timeout (en segundos). El plazo se guarda en una variable de contexto
+que heredan los hilos del threadpool, y se aplica a la base de datos:
+    - MySQL: se añade el hint MAX_EXECUTION_TIME a cada SELECT, que el servidor aborta al vencer.
+    - PostgreSQL: se fija statement_timeout antes de cada sentencia.
+    - SQLite: un progress handler interrumpe la sentencia en curso al vencer el plazo.
+El timeout se quita de la conexión al terminar la sentencia, también si falla, y al devolverla al pool.
+Además, ninguna sentencia nueva se lanza con el plazo vencido.
+
+Si el plazo vence antes de enviar la respuesta, el middleware responde 504 sin esperar al handler; el hilo
+que lo ejecuta falla en su siguiente sentencia y cierra la sesión, devolviendo la conexión al pool.
+
+Configuración por variables de entorno:
+    DEADLINE_CHEAP_SECONDS, DEADLINE_HEAVY_SECONDS, DEADLINE_WRITE_SECONDS: plazo por clase de ruta.
+'''
+
+logger = logging.getLogger("music_app")
+
+DEFAULT_DEADLINES = {
+    "cheap": 5.0,
+    "heavy": 30.0,
+    "write": 10.0,
+}
+
+# Instante (time.monotonic) en que vence el plazo de la operación en curso
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+_MYSQL_SELECT = re.compile(r"^\s*select\b", re.IGNORECASE)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining() -> Optional[float]:
+    # Segundos que quedan hasta el plazo, o None si no hay plazo
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    # Fija un plazo para las sentencias ejecutadas dentro del bloque; nunca amplía un plazo ya fijado
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def without_deadline():
+    # Quita el plazo dentro del bloque, para las sentencias de limpieza que deben ejecutarse aunque haya vencido
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _reset_timeout(dbapi_connection, info: dict) -> None:
+    # Quita de la conexión el timeout que quede aplicado
+    if info.pop("progress_handler_set", False):
+        dbapi_connection.set_progress_handler(None, 0)
+    elif info.pop("statement_timeout_set", False):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SET statement_timeout = 0")
+        finally:
+            cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute", retval=True)
+def _apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    left = remaining()
+    if left is None:
+        # Timeout que haya quedado de una sentencia anterior que falló en esta misma conexión
+        _reset_timeout(conn.connection.dbapi_connection, conn.info)
+        return statement, parameters
+    if left <= 0:
+        raise DeadlineExceeded("Plazo de la petición vencido")
+
+    timeout_ms = max(1, math.ceil(left * 1000))
+    dialect = conn.dialect.name
+    if dialect in ("mysql", "mariadb"):
+        # Solo los SELECT admiten MAX_EXECUTION_TIME
+        statement = _MYSQL_SELECT.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({timeout_ms}) */", statement, count=1)
+    elif dialect == "postgresql":
+        cursor.execute(f"SET statement_timeout = {timeout_ms}")
+        conn.info["statement_timeout_set"] = True
+    elif dialect == "sqlite":
+        deadline = _deadline.get()
+        conn.connection.dbapi_connection.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 1000)
+        conn.info["progress_handler_set"] = True
+    return statement, parameters
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _clear_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    # Evitar que el timeout se quede aplicado en la conexión cuando vuelva al pool
+    if conn.info.pop("progress_handler_set", False):
+        conn.connection.dbapi_connection.set_progress_handler(None, 0)
+    elif conn.info.pop("statement_timeout_set", False):
+        cursor.execute("SET statement_timeout = 0")
+
+
+@event.listens_for(Engine, "handle_error")
+def _clear_statement_timeout_on_error(context):
+    # after_cursor_execute no se llama si la sentencia falla (p. ej. interrumpida por el plazo). El progress
+    # handler de SQLite se quita aquí; en PostgreSQL la transacción ha quedado abortada y no admite SET, así
+    # que el timeout se quita en la siguiente sentencia sin plazo o al devolver la conexión al pool.
+    connection = context.connection
+    if connection is not None and not connection.invalidated and connection.info.pop("progress_handler_set", False):
+        connection.connection.dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Pool, "checkin")
+def _clear_statement_timeout_on_checkin(dbapi_connection, connection_record):
+    # Ninguna conexión vuelve al pool con un timeout aplicado
+    if dbapi_connection is None:
+        return
+    try:
+        _reset_timeout(dbapi_connection, connection_record.info)
+    except Exception as e:
+        logger.warning("No se pudo quitar el timeout de una conexión: %s", e)
+        connection_record.invalidate(e)
+
+
+class DeadlineMiddleware:
+    def __init__(self, app: ASGIApp, deadlines: Optional[dict] = None):
+        self.app = app
+        self.deadlines = deadlines or {
+            name: float(os.getenv(f"DEADLINE_{name.upper()}_SECONDS", str(seconds)))
+            for name, seconds in DEFAULT_DEADLINES.items()
+        }
+
+    def timeout_for(self, scope: Scope) -> float:
+        timeout = self.deadlines[classify_request(scope["method"], scope["path"])]
+        requested = Headers(scope=scope).get("x-request-timeout")
+        if requested:
+            try:
+                timeout = min(timeout, float(requested))
+            except ValueError:
+                pass
+        return timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self.timeout_for(scope)
+        deadline = time.monotonic() + timeout
+        state = {"started": False, "expired": False}
+        timeout_response = JSONResponse({"detail": "La petición superó su tiempo máximo"}, status_code=504)
+
+        async def guarded_send(message: Message) -> None:
+            if state["expired"]:
+                return
+            if message["type"] == "http.response.start":
+                if message["status"] >= 500 and time.monotonic() >= deadline:
+                    # El handler falló porque venció el plazo: se responde 504 en su lugar
+                    state["expired"] = True
+                    await timeout_response(scope, receive, send)
+                    return
+                state["started"] = True
+            await send(message)
+
+        token = _deadline.set(deadline)
+        try:
+            # La tarea copia el contexto actual, incluido el plazo
+            task = asyncio.ensure_future(self.app(scope, receive, guarded_send))
+        finally:
+            _deadline.reset(token)
+
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if task in done or state["started"] or state["expired"]:
+            await task
+            return
+
+        state["expired"] = True
+        logger.warning("Plazo vencido en %s %s tras %ss", scope['method'], scope['path'], timeout)
+        # El hilo que ejecuta el handler termina en su siguiente sentencia; se cancela el resto de la tarea
+        task.cancel()
+        task.add_done_callback(_consume_result)
+        await timeout_response(scope, receive, send)
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    # Recoger la excepción de la tarea abandonada para que asyncio no la registre como no recuperada
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Set
+
+from sqlalchemy import delete, func, select
+
+from changes import LOGGED_TABLES
+from models import ChangeLogEntry
+
+'''
+Canal de cambios en tiempo real (Server-Sent Events) para las pantallas que hoy consultan periódicamente
+/inscriptions/ y /students/.
+
+Los cambios confirmados se guardan en la tabla change_log en la misma transacción que los produce (ver
+changes.py), hechos desde cualquier worker de la API, desde la GUI o desde otro proceso. Cada worker lee la
+tabla por id mientras tiene clientes conectados a GET /changes/stream y les reparte los cambios nuevos; el id
+de cada evento es el id de change_log, el mismo en todos los workers. Un cliente que se reconecta con
+Last-Event-ID, a este worker o a otro, recibe de la tabla solo lo que se perdió. Si ese id ya no está en la
+tabla (se conservan CHANGE_FEED_RETENTION_SECONDS) o no es válido, el cliente recibe un evento "reset" y debe
+volver a cargar los datos completos.
+
+Los ids de change_log se asignan al insertar, no al confirmar: una fila con un id menor puede aparecer después
+que otra con uno mayor. Por eso la lectura se detiene en el primer hueco reciente y solo lo salta cuando tiene
+más de CHANGE_FEED_GAP_SECONDS (la transacción se revirtió).
+
+Configuración por variables de entorno:
+    CHANGE_FEED_POLL_INTERVAL: segundos entre lecturas de change_log (por defecto 1).
+    CHANGE_FEED_GAP_SECONDS: tiempo que se espera a que se confirme un id que falta (por defecto 2).
+    CHANGE_FEED_RETENTION_SECONDS: tiempo que se conservan los cambios para las reconexiones (por defecto 3600).
+    CHANGE_FEED_MAX_PENDING: cambios pendientes de enviar a un cliente lento antes de desconectarlo; también es
+        el máximo de cambios que se recuperan al reconectar (por defecto 500).
+    CHANGE_FEED_KEEPALIVE: segundos entre comentarios de keep-alive (por defecto 15).
+'''
+
+logger = logging.getLogger("music_app")
+
+# Tablas que se publican: las que changes.py guarda en change_log
+FEED_ENTITIES = LOGGED_TABLES
+
+# Segundos entre borrados de los cambios antiguos
+PURGE_INTERVAL = 60.0
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _event(entry: ChangeLogEntry) -> dict:
+    return {"event_id": entry.id, "entity": entry.entity, "id": entry.entity_id, "op": entry.op,
+            "version": entry.version}
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, entities: Optional[Set[str]], max_pending: int,
+                 after: int = 0):
+        self.loop = loop
+        self.entities = entities
+        self.max_pending = max_pending
+        # Último cambio que el cliente ya tiene (de la reconexión o del historial enviado)
+        self.after = after
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    def wants(self, event: dict) -> bool:
+        return event["event_id"] > self.after and (self.entities is None or event["entity"] in self.entities)
+
+    def deliver(self, event: dict):
+        # Se ejecuta en el bucle de eventos del cliente
+        if self.closed:
+            return
+        if self.queue.qsize() >= self.max_pending:
+            # Cliente demasiado lento: se corta el stream y al reconectar recupera lo perdido con Last-Event-ID
+            self.close()
+            return
+        self.queue.put_nowait(event)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+
+class ChangeBroadcaster:
+    def __init__(self, max_pending: int = 500, poll_interval: float = 1.0, gap_timeout: float = 2.0,
+                 retention: float = 3600.0, batch_size: int = 500):
+        self._lock = threading.Lock()
+        # Último cambio de change_log repartido; None mientras no hay clientes
+        self._last_id: Optional[int] = None
+        self._subscribers: Set[Subscriber] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.gap_timeout = timedelta(seconds=gap_timeout)
+        self.retention = timedelta(seconds=retention)
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_env(cls) -> "ChangeBroadcaster":
+        return cls(
+            max_pending=int(os.getenv("CHANGE_FEED_MAX_PENDING", "500")),
+            poll_interval=float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "1")),
+            gap_timeout=float(os.getenv("CHANGE_FEED_GAP_SECONDS", "2")),
+            retention=float(os.getenv("CHANGE_FEED_RETENTION_SECONDS", "3600")),
+        )
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id or 0
+
+    def _position(self, db) -> int:
+        # Con el primer cliente se empieza a leer desde el último cambio guardado (se llama con el lock)
+        if self._last_id is None:
+            self._last_id = db.scalar(select(func.max(ChangeLogEntry.id))) or 0
+        return self._last_id
+
+    def poll(self, db) -> int:
+        '''Reparte a los clientes los cambios guardados desde la última lectura; devuelve cuántos se leyeron.'''
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            last_id = self._position(db)
+        entries = db.scalars(
+            select(ChangeLogEntry).where(ChangeLogEntry.id > last_id).order_by(ChangeLogEntry.id).limit(self.batch_size)
+        ).all()
+
+        # Cortar en el primer hueco reciente: puede ser una transacción aún sin confirmar
+        expected = last_id + 1
+        settled_before = _utcnow() - self.gap_timeout
+        events = []
+        for entry in entries:
+            if entry.id != expected and entry.created_at > settled_before:
+                break
+            events.append(_event(entry))
+            expected = entry.id + 1
+        if not events:
+            return 0
+
+        with self._lock:
+            if self._last_id != last_id:
+                # Los clientes se desconectaron y volvieron a conectarse mientras se leía
+                return 0
+            for event in events:
+                for subscriber in list(self._subscribers):
+                    if subscriber.wants(event):
+                        try:
+                            subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+                        except RuntimeError:
+                            # Bucle de eventos ya cerrado
+                            self._subscribers.discard(subscriber)
+            self._last_id = events[-1]["event_id"]
+        return len(events)
+
+    def purge(self, db) -> int:
+        # Borra los cambios más antiguos que el periodo de retención
+        result = db.execute(delete(ChangeLogEntry).where(ChangeLogEntry.created_at < _utcnow() - self.retention))
+        db.commit()
+        return result.rowcount
+
+    def subscribe(self, db, last_event_id: Optional[str] = None, entities: Optional[Set[str]] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None):
+        '''
+        Registra un cliente en el bucle de eventos indicado (por defecto, el actual). Devuelve (subscriber,
+        backlog, reset): los cambios posteriores a last_event_id que siguen en change_log y si el cliente debe
+        recargar todos los datos.
+        '''
+        subscriber = Subscriber(loop or asyncio.get_running_loop(), entities, self.max_pending)
+        with self._lock:
+            position = self._position(db)
+            subscriber.after = position
+            backlog, reset = [], False
+            if last_event_id is not None:
+                resume_from = int(last_event_id) if last_event_id.isdigit() else None
+                oldest, newest = db.execute(select(func.min(ChangeLogEntry.id), func.max(ChangeLogEntry.id))).one()
+                # Id que ya no está en la tabla, que no se ha asignado nunca o que no es un id
+                reset = resume_from is None or newest is None or not oldest - 1 <= resume_from <= newest
+                if not reset and resume_from < position:
+                    query = select(ChangeLogEntry).where(ChangeLogEntry.id > resume_from, ChangeLogEntry.id <= position)
+                    if entities is not None:
+                        query = query.where(ChangeLogEntry.entity.in_(entities))
+                    entries = db.scalars(query.order_by(ChangeLogEntry.id).limit(self.max_pending + 1)).all()
+                    # Demasiados cambios perdidos: es más rápido recargar
+                    reset = len(entries) > self.max_pending
+                    backlog = [] if reset else [_event(entry) for entry in entries]
+                elif not reset:
+                    # El cliente viene de un worker que ya ha leído cambios que este aún no ha repartido
+                    subscriber.after = resume_from
+            self._subscribers.add(subscriber)
+        return subscriber, backlog, reset
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                # Sin clientes no se lee la tabla; el siguiente empezará desde el último cambio guardado
+                self._last_id = None
+
+    def start(self, session_factory: Callable):
+        # Hilo del proceso que lee change_log mientras hay clientes y borra los cambios antiguos
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(session_factory,), name="change-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, session_factory: Callable):
+        next_purge = time.monotonic()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with session_factory() as db:
+                    while self.poll(db) == self.batch_size:
+                        pass
+                    if time.monotonic() >= next_purge:
+                        self.purge(db)
+                        next_purge = time.monotonic() + PURGE_INTERVAL
+            except Exception:
+                logger.exception("Error al leer los cambios confirmados")
+
+
+def format_event(event: dict) -> str:
+    data = {key: event[key] for key in ("entity", "id", "op", "version")}
+    return f"id: {event['event_id']}\nevent: change\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(broadcaster: "ChangeBroadcaster", subscriber: Subscriber, backlog: List[dict], reset: bool,
+                       keepalive: float) -> AsyncIterator[str]:
+    try:
+        # El cliente reintenta a los 3 segundos si se corta la conexión
+        yield "retry: 3000\n\n"
+        if reset:
+            yield f"id: {subscriber.after}\nevent: reset\ndata: {{}}\n\n"
+        for event in backlog:
+            yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Comentario para que los proxies no cierren la conexión inactiva
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+KEEPALIVE_SECONDS = float(os.getenv("CHANGE_FEED_KEEPALIVE", "15"))
+
+# Repartidor compartido por el proceso; main.py arranca su lectura de change_log
+change_broadcaster = ChangeBroadcaster.from_env()
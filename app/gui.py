@@ -1,29 +1,39 @@
+# Las anotaciones no se evalúan al definir las funciones, así que no cargan pandas (ver lazy_module)
+from __future__ import annotations
+
 # Importar streamlit y otras bibliotecas necesarias
 import streamlit as st
-from sqlalchemy import create_engine, func, or_, text, select
+from sqlalchemy import create_engine, func, or_, select
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import date
 from decimal import Decimal
-import pandas as pd
 import os
+import sys
+import time
+import importlib.util
 from dotenv import load_dotenv
-from sqlalchemy.exc import TimeoutError
-from simple_response import *
-from PIL import Image
+from changes import db_version
 import base64
 from typing import List, Tuple
 import hashlib
 import logging
+from contextlib import contextmanager
 
 
 # Importar  modelos y schemas
 from models import Base, Student, Teacher, Instrument, Level, Pack, Inscription, PacksInstruments, TeachersInstruments
-from schemas import StudentCreate, InscriptionCreate
+from schemas import StudentCreate, InscriptionCreate, CreateTeacher
+from api_client import ApiClient
 
 # Importar funciones CRUD
-from crud.students_crud import (create_student, get_students, update_student, delete_student)
-from crud.inscriptions_crud import (create_inscription, get_inscriptions, delete_inscription, get_inscriptions_by_student,
-                                    calculate_student_fees, generate_fee_report)
+from crud.students_crud import (create_student, update_student, delete_student, search_students)
+from crud import instruments_crud, teacher_crud
+from rollups import read_dashboard
+from sql_console import QueryRegistry, EXPORT_FORMATS
+from query_governor import create_console_engine, estimate_query
+from crud.inscriptions_crud import (create_inscription, delete_inscription, get_inscriptions_by_student,
+                                    calculate_student_fees, generate_fee_report, get_inscriptions_page,
+                                    get_fee_report_page, PAGE_SIZE)
 
 # Cargar variables de entorno
 load_dotenv()
@@ -31,47 +41,99 @@ load_dotenv()
 # Obtener el logger configurado
 logger = logging.getLogger("music_app")
 
-# Conexión a la base de datos
-DATABASE_URL = os.environ['DATABASE_URL']
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Crear tablas
-Base.metadata.create_all(bind=engine)
-
-# Dependencia para obtener la sesión de la BD
-def get_db():
-    db = SessionLocal()
+# Importaciones diferidas: las bibliotecas pesadas no se cargan hasta que una página las usa, para que el
+# formulario de login se muestre sin esperar a pandas. Los modelos de lenguaje de la página "SQL - IA"
+# (simple_response, con langchain) se importan al generar SQL.
+def lazy_module(name: str):
+    # Módulo que se carga en el primer acceso a uno de sus atributos
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+pd = lazy_module("pandas")
+
+# Conexión a la base de datos (en modo API solo la usa la consola SQL)
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# Modo API: con GUI_API_URL definida, las operaciones pasan por la API (ver api_client) en lugar de abrir
+# conexiones a la base de datos desde cada servidor de Streamlit
+API_URL = os.getenv('GUI_API_URL')
+
+@st.cache_resource
+def get_engine():
+    # Un único engine (y su pool de conexiones) por proceso de Streamlit, compartido por todos los usuarios
+    # y reutilizado entre ejecuciones del script; pre_ping descarta las conexiones que el servidor haya cerrado
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL no está definida")
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    # Crear tablas
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@st.cache_resource
+def get_session_factory():
+    # expire_on_commit=False: los objetos devueltos se pueden seguir leyendo después de cerrar la sesión
+    return sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=get_engine())
+
+@contextmanager
+def session_scope():
+    # Sesión de corta duración para una operación: commit al terminar, rollback si falla y siempre se cierra,
+    # devolviendo la conexión al pool. Cada operación de cada usuario tiene su propia sesión.
+    session = get_session_factory()()
     try:
-        yield db
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
     finally:
-        db.close()
-
-# Crear una sesión 
-session = next(get_db())
+        session.close()
 
-# Función para manejar operaciones de base de datos de forma segura
+# Función para manejar operaciones de base de datos de forma segura; la operación recibe la sesión
 def db_operation(operation):
     try:
-        result = operation()
-        session.commit()
-        return result
+        with session_scope() as db:
+            return operation(db)
     except Exception as e:
-        session.rollback()
         st.error(f"Ha ocurrido un error: {str(e)}")
         logger.warning("Se ha producido un error")
         return None
 
-# Función para consultar la base de datos
-def consultar_bbdd(*args, **kwargs):
+@st.cache_resource
+def get_api_client() -> ApiClient:
+    # Un único cliente HTTP (y sus conexiones keep-alive) por proceso de Streamlit, compartido por todos los usuarios
+    return ApiClient.from_env()
+
+# Ejecuta una operación contra la base de datos (direct recibe la sesión) o, en modo API, contra la API
+# (remote recibe el cliente); los errores se muestran como en db_operation
+def run_operation(direct, remote):
+    if not API_URL:
+        return db_operation(direct)
+    try:
+        return remote(get_api_client())
+    except Exception as e:
+        st.error(f"Ha ocurrido un error: {str(e)}")
+        logger.warning("Se ha producido un error en la llamada a la API")
+        return None
+
+# Alumnos por página en las consultas
+STUDENTS_PAGE_SIZE = 100
+
+# Función para consultar la base de datos. Devuelve la página pedida de alumnos y si hay más páginas
+def consultar_bbdd(*args, page: int = 1, **kwargs):
     if 'student' in kwargs:
-        student = kwargs['student'].strip()
-        if student == "":
-            students = get_students(session)
-        else:
-            parts = student.split()
-            students = get_students(session)
-            students = [s for s in students if any(part.lower() in s.first_name.lower() or part.lower() in s.last_name.lower() for part in parts)]
+        # Búsqueda en la base de datos por el comienzo de cada palabra del nombre (vacía: todos los alumnos)
+        skip = (page - 1) * STUDENTS_PAGE_SIZE
+        result = run_operation(lambda db: search_students(db, kwargs['student'], skip=skip, limit=STUDENTS_PAGE_SIZE),
+                               lambda api: api.search_students(kwargs['student'], skip=skip, limit=STUDENTS_PAGE_SIZE))
+        students = result["items"] if result else []
+        has_more = bool(result and result["has_more"])
         
         if students:
             df = pd.DataFrame([{
@@ -87,11 +149,137 @@ def consultar_bbdd(*args, **kwargs):
             column_order = ['id', 'first_name', 'last_name', 'age', 'phone', 'mail', 'family_id']
             df = df[column_order]
             
-            return df
+            return df, has_more
         else:
-            return pd.DataFrame()
-
-    return pd.DataFrame()
+            return pd.DataFrame(), False
+
+    return pd.DataFrame(), False
+
+# Tablas grandes (inscripciones, informe de tarifas) paginadas por keyset: cada interacción pide solo la página
+# que se muestra, con el orden y los filtros aplicados en SQL. En st.session_state se guarda la pila de cursores
+# de las páginas ya vistas para poder volver atrás; al cambiar los filtros o el orden se vuelve a la primera.
+def show_paged(key: str, fetch, params: dict, page_size: int = PAGE_SIZE):
+    state = st.session_state.setdefault(key, {"params": None, "cursors": [None]})
+    if state["params"] != params:
+        state["params"] = params
+        state["cursors"] = [None]
+
+    page = fetch(after=state["cursors"][-1], limit=page_size, **params)
+    if page is None:
+        return
+    if page["items"]:
+        st.dataframe(pd.DataFrame(page["items"]), hide_index=True)
+    else:
+        st.info("No hay resultados.")
+
+    previous_col, caption_col, next_col = st.columns([1, 2, 1])
+    if previous_col.button("Anterior", key=f"{key}_previous", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    caption_col.caption(f"Página {len(state['cursors'])} ({len(page['items'])} filas)")
+    if next_col.button("Siguiente", key=f"{key}_next", disabled=page["next_cursor"] is None):
+        state["cursors"].append(page["next_cursor"])
+        st.rerun()
+
+def fetch_inscriptions_page(**kwargs):
+    return run_operation(lambda db: get_inscriptions_page(db, **kwargs), lambda api: api.get_inscriptions_page(**kwargs))
+
+def fetch_fee_report_page(**kwargs):
+    return run_operation(lambda db: get_fee_report_page(db, **kwargs), lambda api: api.get_fee_report_page(**kwargs))
+
+# Consola SQL: cada consulta se ejecuta en segundo plano (ver sql_console) y sobrevive a las ejecuciones del
+# script, así que la GUI puede mostrar su progreso y el botón Cancelar, que provoca una nueva ejecución del
+# script, la detiene en el servidor
+SQL_CONSOLE_PAGE_SIZES = (100, 500, 1000)
+
+@st.cache_resource
+def get_query_jobs() -> QueryRegistry:
+    return QueryRegistry()
+
+@st.cache_resource
+def get_console_engine(read_only: bool):
+    # Pools pequeños y propios para las consultas ad hoc (ver query_governor): de solo lectura para el Admin
+    # y con escritura para el Super-user, separados del pool de la GUI y del de la API
+    url = os.getenv('SQL_CONSOLE_DATABASE_URL') or DATABASE_URL
+    if not url:
+        raise RuntimeError("DATABASE_URL no está definida")
+    return create_console_engine(url, read_only=read_only)
+
+def submit_console_query(query: str, export_format, read_only: bool):
+    job = get_query_jobs().submit(get_console_engine(read_only), query, export_format=export_format)
+    st.session_state.sql_console_job = job.id
+    st.session_state.pop('sql_console_pending', None)
+
+def show_query_job(job):
+    if job is None:
+        return
+    if job.status == "running" and st.button("Cancelar consulta"):
+        job.cancel()
+        job.wait(5)
+
+    # Mientras la consulta sigue en curso se muestran las filas leídas, el tiempo y la primera página
+    status = st.empty()
+    preview = st.empty()
+    while job.status == "running":
+        status.info(f"Ejecutando... {job.row_count} filas leídas en {job.elapsed:.1f} s")
+        if job.rows:
+            preview.dataframe(pd.DataFrame(job.page(0, SQL_CONSOLE_PAGE_SIZES[0]), columns=job.columns), hide_index=True)
+        time.sleep(0.5)
+    status.empty()
+    preview.empty()
+
+    if job.status == "failed":
+        st.error(f"Error al ejecutar la consulta: {job.error}")
+    elif job.status == "cancelled":
+        st.warning(f"Consulta cancelada tras {job.elapsed:.1f} s ({job.row_count} filas leídas).")
+    elif not job.returns_rows:
+        st.success(f"Consulta ejecutada con éxito. Filas afectadas: {job.rowcount}")
+    elif not job.rows:
+        st.info("La consulta no devolvió resultados.")
+    else:
+        st.subheader("Resultado de la Instrucción:")
+        size_col, page_col = st.columns(2)
+        page_size = size_col.selectbox("Filas por página", SQL_CONSOLE_PAGE_SIZES, key="sql_console_page_size")
+        pages = (len(job.rows) - 1) // page_size + 1
+        page = page_col.number_input(f"Página (de {pages})", min_value=1, max_value=pages, key=f"sql_console_page_{job.id}")
+        st.dataframe(pd.DataFrame(job.page(page - 1, page_size), columns=job.columns), hide_index=True)
+        st.info(f"El código devolvió {job.row_count} filas en {job.elapsed:.1f} s")
+        if job.truncated or (not job.export_path and job.row_count >= job.max_rows):
+            st.warning(f"Solo se muestran las primeras {len(job.rows)} filas; exporte el resultado para obtenerlo completo.")
+    if job.export_path:
+        with open(job.export_path, "rb") as export:
+            st.download_button(f"Descargar resultado ({job.export_format.upper()})", export,
+                               file_name=f"resultado.{job.export_format}")
+
+def table_version(tables) -> tuple:
+    # Versión de las tablas en la base de datos (ver changes.db_version): la cambian los commits de la GUI,
+    # de la API y de cualquier otro proceso. Es una lectura por clave primaria en cada ejecución del script
+    with session_scope() as db:
+        return db_version(db, tables)
+
+# Totales del informe de tarifas (recorre todos los alumnos): en caché mientras no cambien las tablas de las que
+# depende. En modo API el informe se pide a la cola de informes de la API, que lo guarda en su propia caché.
+FEE_TABLES = ("students", "inscriptions", "levels", "instruments", "packs", "packs_instruments")
+
+def summarize_fees(fee_report) -> dict:
+    fees = [row['total_fee'] for row in fee_report]
+    return {
+        'count': len(fees),
+        'total': sum(fees),
+        'mean': sum(fees) / len(fees) if fees else 0.0,
+        'max': max(fees, default=0.0),
+        'min': min(fees, default=0.0),
+    }
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_fee_totals(version) -> dict:
+    with session_scope() as db:
+        return summarize_fees(generate_fee_report(db))
+
+def fee_totals() -> dict:
+    if API_URL:
+        return summarize_fees(get_api_client().fee_report())
+    return load_fee_totals(table_version(FEE_TABLES))
 
 # Función para cargar y codificar la imagen
 def get_image_base64(image_path):
@@ -117,17 +305,61 @@ def get_levels_with_instruments(db: Session) -> pd.DataFrame:
         .order_by(Level.id)
     )
     
-    try:
-        result = db.execute(query).fetchall()
-    except Exception as e:
-        print(f"Ha ocurrido un error: {e}")
-        return pd.DataFrame()  # Devolver un DataFrame vacío en caso de error
+    # Los errores se propagan para no guardar en caché un resultado vacío (ver load_catalog)
+    result = db.execute(query).fetchall()
 
     # Convertir el resultado a un DataFrame
     df = pd.DataFrame(result, columns=["level_id", "instrument_name", "level"])
     return df
 
 
+# Catálogos (instrumentos, profesores, niveles) en caché. Cambian pocas veces por trimestre, así que se
+# guardan con st.cache_data usando como clave la versión de sus tablas en la base de datos (table_version):
+# cualquier commit que modifique esas tablas, desde la GUI o desde la API, aumenta la versión y la siguiente
+# lectura vuelve a consultar la base de datos. Los cambios hechos con SQL fuera del ORM (p. ej. la consola SQL)
+# no cambian la versión; por eso cada catálogo se recarga además cada GUI_CATALOG_TTL segundos (por defecto
+# 300; 0 para no caducar).
+INSTRUMENT_TABLES = ("instruments",)
+TEACHER_TABLES = ("teachers",)
+LEVEL_TABLES = ("levels", "instruments")
+CATALOG_TTL = int(os.getenv("GUI_CATALOG_TTL", "300")) or None
+
+@st.cache_data(show_spinner=False, ttl=CATALOG_TTL, max_entries=4)
+def load_instruments(version) -> pd.DataFrame:
+    with session_scope() as db:
+        instruments = db.query(Instrument).order_by(Instrument.id).all()
+        return pd.DataFrame([{'id': i.id, 'name': i.name, 'price': float(i.price)} for i in instruments])
+
+@st.cache_data(show_spinner=False, ttl=CATALOG_TTL, max_entries=4)
+def load_teachers(version) -> pd.DataFrame:
+    with session_scope() as db:
+        teachers = db.query(Teacher).order_by(Teacher.id).all()
+        return pd.DataFrame([{
+            'id': t.id,
+            'first_name': t.first_name,
+            'last_name': t.last_name,
+            'phone': t.phone,
+            'mail': t.mail
+        } for t in teachers])
+
+@st.cache_data(show_spinner=False, ttl=CATALOG_TTL, max_entries=4)
+def load_levels(version) -> pd.DataFrame:
+    with session_scope() as db:
+        return get_levels_with_instruments(db)
+
+def load_catalog(loader, tables, remote) -> pd.DataFrame:
+    # Catálogo de la caché mientras la versión de sus tablas no cambie; los errores no se guardan en caché.
+    # En modo API se pide a la API (remote recibe el cliente y devuelve las filas)
+    try:
+        if API_URL:
+            return pd.DataFrame(remote(get_api_client()))
+        return loader(table_version(tables))
+    except Exception as e:
+        st.error(f"Ha ocurrido un error: {str(e)}")
+        logger.warning("Se ha producido un error al cargar un catálogo")
+        return pd.DataFrame()
+
+
 users = {
     "admin": os.getenv("ADMIN_PASSWORD"),
     "super": os.getenv("SUPER_PASSWORD"),
@@ -202,7 +434,7 @@ if st.session_state.logged_in:
     # Opciones de la barra lateral
     option = st.sidebar.selectbox(
         "Selecciona una opción",
-        ["Consultar Alumnos", "Gestionar Alumnos", "Inscripciones",  "Instrumentos", "Profesores", "Facturación", "SQL - IA"]
+        ["Consultar Alumnos", "Gestionar Alumnos", "Inscripciones",  "Instrumentos", "Profesores", "Facturación", "Análisis", "SQL - IA"]
     )
 
     if option == "Consultar Alumnos":
@@ -212,12 +444,15 @@ if st.session_state.logged_in:
 
         if query_type == "Todos los alumnos":
             with st.form("mostrar_todos_los_alumnos"):
+                page = st.number_input("Página", min_value=1, key="all_students_page")
                 submit_all_students = st.form_submit_button("Mostrar todos los alumnos")
                 if submit_all_students:
-                    df_students = consultar_bbdd(student="")
+                    df_students, has_more = consultar_bbdd(student="", page=page)
                     if not df_students.empty:
                         st.write("Resultados de la consulta:")
                         st.dataframe(df_students, hide_index=True)
+                        if has_more:
+                            st.info(f"Hay más alumnos: consulte la página {page + 1}.")
                     else:
                         st.info("No se encontraron alumnos.")
 
@@ -226,7 +461,7 @@ if st.session_state.logged_in:
                 student_id = st.number_input("ID del Alumno", min_value=1, key="view_student_id1")
                 submit_student_by_id = st.form_submit_button("Mostrar alumno")
                 if submit_student_by_id:
-                    student = session.get(Student, student_id)
+                    student = run_operation(lambda db: db.get(Student, student_id), lambda api: api.get_student(student_id))
                     if student:
                         student_data = {
                             'id': student.id,
@@ -245,14 +480,17 @@ if st.session_state.logged_in:
         elif query_type == "Alumno por nombre":
             with st.form("search_student"):
                 search_name = st.text_input("Nombre del Alumno")
+                page = st.number_input("Página", min_value=1, key="search_students_page")
                 submitted = st.form_submit_button("Buscar")
                 
                 if submitted:
                     if search_name:
-                        df_students = consultar_bbdd(student=search_name)
+                        df_students, has_more = consultar_bbdd(student=search_name, page=page)
                         if not df_students.empty:
                             st.write("Resultados de la búsqueda:")
                             st.dataframe(df_students, hide_index=True)
+                            if has_more:
+                                st.info(f"Hay más resultados: consulte la página {page + 1}.")
                         else:
                             st.info("No se encontraron alumnos con ese nombre.")
                     else:
@@ -279,8 +517,8 @@ if st.session_state.logged_in:
                     if submitted:
 
 
-                        # Comprobamos si existe un alumno con el mismo nombre y edad
-                        existing_student = db_operation(lambda: session.query(Student).filter(
+                        # Comprobamos si existe un alumno con el mismo nombre y edad (en modo API lo comprueba la API al crearlo)
+                        existing_student = None if API_URL else db_operation(lambda db: db.query(Student).filter(
                             Student.first_name == first_name,
                             Student.last_name == last_name,
                             Student.age == age
@@ -298,7 +536,8 @@ if st.session_state.logged_in:
                                 mail=mail,
                                 family_id=family_id
                             )
-                            new_student = db_operation(lambda: create_student(session, student_data))
+                            new_student = run_operation(lambda db: create_student(db, student_data),
+                                                        lambda api: api.create_student(student_data.model_dump()))
                             if new_student:
                                 st.success(f"Alumno creado: {new_student.first_name} {new_student.last_name}")
 
@@ -313,7 +552,8 @@ if st.session_state.logged_in:
                     student_id = st.number_input("ID del Alumno a Actualizar", min_value=1)
                     buscar_submitted = st.form_submit_button("Buscar Alumno")
                     if buscar_submitted:
-                        student = db_operation(lambda: session.query(Student).filter(Student.id == student_id).first())
+                        student = run_operation(lambda db: db.query(Student).filter(Student.id == student_id).first(),
+                                                lambda api: api.get_student(student_id))
                         if student:
                             st.session_state.update_student = student
                             student_data = {
@@ -351,7 +591,9 @@ if st.session_state.logged_in:
                                 "mail": mail,
                                 "family_id": family_id
                             }
-                            updated_student = db_operation(lambda: update_student(session, st.session_state.update_student.id, student_data))
+                            update_id = st.session_state.update_student.id
+                            updated_student = run_operation(lambda db: update_student(db, update_id, student_data),
+                                                            lambda api: api.update_student(update_id, student_data))
                             if updated_student:
                                 st.success(f"Alumno actualizado: {updated_student.first_name} {updated_student.last_name}")
                                 st.session_state.update_student = updated_student
@@ -367,7 +609,7 @@ if st.session_state.logged_in:
                     student_id = st.number_input("ID del Alumno a Eliminar", min_value=0)
                     eliminar_submitted = st.form_submit_button("Eliminar Alumno")
                     if eliminar_submitted:
-                        result = db_operation(lambda: delete_student(session, student_id))
+                        result = run_operation(lambda db: delete_student(db, student_id), lambda api: api.delete_student(student_id))
                         if result:
                             st.success(f"Alumno con ID {student_id} borrado con éxito")
                         else:
@@ -384,23 +626,30 @@ if st.session_state.logged_in:
             view_option = st.radio("Selecciona una opción de visualización", ["Todas las inscripciones", "Por ID de alumno concreto"])
             
             if view_option == "Todas las inscripciones":
-                with st.form("mostrar_todas_las_inscripciones"):
-                    submit_all_inscriptions = st.form_submit_button("Mostrar todas las inscripciones")
-                    if submit_all_inscriptions:
-                        inscriptions = db_operation(lambda: get_inscriptions(session))
-                        if inscriptions:
-                            df_inscriptions = pd.DataFrame(inscriptions)
-                            df_inscriptions = df_inscriptions.sort_values('student_id')
-                            st.dataframe(df_inscriptions, hide_index=True)
-                        else:
-                            st.info("No se encontraron inscripciones.")
+                filter_cols = st.columns(3)
+                student_filter = filter_cols[0].text_input("Alumno", key="inscriptions_student")
+                instrument_filter = filter_cols[1].text_input("Instrumento", key="inscriptions_instrument")
+                level_filter = filter_cols[2].text_input("Nivel", key="inscriptions_level")
+                sort_cols = st.columns(2)
+                sort_labels = {"Fecha de inscripción": "registration_date", "Alumno": "student",
+                               "Instrumento": "instrument", "Nivel": "level", "ID de inscripción": "inscription_id"}
+                sort_label = sort_cols[0].selectbox("Ordenar por", list(sort_labels), key="inscriptions_sort")
+                descending = sort_cols[1].checkbox("Descendente", value=True, key="inscriptions_descending")
+                show_paged("inscriptions_page", fetch_inscriptions_page, {
+                    "sort": sort_labels[sort_label],
+                    "descending": descending,
+                    "student": student_filter,
+                    "instrument": instrument_filter,
+                    "level": level_filter,
+                })
             
             elif view_option == "Por ID de alumno concreto":
                 with st.form("mostrar_inscripciones_por_id"):
                     student_id = st.number_input("ID del Alumno", min_value=1, key="view_student_id")
                     submit_student_inscriptions = st.form_submit_button("Mostrar inscripciones del alumno")
                     if submit_student_inscriptions:
-                        student_inscriptions = db_operation(lambda: get_inscriptions_by_student(session, student_id))
+                        student_inscriptions = run_operation(lambda db: get_inscriptions_by_student(db, student_id),
+                                                             lambda api: api.get_inscriptions_by_student(student_id))
                         if student_inscriptions:
                             df_student_inscriptions = pd.DataFrame(student_inscriptions)
                             st.dataframe(df_student_inscriptions, hide_index=True)
@@ -419,12 +668,12 @@ if st.session_state.logged_in:
                         submit_create_inscription = st.form_submit_button("Crear Inscripción")
                         if submit_create_inscription:
                             # Vemos si existe el alumno
-                            student = db_operation(lambda: session.query(Student).get(student_id))
+                            student = run_operation(lambda db: db.get(Student, student_id), lambda api: api.get_student(student_id))
                             if not student:
                                 st.error(f"No se encontró un alumno con el ID {student_id}.")
                             else:
-                                # Comprobamos si ya existe la inscripción para el mismo alumno
-                                existing_inscription = db_operation(lambda: session.query(Inscription).filter(
+                                # Comprobamos si ya existe la inscripción para el mismo alumno (en modo API lo comprueba la API)
+                                existing_inscription = None if API_URL else db_operation(lambda db: db.query(Inscription).filter(
                                     Inscription.student_id == student_id,
                                     Inscription.level_id == level_id
                                 ).first())
@@ -437,12 +686,13 @@ if st.session_state.logged_in:
                                         level_id=level_id,
                                         registration_date=registration_date
                                     )
-                                    new_inscription = db_operation(lambda: create_inscription(session, inscription_data))
+                                    new_inscription = run_operation(lambda db: create_inscription(db, inscription_data),
+                                                                    lambda api: api.create_inscription(inscription_data.model_dump(mode="json")))
                                     if new_inscription:
                                         st.success(f"Inscripción creada para el alumno ID {new_inscription.student_id}")
                         
                     if st.button("Ayuda Niveles"):
-                        levels_df = db_operation(lambda: get_levels_with_instruments(session))
+                        levels_df = load_catalog(load_levels, LEVEL_TABLES, lambda api: api.list_levels())
                         if not levels_df.empty:
                             st.subheader("Niveles e Instrumentos Disponibles")
                             st.dataframe(levels_df, hide_index=True)
@@ -455,7 +705,8 @@ if st.session_state.logged_in:
                         inscription_id = st.number_input("ID de la Inscripción a Eliminar", min_value=1)
                         submit_delete_inscription = st.form_submit_button("Eliminar Inscripción")
                         if submit_delete_inscription:
-                            result = db_operation(lambda: delete_inscription(session, inscription_id))
+                            result = run_operation(lambda db: delete_inscription(db, inscription_id),
+                                                   lambda api: api.delete_inscription(inscription_id))
                             if result:
                                 st.success(f"Inscripción con ID {inscription_id} eliminada con éxito")
                             else:
@@ -475,11 +726,14 @@ if st.session_state.logged_in:
                     submit_calculate_invoice = st.form_submit_button("Calcular Facturación")
                     
                     if submit_calculate_invoice:
-                        student = session.get(Student, student_id)
+                        student = run_operation(lambda db: db.get(Student, student_id), lambda api: api.get_student(student_id))
                         if student:
-                            fee = db_operation(lambda: calculate_student_fees(session, student_id))
+                            fee = run_operation(lambda db: calculate_student_fees(db, student_id),
+                                                lambda api: api.get_student_fee(student_id))
                             if fee is not None:
-                                subscription_count = session.query(Inscription).filter_by(student_id=student_id).count()
+                                subscription_count = run_operation(
+                                    lambda db: db.query(Inscription).filter_by(student_id=student_id).count(),
+                                    lambda api: len(api.get_inscriptions_by_student(student_id)))
                                 df_fee = pd.DataFrame([{
                                     'student_id': student_id,
                                     'first_name': student.first_name,
@@ -494,25 +748,35 @@ if st.session_state.logged_in:
                             st.error("No se encontró un alumno con el ID proporcionado.")
 
             elif facturacion_option == "Facturación de la Escuela":
-                with st.form("generar_facturacion_escuela"):
-                    submit_generate_school_invoice = st.form_submit_button("Generar Facturación de la Escuela")
-                    
-                    if submit_generate_school_invoice:
-                        fee_report = db_operation(lambda: generate_fee_report(session))
-                        if fee_report:
-                            df_fee_report = pd.DataFrame(fee_report)
-                            
-                            total_sum = df_fee_report['total_fee'].sum()
-                            st.markdown(f"**Facturación Total de la Escuela: {total_sum:.2f} €/Mes**")
-
-                            st.write("Desglose de Facturación por Alumno:")
-                            st.dataframe(df_fee_report, hide_index=True)
-
-                            st.write("Estadísticas de Facturación:")
-                            st.write(f"Número de alumnos facturados: {len(df_fee_report)}")
-                            st.write(f"Facturación promedio por alumno: {df_fee_report['total_fee'].mean():.2f}")
-                            st.write(f"Facturación máxima: {df_fee_report['total_fee'].max():.2f}")
-                            st.write(f"Facturación mínima: {df_fee_report['total_fee'].min():.2f}")
+                if st.button("Calcular totales de la Escuela"):
+                    try:
+                        totals = fee_totals()
+                        st.markdown(f"**Facturación Total de la Escuela: {totals['total']:.2f} €/Mes**")
+                        st.write("Estadísticas de Facturación:")
+                        st.write(f"Número de alumnos facturados: {totals['count']}")
+                        st.write(f"Facturación promedio por alumno: {totals['mean']:.2f}")
+                        st.write(f"Facturación máxima: {totals['max']:.2f}")
+                        st.write(f"Facturación mínima: {totals['min']:.2f}")
+                    except Exception as e:
+                        st.error(f"Ha ocurrido un error: {str(e)}")
+
+                st.write("Desglose de Facturación por Alumno:")
+                filter_cols = st.columns(3)
+                student_filter = filter_cols[0].text_input("Alumno", key="fees_student")
+                family_labels = {"Todos": None, "Sí": True, "No": False}
+                family_label = filter_cols[1].selectbox("Descuento familiar", list(family_labels), key="fees_family")
+                min_inscriptions = filter_cols[2].number_input("Inscripciones mínimas", min_value=0, value=0, key="fees_min")
+                sort_cols = st.columns(2)
+                sort_labels = {"Alumno": "student", "ID de alumno": "student_id", "Número de inscripciones": "inscription_count"}
+                sort_label = sort_cols[0].selectbox("Ordenar por", list(sort_labels), key="fees_sort")
+                descending = sort_cols[1].checkbox("Descendente", key="fees_descending")
+                show_paged("fees_page", fetch_fee_report_page, {
+                    "sort": sort_labels[sort_label],
+                    "descending": descending,
+                    "student": student_filter,
+                    "family": family_labels[family_label],
+                    "min_inscriptions": int(min_inscriptions),
+                })
         else:
             st.warning("Solo el Administrador puede acceder a Facturación.")
 
@@ -531,13 +795,9 @@ if st.session_state.logged_in:
                 submitted = st.form_submit_button("Mostrar Instrumentos")
                 
                 if submitted:
-                    instruments = db_operation(lambda: session.query(Instrument).all())
-                    if instruments:
-                        df_instruments = pd.DataFrame([{
-                            'id': i.id,
-                            'name': i.name,
-                            'price': float(i.price)
-                        } for i in instruments])
+                    df_instruments = load_catalog(load_instruments, INSTRUMENT_TABLES, lambda api: [
+                        {'id': i['id'], 'name': i['name'], 'price': float(i['price'])} for i in api.list_instruments()])
+                    if not df_instruments.empty:
                         st.dataframe(df_instruments, hide_index=True)
                     else:
                         st.info("No se encontraron instrumentos.")
@@ -553,23 +813,16 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Crear Instrumento")
                         
                         if submitted:
-                            # Comprobar si ya existe un instrumento con el mismo nombre
-                            def check_existing_instrument():
-                                existing_instrument = session.query(Instrument).filter(Instrument.name == name).first()
-                                return existing_instrument
-
-                            existing_instrument = db_operation(check_existing_instrument)
+                            # Comprobar si ya existe un instrumento con el mismo nombre (en modo API lo comprueba la API)
+                            existing_instrument = None if API_URL else db_operation(
+                                lambda db: db.query(Instrument).filter(Instrument.name == name).first())
 
                             if existing_instrument:
                                 st.error(f"Ya existe un instrumento con el nombre '{name}'.")
                             else:
-                                def create_instrument_op():
-                                    new_instrument = Instrument(name=name, price=Decimal(str(price)))
-                                    session.add(new_instrument)
-                                    session.flush()
-                                    return new_instrument
-
-                                new_instrument = db_operation(create_instrument_op)
+                                new_instrument = run_operation(
+                                    lambda db: instruments_crud.create_instrument(db, name=name, price=Decimal(str(price))),
+                                    lambda api: api.create_instrument(name, price))
                                 if new_instrument:
                                     st.success(f"Instrumento creado: {new_instrument.name} - Precio: {new_instrument.price}")
 
@@ -583,14 +836,9 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Actualizar Precio")
                         
                         if submitted:
-                            def update_instrument_price_op():
-                                instrument = session.get(Instrument, instrument_id)
-                                if instrument:
-                                    instrument.price = Decimal(str(new_price))
-                                    session.flush()
-                                return instrument
-
-                            updated_instrument = db_operation(update_instrument_price_op)
+                            updated_instrument = run_operation(
+                                lambda db: instruments_crud.update_instrument(db, instrument_id, price=Decimal(str(new_price))),
+                                lambda api: api.update_instrument(instrument_id, price=new_price))
                             if updated_instrument:
                                 st.success(f"Precio actualizado para el instrumento {updated_instrument.name}: {updated_instrument.price}")
                             else:
@@ -603,24 +851,12 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Eliminar Instrumento")
                         
                         if submitted:
-                            def delete_instrument_op():
-                                instrument = session.get(Instrument, instrument_id)
-                                if instrument:
-                                    # Comprobar si el instrumento está asociado a algún nivel
-                                    associated_levels = session.query(Level).filter(Level.instruments_id == instrument_id).first()
-                                    if associated_levels:
-                                        return "associated"
-                                    session.delete(instrument)
-                                    session.flush()
-                                    return True
-                                return False
-
-                            result = db_operation(delete_instrument_op)
-                            if result == True:
+                            # Si el instrumento tiene niveles, la operación falla y se muestra el error
+                            result = run_operation(lambda db: instruments_crud.delete_instrument(db, instrument_id),
+                                                   lambda api: api.delete_instrument(instrument_id))
+                            if result:
                                 st.success(f"Instrumento con ID {instrument_id} eliminado con éxito")
-                            elif result == "associated":
-                                st.error(f"No se puede eliminar el instrumento con ID {instrument_id} porque está asociado a uno o más niveles.")
-                            else:
+                            elif result is False:
                                 st.error("Instrumento no encontrado")
             else:
                 st.warning("Solo el Administrador puede crear o actualizar instrumentos.")
@@ -636,15 +872,9 @@ if st.session_state.logged_in:
             with st.form("consultar_profesores"):
                 submitted = st.form_submit_button("Mostrar todos los profesores")
                 if submitted:
-                    teachers = db_operation(lambda: session.query(Teacher).all())
-                    if teachers:
-                        df_teachers = pd.DataFrame([{
-                            'id': t.id,
-                            'first_name': t.first_name,
-                            'last_name': t.last_name,
-                            'phone': t.phone,
-                            'mail': t.mail
-                        } for t in teachers])
+                    df_teachers = load_catalog(load_teachers, TEACHER_TABLES, lambda api: [
+                        {key: t[key] for key in ('id', 'first_name', 'last_name', 'phone', 'mail')} for t in api.list_teachers()])
+                    if not df_teachers.empty:
                         st.dataframe(df_teachers, hide_index=True)
                     else:
                         st.info("No se encontraron profesores.")
@@ -661,13 +891,9 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Crear Profesor")
                         
                         if submitted:
-                            def create_teacher_op():
-                                new_teacher = Teacher(first_name=first_name, last_name=last_name, phone=phone, mail=mail)
-                                session.add(new_teacher)
-                                session.flush()
-                                return new_teacher
-
-                            new_teacher = db_operation(create_teacher_op)
+                            teacher_data = CreateTeacher(first_name=first_name, last_name=last_name, phone=phone, mail=mail)
+                            new_teacher = run_operation(lambda db: teacher_crud.create_teacher(db, teacher_data),
+                                                        lambda api: api.create_teacher(teacher_data.model_dump()))
                             if new_teacher:
                                 st.success(f"Profesor creado: {new_teacher.first_name} {new_teacher.last_name}")
 
@@ -682,17 +908,10 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Actualizar Profesor")
                         
                         if submitted:
-                            def update_teacher_op():
-                                teacher = session.get(Teacher, teacher_id)
-                                if teacher:
-                                    teacher.first_name = first_name or teacher.first_name
-                                    teacher.last_name = last_name or teacher.last_name
-                                    teacher.phone = phone or teacher.phone
-                                    teacher.mail = mail or teacher.mail
-                                    session.flush()
-                                return teacher
-
-                            updated_teacher = db_operation(update_teacher_op)
+                            # Los campos vacíos no se modifican
+                            teacher_data = {"first_name": first_name, "last_name": last_name, "phone": phone, "mail": mail}
+                            updated_teacher = run_operation(lambda db: teacher_crud.update_teacher(db, teacher_id, teacher_data),
+                                                            lambda api: api.update_teacher(teacher_id, teacher_data))
                             if updated_teacher:
                                 st.success(f"Profesor actualizado: {updated_teacher.first_name} {updated_teacher.last_name}")
                             else:
@@ -705,15 +924,8 @@ if st.session_state.logged_in:
                         submitted = st.form_submit_button("Eliminar Profesor")
                         
                         if submitted:
-                            def delete_teacher_op():
-                                teacher = session.get(Teacher, teacher_id)
-                                if teacher:
-                                    session.delete(teacher)
-                                    session.flush()
-                                    return True
-                                return False
-
-                            result = db_operation(delete_teacher_op)
+                            result = run_operation(lambda db: teacher_crud.delete_teacher(db, teacher_id),
+                                                   lambda api: api.delete_teacher(teacher_id))
                             if result:
                                 st.success(f"Profesor con ID {teacher_id} eliminado con éxito")
                             else:
@@ -721,6 +933,40 @@ if st.session_state.logged_in:
             else:
                 st.warning("Solo el Administrador puede crear, actualizar o eliminar profesores.")
 
+    elif option == "Análisis":
+        if st.session_state.user_type == "administrator":
+            st.header("Análisis de la Escuela")
+            # Lecturas de las tablas de resumen, que mantiene actualizadas el proceso rollups.py
+            dashboard = run_operation(read_dashboard, lambda api: api.analytics())
+            if dashboard is not None:
+                if dashboard["updated_at"] is None:
+                    st.info("Los resúmenes aún no se han calculado: ejecute python rollups.py --rebuild.")
+                else:
+                    st.caption(f"Datos actualizados: {dashboard['updated_at']} (UTC)")
+
+                    st.subheader("Facturación por instrumento (€/Mes)")
+                    df_revenue = pd.DataFrame(dashboard["revenue_by_instrument"])
+                    if not df_revenue.empty:
+                        st.bar_chart(df_revenue.set_index("instrument")["revenue"])
+
+                    st.subheader("Inscripciones por nivel")
+                    df_levels = pd.DataFrame(dashboard["enrollment_by_level"])
+                    if not df_levels.empty:
+                        df_levels["nivel"] = df_levels["instrument"] + " - " + df_levels["level"]
+                        st.bar_chart(df_levels.set_index("nivel")["inscriptions"])
+
+                    st.subheader("Alumnos por profesor")
+                    df_teachers = pd.DataFrame(dashboard["students_by_teacher"])
+                    if not df_teachers.empty:
+                        st.bar_chart(df_teachers.set_index("teacher")["students"])
+
+                    st.subheader("Inscripciones por mes")
+                    df_months = pd.DataFrame(dashboard["registrations_by_month"])
+                    if not df_months.empty:
+                        st.line_chart(df_months.set_index("month")["registrations"])
+        else:
+            st.warning("Solo el Administrador puede acceder al Análisis.")
+
     elif option == "SQL - IA":
         if st.session_state.user_type == "administrator":
             st.header("Ejecutar Instrucciones SQL")
@@ -760,7 +1006,8 @@ if st.session_state.logged_in:
             if st.button("Generar SQL"):
                 if access_level == "Super-user" and st.session_state.super_user_authenticated:
                     if user_input:
-                        # Call the dame_sql function
+                        # Call the dame_sql function (langchain se carga solo al generar SQL)
+                        from simple_response import dame_sql
                         generated_sql = dame_sql(user_input)
                         # Store the generated SQL in session state
                         st.session_state.generated_sql = generated_sql
@@ -775,6 +1022,8 @@ if st.session_state.logged_in:
                 query = st.text_area("Introduzca su consulta SQL aquí:", 
                                      value=st.session_state.get('generated_sql', ''),
                                      height=150)
+                export_format = st.selectbox("Exportar el resultado completo", ("No exportar",) + EXPORT_FORMATS,
+                                             format_func=str.upper)
                 submit_execute_query = st.form_submit_button("Ejecutar Código")
 
                 if submit_execute_query:
@@ -785,45 +1034,32 @@ if st.session_state.logged_in:
                         elif access_level == "Super-user" and not st.session_state.super_user_authenticated:
                             st.error("Por favor, autentíquese como Super-user antes de ejecutar la consulta.")
                         else:
-                            try:
-                                # Execute the query using SQLAlchemy with a timeout
-                                from sqlalchemy.exc import TimeoutError
-                                
-                                # Start a transaction
-                                with session.begin():
-                                    result = session.execute(text(query.strip()), execution_options={"timeout": 10})
-                                    
-                                    # Check if the query returns rows
-                                    if result.returns_rows:
-                                        # Fetch results (limit to 1000 rows for safety)
-                                        data = result.fetchmany(1000)
-                                        
-                                        if data:
-                                            # Get column names
-                                            columns = result.keys()
-                                            
-                                            # Create a DataFrame
-                                            df = pd.DataFrame(data, columns=columns)
-                                            
-                                            # Display the results
-                                            st.subheader("Resultado de la Instrucción:")
-                                            st.dataframe(df, hide_index=True)
-                                            
-                                            # Display the number of rows returned
-                                            st.info(f"El código devolvió {len(df)} filas")
-                                        else:
-                                            st.info("La consulta no devolvió resultados.")
-                                    
-                                    else:
-                                        # For non-SELECT queries, show the number of affected rows
-                                        st.success(f"Consulta ejecutada con éxito. Filas afectadas: {result.rowcount}")
-                            
-                            except TimeoutError:
-                                st.error("La consulta excedió el tiempo límite de ejecución.")
-                            except Exception as e:
-                                st.error(f"Error al ejecutar la consulta: {str(e)}")
+                            # Antes de ejecutarla se estima su coste con EXPLAIN; las consultas caras necesitan
+                            # confirmación y las que superan el máximo se rechazan
+                            pending = {"query": query.strip(), "read_only": access_level == "Admin",
+                                       "export_format": None if export_format == "No exportar" else export_format}
+                            estimate = estimate_query(get_console_engine(pending["read_only"]), pending["query"])
+                            if estimate.verdict == "reject":
+                                st.error(estimate.message)
+                            elif estimate.verdict == "confirm":
+                                st.session_state.sql_console_pending = dict(pending, message=estimate.message)
+                            else:
+                                # La consulta se ejecuta en segundo plano con un cursor del lado del servidor
+                                submit_console_query(**pending)
                     else:
                         st.warning("Por favor, ingrese código SQL.")
+
+            pending = st.session_state.get('sql_console_pending')
+            if pending:
+                st.warning(f"{pending['message']} ¿Desea ejecutarla de todos modos?")
+                confirm_col, discard_col = st.columns(2)
+                if confirm_col.button("Ejecutar de todos modos"):
+                    submit_console_query(pending["query"], pending["export_format"], pending["read_only"])
+                elif discard_col.button("Descartar"):
+                    st.session_state.pop('sql_console_pending', None)
+                    st.rerun()
+
+            show_query_job(get_query_jobs().get(st.session_state.get('sql_console_job')))
         else:
             st.error("Solo el Administrador puede acceder a esta sección.")
 
@@ -834,5 +1070,3 @@ if st.sidebar.button("Logout"):
     st.session_state.super_user_authenticated = False
     st.rerun()
 
-# Close the session at the end
-session.close()
@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey
+from metrics import record_cache
+from deadlines import without_deadline
+
+'''
+Claves de idempotencia para las rutas POST de creación.
+
+Si el cliente envía la cabecera Idempotency-Key, la primera petición reserva la clave en la tabla
+idempotency_keys antes de ejecutar la operación y, al terminar, guarda la respuesta. Un reintento con la
+misma clave dentro del plazo de validez devuelve la respuesta guardada sin volver a consultar ni modificar
+las tablas del dominio. La reserva se apoya en la clave primaria, por lo que dos peticiones simultáneas con
+la misma clave no pueden ejecutar ambas la operación: la segunda recibe un 409.
+
+Mientras la operación está en curso, la reserva solo dura IDEMPOTENCY_LEASE_SECONDS: si el proceso se cae a
+mitad de la petición, un reintento posterior puede quedarse con la clave en lugar de recibir un 409 hasta que
+caduque. La reserva se libera (o se guarda la respuesta) fuera del plazo de la petición, para que un error por
+plazo vencido no deje la clave bloqueada.
+
+Configuración por variables de entorno:
+    IDEMPOTENCY_TTL_SECONDS: tiempo de validez de una clave (por defecto 86400, un día).
+    IDEMPOTENCY_LEASE_SECONDS: duración de la reserva de una petición en curso (por defecto 30).
+'''
+
+logger = logging.getLogger("music_app")
+
+IDEMPOTENCY_TTL = timedelta(seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")))
+# Mayor que el plazo de las peticiones de escritura (ver deadlines)
+IDEMPOTENCY_LEASE = timedelta(seconds=int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30")))
+
+# Cada cuántas reservas se eliminan las claves caducadas
+PURGE_EVERY = 100
+_reservations = 0
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def purge_expired(db: Session) -> int:
+    # Eliminar las claves caducadas
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.commit()
+    return result.rowcount
+
+
+def _reserve(db: Session, key_hash: str, request_hash: str) -> Optional[IdempotencyKey]:
+    # Reserva la clave; devuelve None si se ha reservado o el registro existente si ya estaba usada
+    global _reservations
+    _reservations += 1
+    if _reservations % PURGE_EVERY == 0:
+        purge_expired(db)
+
+    for _ in range(2):
+        now = datetime.utcnow()
+        existing = db.get(IdempotencyKey, key_hash, populate_existing=True)
+        if existing is not None:
+            if existing.expires_at > now:
+                return existing
+            # La clave ha caducado: se libera antes de volver a reservarla
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash, IdempotencyKey.expires_at <= now))
+            db.commit()
+        try:
+            db.execute(insert(IdempotencyKey).values(
+                key_hash=key_hash, request_hash=request_hash, expires_at=now + IDEMPOTENCY_LEASE))
+            db.commit()
+            return None
+        except IntegrityError:
+            # Otra petición ha reservado la misma clave entre la consulta y la inserción
+            db.rollback()
+    raise HTTPException(status_code=409, detail="No se pudo reservar la clave de idempotencia", headers={"Retry-After": "1"})
+
+
+def _store(db: Session, key_hash: str, status_code: int, body: Any):
+    # La respuesta se guarda aunque haya vencido el plazo de la petición: la operación ya se ha hecho
+    with without_deadline():
+        db.query(IdempotencyKey).filter(IdempotencyKey.key_hash == key_hash).update(
+            {"status_code": status_code, "response_body": json.dumps(body),
+             "expires_at": datetime.utcnow() + IDEMPOTENCY_TTL}
+        )
+        db.commit()
+
+
+def _release(db: Session, key_hash: str):
+    # Liberar la clave para que un reintento pueda volver a ejecutar la operación. Fuera del plazo: si la
+    # operación falló porque venció, el DELETE fallaría igual. Si no se puede liberar, la reserva caduca sola.
+    try:
+        with without_deadline():
+            db.rollback()
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash))
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("No se pudo liberar la clave de idempotencia: %s", e)
+
+
+def run_idempotent(db: Session, idempotency_key: Optional[str], scope: str, payload: BaseModel,
+                   operation: Callable[[], Any], response_model: type):
+    # Ejecuta la operación una sola vez por clave de idempotencia
+    if not idempotency_key:
+        return operation()
+
+    key_hash = _sha256(f"{scope}:{idempotency_key}")
+    request_hash = _sha256(payload.model_dump_json())
+
+    existing = _reserve(db, key_hash, request_hash)
+    record_cache("idempotency", existing is not None)
+    if existing is not None:
+        if existing.request_hash != request_hash:
+            logger.warning("Clave de idempotencia reutilizada con una petición distinta")
+            raise HTTPException(status_code=422, detail="La clave de idempotencia ya se usó con una petición distinta")
+        if existing.status_code is None:
+            raise HTTPException(status_code=409, detail="Hay una petición en curso con la misma clave de idempotencia",
+                                headers={"Retry-After": "1"})
+        logger.info("Respuesta idempotente reutilizada")
+        return JSONResponse(content=json.loads(existing.response_body), status_code=existing.status_code,
+                            headers={"Idempotent-Replayed": "true"})
+
+    try:
+        result = operation()
+    except HTTPException as e:
+        if e.status_code < 500:
+            # Los errores del cliente (por ejemplo, registro duplicado) también se reutilizan
+            _store(db, key_hash, e.status_code, {"detail": e.detail})
+        else:
+            _release(db, key_hash)
+        raise
+    except Exception:
+        _release(db, key_hash)
+        raise
+
+    body = jsonable_encoder(response_model.model_validate(result, from_attributes=True))
+    _store(db, key_hash, 200, body)
+    return body
@@ -0,0 +1,149 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from changes import db_version
+from metrics import record_cache
+from models import ReportJobRecord
+
+'''
+Cola de trabajos en segundo plano para informes costosos (por ejemplo, el informe de tarifas).
+
+Los trabajos se guardan en la tabla report_jobs, así que cualquier worker de la API puede devolver el estado
+y el resultado de un trabajo, lo haya creado él u otro. Cada trabajo se ejecuta en el pool de hilos del
+worker que lo recibe, con concurrencia limitada y su propia sesión de base de datos.
+
+Cada trabajo se identifica por su tipo, sus parámetros y la versión en la base de datos de las tablas de las
+que depende (ver changes.db_version). Mientras esa versión no cambie, una petición del mismo informe recibe
+el trabajo en curso o el resultado ya calculado, también si la pide otro worker; cualquier cambio confirmado
+en esas tablas, desde la API o desde la GUI, hace que se calcule de nuevo. Un trabajo que no termina en
+REPORT_JOB_TIMEOUT_SECONDS (p. ej. porque su worker se reinició) se da por fallido.
+
+Configuración por variables de entorno:
+    REPORT_WORKERS: trabajos ejecutados a la vez en cada worker (por defecto 2).
+    REPORT_JOB_TIMEOUT_SECONDS: tiempo máximo de un trabajo (por defecto 300).
+    REPORT_JOBS_RETENTION_SECONDS: tiempo que se conservan los trabajos (por defecto 86400, un día).
+'''
+
+logger = logging.getLogger("music_app")
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def snapshot(job: ReportJobRecord) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "result": json.loads(job.result) if job.result is not None else None,
+        "error": job.error,
+    }
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = 2, timeout: float = 300.0, retention: float = 86400.0):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._timeout = timedelta(seconds=timeout)
+        self._retention = timedelta(seconds=retention)
+        self._lock = threading.Lock()
+        # Trabajos lanzados por este proceso que aún no han terminado (para esperarlos en los tests)
+        self._local: Dict[str, threading.Event] = {}
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(
+            max_workers=int(os.getenv("REPORT_WORKERS", "2")),
+            timeout=float(os.getenv("REPORT_JOB_TIMEOUT_SECONDS", "300")),
+            retention=float(os.getenv("REPORT_JOBS_RETENTION_SECONDS", "86400")),
+        )
+
+    def _expire(self, db: Session, job: ReportJobRecord) -> ReportJobRecord:
+        # Un trabajo sin terminar después del tiempo máximo ya no va a terminar (su worker se ha detenido)
+        if job.status in (PENDING, RUNNING) and datetime.now() - job.created_at > self._timeout:
+            job.status = FAILED
+            job.error = "El informe no terminó a tiempo"
+            job.finished_at = datetime.now()
+            db.commit()
+        return job
+
+    def submit(self, db: Session, kind: str, operation: Callable, session_factory: Callable,
+               tables: Tuple[str, ...], params: Tuple = ()) -> ReportJobRecord:
+        '''
+        Encola operation(session) y devuelve su trabajo. Si hay un trabajo igual en curso o un resultado
+        calculado con la versión actual de las tablas, se devuelve ese trabajo en lugar de crear otro.
+        '''
+        version = db_version(db, tables)
+        cache_key = hashlib.sha256(json.dumps([kind, list(params), list(version)], default=str).encode()).hexdigest()
+        existing = db.execute(
+            select(ReportJobRecord)
+            .where(ReportJobRecord.cache_key == cache_key, ReportJobRecord.status != FAILED)
+            .order_by(ReportJobRecord.created_at.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        if existing is not None and self._expire(db, existing).status != FAILED:
+            # Un trabajo compartido también evita recalcular el informe
+            record_cache(f"report_{kind}", True)
+            return existing
+        record_cache(f"report_{kind}", False)
+
+        db.execute(delete(ReportJobRecord).where(ReportJobRecord.created_at < datetime.now() - self._retention))
+        job = ReportJobRecord(id=uuid.uuid4().hex, kind=kind, cache_key=cache_key, status=PENDING,
+                              created_at=datetime.now())
+        db.add(job)
+        db.commit()
+        with self._lock:
+            self._local[job.id] = threading.Event()
+        self._executor.submit(self._run, job.id, operation, session_factory)
+        return job
+
+    def get(self, db: Session, job_id: str) -> Optional[ReportJobRecord]:
+        job = db.get(ReportJobRecord, job_id, populate_existing=True)
+        return self._expire(db, job) if job is not None else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> bool:
+        # Espera a un trabajo lanzado por este proceso; True si ha terminado
+        with self._lock:
+            done = self._local.get(job_id)
+        return done is None or done.wait(timeout)
+
+    def _run(self, job_id: str, operation: Callable, session_factory: Callable):
+        session = session_factory()
+        try:
+            job = session.get(ReportJobRecord, job_id)
+            job.status = RUNNING
+            session.commit()
+            try:
+                job.result = json.dumps(jsonable_encoder(operation(session)))
+                job.status = DONE
+            except Exception as e:
+                session.rollback()
+                logger.error("Error en el trabajo %s %s: %s", job.kind, job.id, getattr(e, 'detail', str(e)))
+                job = session.get(ReportJobRecord, job_id)
+                job.error = str(getattr(e, "detail", e))
+                job.status = FAILED
+            job.finished_at = datetime.now()
+            session.commit()
+        except Exception:
+            logger.exception("No se pudo guardar el estado del trabajo %s", job_id)
+        finally:
+            session.close()
+            with self._lock:
+                done = self._local.pop(job_id, None)
+            if done is not None:
+                done.set()
+
+
+# Cola compartida por las rutas de informes
+report_queue = JobQueue.from_env()
@@ -1,38 +1,199 @@
+import os
+import zlib
+import queue
+import atexit
+import random
 import logging
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 """
 Configura y devuelve un logger para la aplicación EscuelaMusical.
 
-Este logger registra mensajes en un archivo y en la consola con diferentes niveles de severidad y formatos.
+Los mensajes no se escriben en el hilo que los genera: el logger solo los deja en una cola (QueueHandler) y un
+hilo en segundo plano (QueueListener) los escribe en un archivo que rota por tamaño y por tiempo, y muestra
+por consola los de nivel ERROR o superior. Si la cola se llena, los mensajes nuevos se descartan en lugar de
+bloquear la petición.
+
+Llamar a setup_logger() varias veces no duplica los manejadores.
+
+Los mensajes llevan el identificador de la petición en curso (ver requestlog). Los mensajes de éxito (nivel
+INFO o inferior) se muestrean con LOG_SAMPLE_RATE, decidiendo por petición para conservar o descartar todos
+los de una misma petición; los avisos y errores se conservan siempre. El log de peticiones (una línea JSON
+por petición) se escribe en su propio archivo, REQUEST_LOG_FILE.
+
+Cada proceso rota sus propios archivos. Con varios workers (WEB_CONCURRENCY > 1, ver server.py) cada uno
+escribe en archivos con su pid en el nombre (music_app.<pid>.log, requests.<pid>.log), para que no roten ni
+renombren a la vez el mismo archivo.
+
+Configuración por variables de entorno:
+    LOG_FILE: archivo de log (por defecto music_app.log).
+    LOG_LEVEL: nivel mínimo de los mensajes (por defecto INFO).
+    LOG_CONSOLE_LEVEL: nivel mínimo de los mensajes por consola (por defecto ERROR).
+    LOG_MAX_BYTES: tamaño máximo del archivo antes de rotarlo (por defecto 10 MB; 0 desactiva la rotación por tamaño).
+    LOG_ROTATE_WHEN, LOG_ROTATE_INTERVAL: rotación por tiempo (por defecto cada día a medianoche).
+    LOG_BACKUP_COUNT: archivos rotados que se conservan (por defecto 14).
+    LOG_QUEUE_SIZE: mensajes pendientes de escribir como máximo (por defecto 10000; 0 sin límite).
+    LOG_SAMPLE_RATE: fracción de los mensajes de éxito que se conservan (por defecto 1, todos).
+    REQUEST_LOG_FILE: archivo del log de peticiones (por defecto requests.log).
 
 Returns:
     logger (logging.Logger): El logger configurado.
 """
 
+LOGGER_NAME = "music_app"
+REQUEST_LOGGER_NAME = "music_app.requests"
+
+# Identificador de la petición en curso ("-" fuera de una petición, por ejemplo en la GUI)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_listener = None
+
+
+class SizeAndTimeRotatingFileHandler(TimedRotatingFileHandler):
+    '''Rota el archivo al cambiar de periodo (como TimedRotatingFileHandler) o al superar max_bytes.'''
+
+    def __init__(self, filename, max_bytes=0, when="midnight", interval=1, backup_count=0, encoding=None):
+        super().__init__(filename, when=when, interval=interval, backupCount=backup_count, encoding=encoding)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            message = f"{self.format(record)}\n"
+            self.stream.seek(0, 2)
+            return self.stream.tell() + len(message) >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name):
+        # Varias rotaciones por tamaño en el mismo periodo: se numeran en lugar de sobrescribirse
+        name, counter = default_name, 1
+        while os.path.exists(name):
+            name = f"{default_name}.{counter}"
+            counter += 1
+        return super().rotation_filename(name)
+
+
+class DroppingQueueHandler(QueueHandler):
+    '''QueueHandler que descarta los mensajes cuando la cola está llena en lugar de bloquear o fallar.'''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestIdFilter(logging.Filter):
+    '''Añade a cada mensaje el identificador de la petición en curso.'''
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    '''Conserva solo una fracción de los mensajes de nivel INFO o inferior; el resto de niveles pasa siempre.'''
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO or record.name == REQUEST_LOGGER_NAME:
+            return True
+        request_id = getattr(record, "request_id", "-")
+        if request_id == "-":
+            return random.random() < self.rate
+        # Misma decisión para todos los mensajes de una petición
+        return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < self.rate
+
+
+class _ExcludeLogger(logging.Filter):
+    def filter(self, record):
+        return not record.name.startswith(self.name)
+
+
+def _process_file(filename: str) -> str:
+    # Con varios workers, un archivo por proceso: music_app.log -> music_app.<pid>.log
+    if int(os.getenv("WEB_CONCURRENCY", "1")) <= 1:
+        return filename
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{os.getpid()}{extension}"
+
+
+def _file_handler(filename: str) -> logging.Handler:
+    handler = SizeAndTimeRotatingFileHandler(
+        _process_file(filename),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        when=os.getenv("LOG_ROTATE_WHEN", "midnight"),
+        interval=int(os.getenv("LOG_ROTATE_INTERVAL", "1")),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "14")),
+        encoding="utf-8",
+    )
+    handler.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    return handler
+
+
 def setup_logger():
-    # Crear un logger con el nombre 'music_app'
-    logger = logging.getLogger('music_app')
-    # Configurar el nivel de severidad del logger a DEBUG
-    logger.setLevel(logging.DEBUG)
-
-    # Crear un manejador de archivo que registra mensajes en 'music_app.log' con codificación UTF-8
-    fh = logging.FileHandler('music_app.log', encoding='utf-8')
-    # Configurar el nivel de severidad del manejador de archivo a DEBUG
-    fh.setLevel(logging.DEBUG)
-    
-    # Crear un manejador de consola que imprime mensajes de nivel ERROR y superior
-    ch = logging.StreamHandler()
-    # Configurar el nivel de severidad del manejador de consola a ERROR
-    ch.setLevel(logging.ERROR)
-    
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    logger.setLevel(level)
+
     # Definir el formato de los mensajes del log
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    # Asignar el formato definido al manejador de archivo
-    fh.setFormatter(formatter)
-    
-    # Agregar los manejadores (archivo y consola) al logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(request_id)s] - %(message)s')
+    file_handler = _file_handler(os.getenv("LOG_FILE", "music_app.log"))
+    file_handler.setFormatter(formatter)
+    file_handler.addFilter(_ExcludeLogger(REQUEST_LOGGER_NAME))
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(os.getenv("LOG_CONSOLE_LEVEL", "ERROR").upper())
+    console_handler.setFormatter(formatter)
+    console_handler.addFilter(_ExcludeLogger(REQUEST_LOGGER_NAME))
+    # El log de peticiones ya viene en JSON: se escribe tal cual
+    request_handler = _file_handler(os.getenv("REQUEST_LOG_FILE", "requests.log"))
+    request_handler.setFormatter(logging.Formatter('%(message)s'))
+    request_handler.addFilter(logging.Filter(REQUEST_LOGGER_NAME))
+    # El log de peticiones se conserva aunque LOG_LEVEL sea más restrictivo
+    request_handler.setLevel(logging.INFO)
+    logging.getLogger(REQUEST_LOGGER_NAME).setLevel(logging.INFO)
+
+    # El logger solo encola; el listener escribe en los archivos y en la consola desde su propio hilo
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1"))))
+    logger.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, file_handler, console_handler, request_handler, respect_handler_level=True)
+    _listener.start()
 
     # Devolver el logger configurado
-    return logger
\ No newline at end of file
+    return logger
+
+
+def shutdown_logger():
+    # Escribe los mensajes pendientes, cierra los archivos y quita el manejador de la cola
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            logger.removeHandler(handler)
+    _listener = None
+
+
+atexit.register(shutdown_logger)
@@ -1,12 +1,19 @@
 from fastapi import FastAPI
 from routes import router
-from db import engine
+from db import engine, SessionLocal
 from models import Base
 from logging_config import setup_logger
+from compression import CompressionMiddleware
+from admission import AdmissionControlMiddleware, admission_controller
+from deadlines import DeadlineMiddleware
+from requestlog import RequestLogMiddleware
+from metrics import MetricsMiddleware, metrics_enabled, register_pool_metrics, register_admission_metrics
+from tracing import TracingMiddleware, tracing_enabled
+from feed import change_broadcaster
 
 '''
 Este código configura una aplicación de FastAPI con soporte de logging y gestión de base de datos. 
-Cuando se ejecuta, inicia un servidor Uvicorn que sirve la aplicación en http://127.0.0.1:8000.
+Cuando se ejecuta, inicia un servidor Uvicorn que sirve la aplicación en http://127.0.0.1:8000 (ver server.py).
 '''
 app = FastAPI(title="API Escuela de música")
 
@@ -16,9 +23,36 @@ logger = setup_logger()
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Canal de cambios en tiempo real: lee los cambios que cualquier proceso guarda en change_log (ver feed.py)
+change_broadcaster.start(SessionLocal)
+
+# Comprimir las respuestas grandes según Accept-Encoding
+app.add_middleware(CompressionMiddleware, **CompressionMiddleware.options_from_env())
+
+# Limitar las peticiones simultáneas por clase de ruta (responde 503 si la cola está llena)
+app.add_middleware(AdmissionControlMiddleware)
+
+# Plazo máximo por petición, propagado a la base de datos como timeout de sentencia
+app.add_middleware(DeadlineMiddleware)
+
+# Métricas de Prometheus (GET /metrics): peticiones, latencia, pool de conexiones y control de admisión
+register_pool_metrics(engine)
+register_admission_metrics(admission_controller)
+if metrics_enabled():
+    app.add_middleware(MetricsMiddleware)
+
+# Trazas por petición en formato OTLP (TRACING_ENABLED=1, ver tracing.py)
+if tracing_enabled():
+    app.add_middleware(TracingMiddleware)
+
+# Una línea JSON por petición (ruta, estado, latencia, sentencias SQL, X-Request-ID); va la última para medir
+# también las peticiones rechazadas por los middlewares anteriores
+app.add_middleware(RequestLogMiddleware)
+
 # Include the API router
 app.include_router(router, prefix="")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # La configuración del servidor (workers, bucle, keep-alive...) está en server.py
+    from server import run
+    run()
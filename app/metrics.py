@@ -0,0 +1,281 @@
+import os
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from admission import classify_request
+
+'''
+Métricas de la aplicación en formato de texto de Prometheus, publicadas en GET /metrics.
+
+Registro propio y mínimo (contadores, gauges e histogramas con etiquetas) para no añadir dependencias: cada
+observación es una búsqueda en un diccionario y una suma bajo un lock, por lo que se puede dejar activo en
+producción (ver benchmarks/bench_metrics.py). Los gauges que dependen de otro estado (pool de conexiones,
+control de admisión, ratio de aciertos de caché) se calculan al leer /metrics.
+
+Cada proceso tiene su propio registro: con varios workers, cada scrape devuelve las métricas del worker que
+atiende la petición.
+
+Configuración por variables de entorno:
+    METRICS_ENABLED: 0 desactiva el middleware de métricas HTTP (por defecto 1).
+'''
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Tuple[str, ...] = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    '''Gauge con valores fijados (inc/dec/set) o calculados al leerlo con una función (callback).'''
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()):
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self) -> List[str]:
+        if self._callback is not None:
+            items = list(self._callback())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteo por bucket (sin acumular, el último es +Inf), suma, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, labels: Tuple[str, ...] = ()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labels)
+
+    def timed(self, func: Callable) -> Callable:
+        # Decorador que mide la duración de cada llamada
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso por clase de ruta", ("route_class",)))
+DB_STATEMENTS = registry.register(Counter(
+    "db_statements_total", "Sentencias SQL ejecutadas por tipo", ("operation",)))
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total", "Consultas a las cachés de la aplicación", ("cache", "result")))
+FEE_REPORT_DURATION = registry.register(Histogram(
+    "fee_report_duration_seconds", "Duración de la generación del informe de tarifas",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc((cache, "hit" if hit else "miss"))
+
+
+def _cache_hit_ratios():
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in list(CACHE_REQUESTS._values.items()):
+        totals.setdefault(cache, [0, 0])[0 if result == "hit" else 1] += value
+    for cache, (hits, misses) in totals.items():
+        yield (cache,), hits / (hits + misses) if hits + misses else 0.0
+
+
+registry.register(Gauge("cache_hit_ratio", "Fracción de aciertos de cada caché", ("cache",), callback=_cache_hit_ratios))
+
+
+def register_pool_metrics(engine):
+    # Gauges del pool de conexiones del engine (no todos los pools, p. ej. el de SQLite, exponen estos datos)
+    pool = engine.pool
+
+    def stat(method: str):
+        def callback():
+            # En SingletonThreadPool (SQLite en memoria) size es un atributo entero, no un método
+            value = getattr(pool, method, None)
+            if callable(value):
+                yield (), value()
+        return callback
+
+    registry.register(Gauge("db_pool_size", "Tamaño configurado del pool", callback=stat("size")))
+    registry.register(Gauge("db_pool_checked_out", "Conexiones en uso", callback=stat("checkedout")))
+    registry.register(Gauge("db_pool_checked_in", "Conexiones libres en el pool", callback=stat("checkedin")))
+    registry.register(Gauge("db_pool_overflow", "Conexiones abiertas por encima del tamaño del pool", callback=stat("overflow")))
+
+
+def register_admission_metrics(controller):
+    def snapshot(field: str):
+        def callback():
+            for name, gate in controller.gates.items():
+                yield (name,), getattr(gate, field)
+        return callback
+
+    registry.register(Gauge("admission_in_flight", "Peticiones admitidas en curso", ("route_class",), callback=snapshot("in_flight")))
+    registry.register(Gauge("admission_queued", "Peticiones esperando en la cola de admisión", ("route_class",), callback=snapshot("queued")))
+    registry.register(Gauge("admission_rejected", "Peticiones rechazadas con 503 desde el arranque", ("route_class",), callback=snapshot("rejected")))
+
+
+_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    keyword = statement.lstrip()[:6].upper()
+    DB_STATEMENTS.inc((keyword if keyword in _OPERATIONS else "OTHER",))
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route_class = (classify_request(method, scope["path"]),)
+        status = {"code": 500}
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(route_class)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec(route_class)
+            # Plantilla de la ruta para acotar el número de series; las rutas inexistentes se agrupan
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - started, (method, route))
+            HTTP_REQUESTS.inc((method, route, str(status["code"])))
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "1") != "0"
@@ -1,8 +1,11 @@
-from sqlalchemy import ForeignKey, DECIMAL, Date, Boolean, String, Integer
+from sqlalchemy import ForeignKey, DECIMAL, Date, DateTime, Boolean, String, Integer, Text, Index, event, delete, insert, select
 from sqlalchemy.orm import relationship, declarative_base, Mapped, mapped_column
+from sqlalchemy.dialects.mysql import LONGTEXT
 
 from typing import List
-from datetime import date
+from datetime import date, datetime
+
+from search import search_tokens
 
 Base = declarative_base()
 
@@ -29,7 +32,53 @@ class Student(Base):
     mail: Mapped[str] = mapped_column(String(50))
     family_id: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
 
-    inscriptions: Mapped[List["Inscription"]] = relationship(back_populates="student", cascade="all, delete-orphan")
+    inscriptions: Mapped[List["Inscription"]] = relationship(back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Orden por apellido del informe de tarifas paginado (keyset por apellido e id)
+        Index('ix_students_last_name_id', 'last_name', 'id'),
+    )
+
+"""
+Palabra normalizada del nombre o del apellido de un estudiante (ver search.py). Las búsquedas por nombre
+se resuelven con el índice de token: token LIKE 'mar%' recorre solo el rango de las palabras que empiezan
+por "mar".
+
+Atributos:
+    token (str): Palabra en minúsculas y sin acentos.
+    student_id (int): ID del estudiante.
+"""
+class StudentSearchToken(Base):
+    __tablename__ = 'student_search_tokens'
+    # SQLite solo usa el índice para LIKE si la columna no distingue mayúsculas (las palabras ya están en minúsculas)
+    token: Mapped[str] = mapped_column(String(50).with_variant(String(50, collation="NOCASE"), "sqlite"), primary_key=True)
+    student_id: Mapped[int] = mapped_column(ForeignKey('students.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+    __table_args__ = (
+        # PostgreSQL solo usa el índice para LIKE con text_pattern_ops (salvo con la collation C)
+        Index('ix_student_search_tokens_pattern', 'token', postgresql_ops={'token': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+def index_student_name(connection, student_id: int, first_name: str, last_name: str):
+    # Sustituye las palabras de búsqueda del estudiante por las de su nombre actual
+    table = StudentSearchToken.__table__
+    connection.execute(delete(table).where(table.c.student_id == student_id))
+    tokens = search_tokens(f"{first_name} {last_name}")
+    if tokens:
+        connection.execute(insert(table), [{"token": token, "student_id": student_id} for token in tokens])
+
+# Condiciones de la búsqueda por nombre: para cada término, los estudiantes con alguna palabra que empiece por él
+def name_search_filter(query: str | None) -> list:
+    return [
+        Student.id.in_(select(StudentSearchToken.student_id).where(StudentSearchToken.token.like(f"{token}%")))
+        for token in search_tokens(query or "")
+    ]
+
+# Las palabras de búsqueda se recalculan en cada alta o modificación hecha con el ORM
+@event.listens_for(Student, "after_insert")
+@event.listens_for(Student, "after_update")
+def _update_search_tokens(mapper, connection, target):
+    index_student_name(connection, target.id, target.first_name, target.last_name)
 
 '''
     Modelo de profesor que representa a los profesores en la base de datos.
@@ -51,7 +100,7 @@ class Teacher(Base):
     phone: Mapped[str] = mapped_column(String(50))
     mail: Mapped[str] = mapped_column(String(50))
 
-    instruments: Mapped[List["Instrument"]] = relationship(secondary="teachers_instruments", back_populates="teachers")
+    instruments: Mapped[List["Instrument"]] = relationship(secondary="teachers_instruments", back_populates="teachers", passive_deletes=True)
 
 """
 Modelo de instrumento que representa a los instrumentos en la base de datos.
@@ -70,9 +119,11 @@ class Instrument(Base):
     name: Mapped[str] = mapped_column(String(50), nullable=False)
     price: Mapped[DECIMAL] = mapped_column(DECIMAL)
 
-    levels: Mapped[List["Level"]] = relationship(back_populates="instrument")
-    packs: Mapped[List["Pack"]] = relationship(secondary="packs_instruments", back_populates="instruments")
-    teachers: Mapped[List["Teacher"]] = relationship(secondary="teachers_instruments", back_populates="instruments")
+    # Los niveles impiden borrar el instrumento (ON DELETE RESTRICT); las asociaciones con packs y
+    # profesores se borran en la propia base de datos (ON DELETE CASCADE)
+    levels: Mapped[List["Level"]] = relationship(back_populates="instrument", passive_deletes="all")
+    packs: Mapped[List["Pack"]] = relationship(secondary="packs_instruments", back_populates="instruments", passive_deletes=True)
+    teachers: Mapped[List["Teacher"]] = relationship(secondary="teachers_instruments", back_populates="instruments", passive_deletes=True)
 
 """
 Modelo de nivel que representa a los niveles de aprendizaje de un instrumento en la base de datos.
@@ -87,7 +138,7 @@ Atributos:
 class Level(Base):
     __tablename__ = 'levels'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    instruments_id: Mapped[int] = mapped_column(ForeignKey('instruments.id'))
+    instruments_id: Mapped[int] = mapped_column(ForeignKey('instruments.id', ondelete='RESTRICT'))
     level: Mapped[str] = mapped_column(String(50), nullable=False)
 
     instrument: Mapped["Instrument"] = relationship(back_populates="levels")
@@ -110,7 +161,7 @@ class Pack(Base):
     discount_1: Mapped[DECIMAL] = mapped_column(DECIMAL)
     discount_2: Mapped[DECIMAL] = mapped_column(DECIMAL)
 
-    instruments: Mapped[List["Instrument"]] = relationship(secondary="packs_instruments", back_populates="packs")
+    instruments: Mapped[List["Instrument"]] = relationship(secondary="packs_instruments", back_populates="packs", passive_deletes=True)
 
 """
 Modelo de relación muchos a muchos entre paquetes e instrumentos.
@@ -123,8 +174,8 @@ Atributos:
 class PacksInstruments(Base):
     __tablename__ = 'packs_instruments'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    instrument_id: Mapped[int] = mapped_column(ForeignKey('instruments.id'))
-    packs_id: Mapped[int] = mapped_column(ForeignKey('packs.id'))
+    instrument_id: Mapped[int] = mapped_column(ForeignKey('instruments.id', ondelete='CASCADE'))
+    packs_id: Mapped[int] = mapped_column(ForeignKey('packs.id', ondelete='CASCADE'))
 
 """
 Modelo de inscripción que representa a las inscripciones de los estudiantes en los niveles de instrumentos.
@@ -140,13 +191,20 @@ Atributos:
 class Inscription(Base):
     __tablename__ = 'inscriptions'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    student_id: Mapped[int] = mapped_column(ForeignKey('students.id'))
+    student_id: Mapped[int] = mapped_column(ForeignKey('students.id', ondelete='CASCADE'))
     level_id: Mapped[int] = mapped_column(ForeignKey('levels.id'))
     registration_date: Mapped[date] = mapped_column(Date)
 
     student: Mapped["Student"] = relationship(back_populates="inscriptions")
     level: Mapped["Level"] = relationship(back_populates="inscriptions")
 
+    __table_args__ = (
+        # Orden por defecto de las inscripciones paginadas (keyset por fecha e id)
+        Index('ix_inscriptions_registration_date_id', 'registration_date', 'id'),
+        # Inscripciones de un estudiante (fichas, tarifas, borrados en cascada)
+        Index('ix_inscriptions_student_id', 'student_id'),
+    )
+
 """
 Modelo de relación muchos a muchos entre profesores e instrumentos.
 
@@ -158,6 +216,207 @@ Atributos:
 class TeachersInstruments(Base):
     __tablename__ = 'teachers_instruments'
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    teacher_id: Mapped[int] = mapped_column(ForeignKey('teachers.id'))
-    instrument_id: Mapped[int] = mapped_column(ForeignKey('instruments.id'))
+    teacher_id: Mapped[int] = mapped_column(ForeignKey('teachers.id', ondelete='CASCADE'))
+    instrument_id: Mapped[int] = mapped_column(ForeignKey('instruments.id', ondelete='CASCADE'))
+
+"""
+Modelo de clave de idempotencia para las peticiones POST de creación.
+
+Atributos:
+    key_hash (str): Hash SHA-256 de la ruta y la cabecera Idempotency-Key.
+    request_hash (str): Hash SHA-256 del cuerpo de la petición original.
+    status_code (int | None): Código de la respuesta guardada; None mientras la petición está en curso.
+    response_body (str | None): Respuesta guardada en formato JSON.
+    expires_at (datetime): Fecha (UTC) a partir de la cual la clave caduca.
+"""
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    key_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[str | None] = mapped_column(Text, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+"""
+Modelo de evento pendiente de publicar (outbox) para los consumidores externos (contabilidad, mensajería).
+Se escribe en la misma transacción que el cambio que describe.
+
+Atributos:
+    id (int): Identificador creciente del evento; los consumidores lo usan para descartar duplicados.
+    event_type (str): Tipo de evento, por ejemplo "inscription.created".
+    aggregate (str): Entidad a la que se refiere el evento (student, inscription, instrument, pack).
+    aggregate_id (int): Identificador de la entidad.
+    payload (str): Datos del evento en formato JSON.
+    created_at (datetime): Fecha (UTC) de creación del evento.
+"""
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    event_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    aggregate: Mapped[str] = mapped_column(String(50), nullable=False)
+    aggregate_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+"""
+Modelo de cambio confirmado en una tabla (ver changes.py). Se escribe en la misma transacción que el cambio,
+desde cualquier proceso (workers de la API, GUI); el canal de cambios en tiempo real (feed.py) lo lee por id.
+
+Atributos:
+    id (int): Identificador creciente del cambio; es el id de evento del canal de cambios.
+    entity (str): Tabla modificada.
+    entity_id (int | None): Id del registro (None si no se conoce, p. ej. en un INSERT masivo).
+    op (str): Operación: created, updated o deleted.
+    version (int): Versión de la tabla después del cambio (ver changes.db_version).
+    created_at (datetime): Fecha (UTC) del cambio.
+"""
+class ChangeLogEntry(Base):
+    __tablename__ = 'change_log'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    entity: Mapped[str] = mapped_column(String(64), nullable=False)
+    entity_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    op: Mapped[str] = mapped_column(String(10), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+"""
+Modelo de cursor de un relay del outbox: último evento entregado a un destino.
+
+Atributos:
+    name (str): Nombre del relay (uno por destino).
+    last_event_id (int): Id del último evento entregado.
+    updated_at (datetime | None): Fecha (UTC) de la última entrega.
+"""
+class OutboxCursor(Base):
+    __tablename__ = 'outbox_cursors'
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_event_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+"""
+Modelos de las tablas de resumen (rollups) del panel de análisis (ver rollups.py). No se modifican desde
+la API: se recalculan a partir de las tablas de la escuela.
+
+RollupInscription: una fila por inscripción con lo que aporta a la facturación mensual.
+
+Atributos:
+    inscription_id (int): Identificador de la inscripción.
+    student_id (int): Identificador del estudiante.
+    instrument_id (int): Identificador del instrumento.
+    level_id (int): Identificador del nivel.
+    month (str): Mes de inscripción (AAAA-MM).
+    amount (Decimal): Importe mensual de la inscripción con los descuentos de pack y familiar.
+"""
+class RollupInscription(Base):
+    __tablename__ = 'rollup_inscriptions'
+    inscription_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    student_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    instrument_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    level_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    month: Mapped[str] = mapped_column(String(7), nullable=False, index=True)
+    amount: Mapped[DECIMAL] = mapped_column(DECIMAL(10, 2), nullable=False)
+
+"""
+RollupInstrument: facturación e inscripciones por instrumento.
+
+Atributos:
+    instrument_id (int): Identificador del instrumento.
+    name (str): Nombre del instrumento.
+    inscriptions (int): Número de inscripciones.
+    students (int): Número de estudiantes distintos.
+    revenue (Decimal): Facturación mensual del instrumento.
+"""
+class RollupInstrument(Base):
+    __tablename__ = 'rollup_instruments'
+    instrument_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(String(50), nullable=False)
+    inscriptions: Mapped[int] = mapped_column(Integer, nullable=False)
+    students: Mapped[int] = mapped_column(Integer, nullable=False)
+    revenue: Mapped[DECIMAL] = mapped_column(DECIMAL(12, 2), nullable=False)
+
+"""
+RollupLevel: inscripciones por nivel.
+
+Atributos:
+    level_id (int): Identificador del nivel.
+    instrument_name (str): Nombre del instrumento del nivel.
+    level (str): Nombre del nivel.
+    inscriptions (int): Número de inscripciones.
+"""
+class RollupLevel(Base):
+    __tablename__ = 'rollup_levels'
+    level_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    instrument_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    level: Mapped[str] = mapped_column(String(50), nullable=False)
+    inscriptions: Mapped[int] = mapped_column(Integer, nullable=False)
+
+"""
+RollupTeacher: estudiantes distintos inscritos en los instrumentos de cada profesor.
+
+Atributos:
+    teacher_id (int): Identificador del profesor.
+    teacher_name (str): Nombre y apellido del profesor.
+    students (int): Número de estudiantes.
+"""
+class RollupTeacher(Base):
+    __tablename__ = 'rollup_teachers'
+    teacher_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    teacher_name: Mapped[str] = mapped_column(String(101), nullable=False)
+    students: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+
+"""
+RollupMonth: inscripciones registradas por mes.
+
+Atributos:
+    month (str): Mes (AAAA-MM).
+    registrations (int): Número de inscripciones registradas en el mes.
+"""
+class RollupMonth(Base):
+    __tablename__ = 'rollup_months'
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)
+    registrations: Mapped[int] = mapped_column(Integer, nullable=False)
 
+"""
+Modelo de versión de una tabla: aumenta en la misma transacción que cada cambio confirmado en la tabla (ver
+changes.py). Lo comparten todos los procesos (workers de la API, GUI, relay), así que sirve para invalidar
+las cachés de cualquiera de ellos.
+
+Atributos:
+    table_name (str): Nombre de la tabla.
+    version (int): Versión actual de la tabla.
+"""
+class TableVersion(Base):
+    __tablename__ = 'table_versions'
+    table_name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+@event.listens_for(TableVersion.__table__, "after_create")
+def _seed_table_versions(target, connection, **kw):
+    # Una fila por tabla desde el principio: los commits solo tienen que incrementarla
+    connection.execute(target.insert(), [{"table_name": name, "version": 0} for name in Base.metadata.tables])
+
+"""
+Modelo de informe en segundo plano (ver jobs.py). Se guarda en la base de datos para que cualquier worker
+pueda devolver su estado y su resultado, y para reutilizar el resultado mientras no cambien las tablas de
+las que depende.
+
+Atributos:
+    id (str): Identificador del trabajo.
+    kind (str): Tipo de informe, por ejemplo "fees".
+    cache_key (str): Hash del tipo, los parámetros y la versión de las tablas con las que se calcula.
+    status (str): pending, running, done o failed.
+    created_at (datetime): Fecha de creación.
+    finished_at (datetime | None): Fecha de finalización.
+    result (str | None): Resultado en formato JSON cuando status es "done".
+    error (str | None): Mensaje de error cuando status es "failed".
+"""
+class ReportJobRecord(Base):
+    __tablename__ = 'report_jobs'
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    cache_key: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String(10), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    result: Mapped[str | None] = mapped_column(Text().with_variant(LONGTEXT(), "mysql"), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -0,0 +1,228 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import Session
+
+from models import OutboxEvent, OutboxCursor
+
+'''
+Outbox transaccional para los consumidores externos (contabilidad, servicio de mensajería).
+
+Las funciones CRUD de estudiantes, inscripciones y precios (instrumentos y packs) llaman a record_event()
+antes de su commit, de modo que el evento se guarda en la tabla outbox_events en la misma transacción que
+el cambio: si el cambio se revierte, el evento también.
+
+Un relay (python outbox.py) lee los eventos por lotes, en orden de id, a partir del cursor guardado en
+outbox_cursors, los entrega a un destino (sink) y solo después avanza el cursor. Si el relay cae entre la
+entrega y el avance del cursor, el lote se vuelve a entregar: la entrega es "al menos una vez" y los
+consumidores deben descartar los eventos repetidos por su id.
+
+Como los ids se asignan al insertar y no al confirmar, una transacción lenta puede confirmar un id menor que
+otro ya entregado. Para no saltárselo, el relay se detiene ante un hueco en los ids hasta que el evento
+posterior al hueco tiene más de OUTBOX_GAP_TIMEOUT segundos; a partir de ahí el hueco se da por definitivo
+(transacción revertida).
+
+Uso (desde el directorio app):
+    python outbox.py --sink file:/var/lib/academia/outbox.jsonl
+    python outbox.py --sink sqlite:/var/lib/academia/outbox.db --once
+
+Configuración por variables de entorno:
+    OUTBOX_SINK: destino por defecto (file:<ruta> o sqlite:<ruta>).
+    OUTBOX_BATCH_SIZE: eventos por lote (por defecto 100).
+    OUTBOX_POLL_INTERVAL: segundos de espera cuando no hay eventos nuevos (por defecto 1).
+    OUTBOX_GAP_TIMEOUT: segundos de espera ante un hueco en los ids (por defecto 30).
+    OUTBOX_RETENTION_DAYS: días que se conservan los eventos ya entregados (por defecto 7).
+'''
+
+logger = logging.getLogger("music_app")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_event(db: Session, event_type: str, aggregate: str, aggregate_id: int, payload: dict) -> OutboxEvent:
+    # Añade el evento a la transacción en curso; lo confirma el commit de la función CRUD que lo llama
+    event = OutboxEvent(
+        event_type=event_type,
+        aggregate=aggregate,
+        aggregate_id=aggregate_id,
+        payload=json.dumps(jsonable_encoder(payload)),
+        created_at=_utcnow(),
+    )
+    db.add(event)
+    return event
+
+
+def event_message(event: OutboxEvent) -> dict:
+    # Mensaje que se entrega a los destinos
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "aggregate": event.aggregate,
+        "aggregate_id": event.aggregate_id,
+        "created_at": event.created_at.isoformat(),
+        "payload": json.loads(event.payload),
+    }
+
+
+class FileSink:
+    '''Añade cada evento como una línea JSON a un fichero.'''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, messages: List[dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class SQLiteSink:
+    '''Guarda los eventos en una base de datos SQLite; los eventos repetidos se ignoran por su id.'''
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, type TEXT NOT NULL, "
+                "aggregate TEXT NOT NULL, aggregate_id INTEGER NOT NULL, created_at TEXT NOT NULL, payload TEXT NOT NULL)"
+            )
+
+    def send(self, messages: List[dict]):
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO events (id, type, aggregate, aggregate_id, created_at, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                [(m["id"], m["type"], m["aggregate"], m["aggregate_id"], m["created_at"], json.dumps(m["payload"]))
+                 for m in messages],
+            )
+
+
+SINKS = {"file": FileSink, "sqlite": SQLiteSink}
+
+
+def sink_from_url(url: str):
+    # "file:/ruta/eventos.jsonl" o "sqlite:/ruta/eventos.db"
+    kind, _, path = url.partition(":")
+    if kind not in SINKS or not path:
+        raise ValueError(f"Destino del outbox no válido: {url}")
+    return SINKS[kind](path)
+
+
+def relay_batch(db: Session, sink, name: str = "default", batch_size: int = 100, gap_timeout: float = 30.0) -> int:
+    '''
+    Entrega al destino el siguiente lote de eventos y avanza el cursor del relay. Devuelve cuántos eventos
+    se entregaron.
+    '''
+    cursor = db.get(OutboxCursor, name)
+    last_event_id = cursor.last_event_id if cursor else 0
+
+    events = db.scalars(
+        select(OutboxEvent).where(OutboxEvent.id > last_event_id).order_by(OutboxEvent.id).limit(batch_size)
+    ).all()
+
+    # Cortar el lote en el primer hueco reciente: puede ser una transacción aún sin confirmar
+    expected = last_event_id + 1
+    settled_before = _utcnow() - timedelta(seconds=gap_timeout)
+    deliverable = []
+    for event in events:
+        if event.id != expected and event.created_at > settled_before:
+            break
+        deliverable.append(event)
+        expected = event.id + 1
+
+    if not deliverable:
+        return 0
+
+    sink.send([event_message(event) for event in deliverable])
+    if cursor is None:
+        cursor = OutboxCursor(name=name)
+        db.add(cursor)
+    cursor.last_event_id = deliverable[-1].id
+    cursor.updated_at = _utcnow()
+    db.commit()
+    return len(deliverable)
+
+
+def purge_delivered(db: Session, retention: timedelta) -> int:
+    # Borra los eventos ya entregados por todos los relays y más antiguos que el periodo de retención
+    delivered = db.scalar(select(func.min(OutboxCursor.last_event_id)))
+    if not delivered:
+        return 0
+    result = db.execute(
+        delete(OutboxEvent)
+        .where(OutboxEvent.id <= delivered, OutboxEvent.created_at < _utcnow() - retention)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def run_relay(session_factory: Callable[[], Session], sink, name: str = "default", batch_size: int = 100,
+              poll_interval: float = 1.0, gap_timeout: float = 30.0, retention: timedelta = timedelta(days=7),
+              once: bool = False, stop: Optional[threading.Event] = None) -> int:
+    # Entrega lotes hasta vaciar el outbox (once) o hasta que se active stop; devuelve el total entregado
+    stop = stop or threading.Event()
+    total = 0
+    while not stop.is_set():
+        with session_factory() as db:
+            try:
+                delivered = relay_batch(db, sink, name, batch_size, gap_timeout)
+            except Exception as e:
+                # El cursor no avanza: el lote se reintenta en la siguiente vuelta
+                db.rollback()
+                logger.error("Error al entregar eventos del outbox: %s", e)
+                delivered = 0
+                if once:
+                    raise
+            total += delivered
+            if delivered == 0:
+                purged = purge_delivered(db, retention)
+                if purged:
+                    logger.info("%s eventos del outbox purgados", purged)
+        if delivered == 0:
+            if once:
+                break
+            stop.wait(poll_interval)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay del outbox hacia un destino externo")
+    parser.add_argument("--sink", default=os.getenv("OUTBOX_SINK"), help="file:<ruta> o sqlite:<ruta>")
+    parser.add_argument("--name", default="default", help="Nombre del cursor (uno por destino)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("OUTBOX_BATCH_SIZE", "100")))
+    parser.add_argument("--interval", type=float, default=float(os.getenv("OUTBOX_POLL_INTERVAL", "1")))
+    parser.add_argument("--once", action="store_true", help="Entregar lo pendiente y terminar")
+    args = parser.parse_args()
+    if not args.sink:
+        parser.error("Indique el destino con --sink o OUTBOX_SINK")
+
+    from db import SessionLocal
+    from logging_config import setup_logger
+    setup_logger()
+    delivered = run_relay(
+        SessionLocal,
+        sink_from_url(args.sink),
+        name=args.name,
+        batch_size=args.batch_size,
+        poll_interval=args.interval,
+        gap_timeout=float(os.getenv("OUTBOX_GAP_TIMEOUT", "30")),
+        retention=timedelta(days=float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))),
+        once=args.once,
+    )
+    logger.info("Relay del outbox terminado: %s eventos entregados", delivered)
+
+
+if __name__ == "__main__":
+    main()
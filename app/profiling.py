@@ -0,0 +1,288 @@
+import os
+import re
+import hmac
+import json
+import time
+import uuid
+import tempfile
+import pstats
+import cProfile
+import asyncio
+import functools
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Header, HTTPException, Request
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from logging_config import request_id_var
+
+'''
+Perfilado bajo demanda de peticiones concretas, para ver en producción en qué se va el tiempo de un endpoint lento.
+
+Una petición con la cabecera X-Profile: 1 (o el parámetro ?profile=1) y la cabecera X-Admin-Token igual a
+PROFILE_TOKEN se ejecuta bajo cProfile. Sin token válido, la marca se ignora y la petición se atiende con
+normalidad. La respuesta lleva la cabecera X-Profile-ID y el perfil se consulta después en
+GET /admin/profiles/{profile_id} (también con X-Admin-Token): funciones con más tiempo, árbol de llamadas
+y tiempo por componente (SQLAlchemy, pydantic, CRUD, FastAPI/Starlette).
+
+cProfile solo mide el hilo en el que se activa, así que se combinan dos perfiles:
+    - El de la función del endpoint, en el hilo del threadpool que la ejecuta (CRUD, SQLAlchemy, modelos).
+    - El del handler de la ruta en el bucle de eventos (lectura y validación de la petición, dependencias y
+      serialización de la respuesta). Mientras el handler espera, el bucle puede atender otras peticiones,
+      cuyo código también aparecería en este perfil. La espera del bucle se contabiliza como "waiting".
+
+Los perfiles se guardan como ficheros JSON en PROFILE_DIR (los últimos PROFILE_RETAINED), compartidos por todos
+los workers: cualquiera de ellos devuelve un perfil tomado en otro. Con varios contenedores o máquinas,
+PROFILE_DIR debe ser un volumen compartido.
+
+Configuración por variables de entorno:
+    PROFILE_TOKEN: token de administración; si no se define, el perfilado y /admin/profiles están desactivados.
+    PROFILE_DIR: directorio de los perfiles (por defecto music_app_profiles en el directorio temporal).
+    PROFILE_RETAINED: perfiles que se conservan (por defecto 50).
+'''
+
+# Perfilado de la petición en curso; la lista de perfiles es compartida con el hilo del threadpool
+_active: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("active_profile", default=None)
+
+# Componentes en los que se reparte el tiempo propio (tottime) de las funciones
+COMPONENTS = (
+    ("sqlalchemy", "sqlalchemy"),
+    ("pydantic", "pydantic"),
+    ("crud", f"{os.sep}crud{os.sep}"),
+    ("fastapi", "fastapi"),
+    ("starlette", "starlette"),
+    ("database_driver", "pymysql"),
+    ("database_driver", "sqlite3"),
+)
+
+
+def admin_token() -> Optional[str]:
+    return os.getenv("PROFILE_TOKEN") or None
+
+
+def is_admin(token: Optional[str]) -> bool:
+    expected = admin_token()
+    return bool(expected and token) and hmac.compare_digest(token, expected)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Dependencia de los endpoints de administración
+    if admin_token() is None:
+        raise HTTPException(status_code=404, detail="Perfilado desactivado")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
+
+
+def profiling_requested(request: Request) -> bool:
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    return flag in ("1", "true") and is_admin(request.headers.get("x-admin-token"))
+
+
+def _label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        # Funciones internas de Python, p. ej. <built-in method time.sleep>
+        return name
+    return f"{filename}:{line}({name})"
+
+
+def _component(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~" and "select." in name:
+        # Bucle de eventos esperando, normalmente a que el threadpool termine el endpoint
+        return "waiting"
+    for component, marker in COMPONENTS:
+        if marker in filename:
+            return component
+    return "other"
+
+
+def summarize(stats: pstats.Stats, top: int = 25, depth: int = 12, min_fraction: float = 0.01) -> dict:
+    '''
+    Resume un perfil: las funciones con más tiempo acumulado, el árbol de llamadas desde las funciones raíz
+    (podado por debajo de min_fraction del total) y el tiempo propio por componente.
+    '''
+    raw = stats.stats
+    total = stats.total_tt or 1e-9
+
+    functions = sorted(raw.items(), key=lambda item: item[1][3], reverse=True)
+    top_functions = [
+        {"function": _label(func), "calls": nc, "own_ms": round(tt * 1000, 3), "cumulative_ms": round(ct * 1000, 3)}
+        for func, (cc, nc, tt, ct, callers) in functions[:top]
+    ]
+
+    components: Dict[str, float] = {}
+    for func, (cc, nc, tt, ct, callers) in raw.items():
+        component = _component(func)
+        components[component] = components.get(component, 0.0) + tt
+
+    # Relación inversa a la de pstats (llamador -> llamadas), con el tiempo acumulado de cada llamada
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (cc, nc, tt, ct, callers) in raw.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((func, caller_stats[1], caller_stats[3]))
+
+    def node(func: tuple, calls: int, cumulative: float, path: frozenset, level: int) -> dict:
+        children = []
+        if level < depth:
+            for child, child_calls, child_cumulative in sorted(callees.get(func, ()), key=lambda c: c[2], reverse=True):
+                if child in path or child_cumulative < total * min_fraction:
+                    continue
+                children.append(node(child, child_calls, child_cumulative, path | {child}, level + 1))
+        return {"function": _label(func), "calls": calls, "cumulative_ms": round(cumulative * 1000, 3), "children": children}
+
+    roots = [(func, nc, ct) for func, (cc, nc, tt, ct, callers) in functions if not callers]
+    call_tree = [node(func, nc, ct, frozenset([func]), 0) for func, nc, ct in roots if ct >= total * min_fraction]
+
+    return {
+        "profiled_ms": round(total * 1000, 3),
+        "components_ms": {name: round(seconds * 1000, 3) for name, seconds in
+                          sorted(components.items(), key=lambda item: item[1], reverse=True)},
+        "top_functions": top_functions,
+        "call_tree": call_tree,
+    }
+
+
+class ProfileStore:
+    '''Últimos perfiles, por id, en un directorio compartido por los procesos (un fichero JSON por perfil).'''
+
+    SUMMARY_FIELDS = ("id", "request_id", "method", "path", "route", "status", "wall_ms", "created_at")
+
+    def __init__(self, directory: str, retained: int = 50):
+        self.directory = directory
+        self.retained = retained
+
+    @classmethod
+    def from_env(cls) -> "ProfileStore":
+        return cls(
+            directory=os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "music_app_profiles"),
+            retained=int(os.getenv("PROFILE_RETAINED", "50")),
+        )
+
+    def _path(self, profile_id: str) -> Optional[str]:
+        # Los ids son uuid4 en hexadecimal; cualquier otro valor no corresponde a ningún fichero
+        if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+            return None
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def _files(self) -> List[str]:
+        # Del más reciente al más antiguo
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        paths = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # Borrado por otro worker
+                continue
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def add(self, profile: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(profile["id"])
+        # Se escribe en un fichero temporal y se renombra: los demás procesos nunca leen un perfil a medias
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(profile, file)
+        os.replace(temporary, path)
+        for old in self._files()[self.retained:]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        path = self._path(profile_id)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> List[dict]:
+        # Del más reciente al más antiguo, sin el detalle
+        profiles = []
+        for path in self._files()[:self.retained]:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    profile = json.load(file)
+            except FileNotFoundError:
+                continue
+            profiles.append({key: profile[key] for key in self.SUMMARY_FIELDS})
+        return profiles
+
+
+profile_store = ProfileStore.from_env()
+
+
+def _profiled_endpoint(endpoint: Callable) -> Callable:
+    # Ejecuta el endpoint bajo cProfile en su propio hilo cuando la petición en curso se está perfilando
+    # Los endpoints async corren en el bucle de eventos, ya cubierto por el perfil del handler. include_router
+    # vuelve a crear las rutas con el endpoint ya envuelto, que no se envuelve dos veces
+    if asyncio.iscoroutinefunction(endpoint) or getattr(endpoint, "__profiled__", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiles = _active.get()
+        if profiles is None:
+            return endpoint(*args, **kwargs)
+        profiler = cProfile.Profile()
+        profiles.append(profiler)
+        return profiler.runcall(endpoint, *args, **kwargs)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    '''Ruta de FastAPI que perfila las peticiones marcadas con X-Profile (ver profiling_requested).'''
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _profiled_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def profiling_handler(request: Request):
+            if not profiling_requested(request):
+                return await handler(request)
+
+            profiles: List[cProfile.Profile] = []
+            token = _active.set(profiles)
+            loop_profiler = cProfile.Profile()
+            started = time.perf_counter()
+            loop_profiler.enable()
+            try:
+                response = await handler(request)
+            finally:
+                loop_profiler.disable()
+                _active.reset(token)
+            wall = time.perf_counter() - started
+
+            stats = pstats.Stats(loop_profiler)
+            for profiler in profiles:
+                stats.add(profiler)
+            profile_id = uuid.uuid4().hex
+            await run_in_threadpool(profile_store.add, dict(
+                id=profile_id,
+                request_id=request_id_var.get(),
+                method=request.method,
+                path=request.url.path,
+                route=self.path,
+                status=response.status_code,
+                wall_ms=round(wall * 1000, 3),
+                created_at=time.time(),
+                **summarize(stats),
+            ))
+            response.headers["X-Profile-ID"] = profile_id
+            return response
+
+        return profiling_handler
@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import importlib.util
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+
+from deadlines import deadline_scope
+
+'''
+Control de las consultas ad hoc de la consola SQL de la GUI.
+
+Antes de ejecutar una consulta se pide su plan con EXPLAIN y se estiman las filas que recorrerá:
+    - MySQL: para cada SELECT del plan, producto de la columna rows de sus tablas (los joins se anidan).
+    - PostgreSQL: el mayor "Plan Rows" del plan (EXPLAIN (FORMAT JSON)).
+    - SQLite: EXPLAIN QUERY PLAN no da estimaciones; se multiplica el tamaño de las tablas que se recorren
+      enteras (SCAN). Los alias se resuelven desde el texto de la consulta; los que no (p. ej. CTE) se cuentan
+      como la tabla más grande. El tamaño de cada tabla se toma de sqlite_stat1 (tras ANALYZE) o, si no, de un
+      count(*) que se guarda SQLITE_COUNT_TTL segundos.
+Por encima de SQL_GOVERNOR_CONFIRM_ROWS la consulta necesita confirmación y por encima de SQL_GOVERNOR_MAX_ROWS
+se rechaza. Las sentencias sin plan (p. ej. DDL) siempre necesitan confirmación.
+
+Las consultas ad hoc usan su propio engine (create_console_engine), con un pool pequeño separado del de la
+API y de la GUI, un driver que admite cursores del lado del servidor (con mysql+mysqlconnector, el driver de
+DATABASE_URL, la consola usa mysql+pymysql: mysql-connector lee siempre el resultado entero antes de devolver
+la primera fila), conexiones de solo lectura salvo para el Super-user, y un timeout de sentencia fijado en la
+sesión del servidor además del plazo de cada consulta (ver deadlines):
+    - PostgreSQL: statement_timeout, para cualquier sentencia.
+    - MySQL: max_execution_time, que solo se aplica a los SELECT de solo lectura. Las sentencias que modifican
+      datos (Super-user) tienen un límite de espera de bloqueos (innodb_lock_wait_timeout y lock_wait_timeout)
+      y, al cumplirse el tiempo máximo, la consola las detiene con KILL QUERY (ver sql_console.QueryJob).
+
+Configuración por variables de entorno:
+    SQL_CONSOLE_DATABASE_URL: base de datos de la consola, p. ej. una réplica o un usuario de solo lectura
+        (por defecto DATABASE_URL).
+    SQL_CONSOLE_POOL_SIZE: conexiones de cada pool de la consola (por defecto 2).
+    SQL_GOVERNOR_CONFIRM_ROWS: filas estimadas a partir de las que se pide confirmación (por defecto 100000).
+    SQL_GOVERNOR_MAX_ROWS: filas estimadas a partir de las que se rechaza la consulta (por defecto 10000000).
+'''
+
+logger = logging.getLogger("music_app")
+
+# Tiempo máximo para obtener el plan de una consulta
+EXPLAIN_TIMEOUT = 5.0
+
+_SQLITE_STEP = re.compile(r"^(SCAN|SEARCH) (\S+)")
+_SQL_ALIAS = re.compile(r"(?:\bFROM|\bJOIN|,)\s+\"?(\w+)\"?\s+(?:AS\s+)?(\w+)", re.IGNORECASE)
+
+
+class QueryEstimate:
+    '''Filas estimadas de una consulta (None si no hay plan) y decisión: run, confirm o reject.'''
+
+    def __init__(self, rows: Optional[int], verdict: str, message: str):
+        self.rows = rows
+        self.verdict = verdict
+        self.message = message
+
+
+# Drivers sin cursores del lado del servidor -> driver equivalente con ellos (y el módulo que necesita)
+STREAMING_DRIVERS = {"mysql+mysqlconnector": ("mysql+pymysql", "pymysql")}
+
+
+def streaming_url(url: str) -> str:
+    # URL de la consola con un driver que lee los resultados por páginas, si está instalado
+    parsed = make_url(url)
+    driver, module = STREAMING_DRIVERS.get(parsed.drivername, (None, None))
+    if driver is None:
+        return url
+    if importlib.util.find_spec(module) is None:
+        logger.warning("%s no está instalado: la consola SQL leerá cada resultado entero antes de mostrarlo", module)
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_console_engine(url: str, read_only: bool = True, pool_size: Optional[int] = None,
+                          statement_timeout: Optional[float] = None) -> Engine:
+    # El timeout de sesión es el mismo que el de cada consulta de la consola (SQL_CONSOLE_TIMEOUT, ver sql_console)
+    pool_size = pool_size or int(os.getenv("SQL_CONSOLE_POOL_SIZE", "2"))
+    statement_timeout = statement_timeout or float(os.getenv("SQL_CONSOLE_TIMEOUT", "300"))
+    engine = create_engine(streaming_url(url), pool_size=pool_size, max_overflow=0, pool_timeout=10, pool_pre_ping=True)
+    timeout_ms = int(statement_timeout * 1000)
+    timeout_seconds = max(int(statement_timeout), 1)
+
+    @event.listens_for(engine, "connect")
+    def _configure_session(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        dialect = engine.dialect.name
+        if dialect in ("mysql", "mariadb"):
+            # max_execution_time solo limita los SELECT; las esperas de bloqueos se limitan aparte (en segundos)
+            cursor.execute(f"SET SESSION max_execution_time = {timeout_ms}")
+            cursor.execute(f"SET SESSION innodb_lock_wait_timeout = {timeout_seconds}")
+            cursor.execute(f"SET SESSION lock_wait_timeout = {timeout_seconds}")
+            if read_only:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        elif dialect == "postgresql":
+            cursor.execute(f"SET statement_timeout = {timeout_ms}")
+            if read_only:
+                cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        elif dialect == "sqlite" and read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    return engine
+
+
+def _mysql_rows(connection, sql: str) -> int:
+    per_select = {}
+    for step in connection.exec_driver_sql(f"EXPLAIN {sql}").mappings():
+        per_select[step["id"]] = per_select.get(step["id"], 1) * max(int(step["rows"] or 1), 1)
+    return sum(per_select.values())
+
+
+def _postgresql_rows(connection, sql: str) -> int:
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    def largest(node):
+        return max([int(node.get("Plan Rows", 0))] + [largest(child) for child in node.get("Plans", [])])
+    return largest(plan[0]["Plan"])
+
+
+# Filas de cada tabla SQLite sin estadísticas: (base de datos, tabla) -> (instante de caducidad, filas)
+SQLITE_COUNT_TTL = 60.0
+_sqlite_counts: Dict[Tuple[str, str], Tuple[float, int]] = {}
+_sqlite_counts_lock = threading.Lock()
+
+
+def _sqlite_table_rows(connection, names) -> Dict[str, int]:
+    # Filas de las tablas indicadas: de sqlite_stat1 si se ha ejecutado ANALYZE, si no con count(*) en caché
+    rows: Dict[str, int] = {}
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").first():
+        for table, stat in connection.exec_driver_sql("SELECT tbl, stat FROM sqlite_stat1"):
+            if table in names:
+                rows[table] = int(stat.split()[0])
+    database = str(connection.engine.url)
+    now = time.monotonic()
+    for name in names:
+        if name in rows:
+            continue
+        with _sqlite_counts_lock:
+            cached = _sqlite_counts.get((database, name))
+        if cached is not None and cached[0] > now:
+            rows[name] = cached[1]
+            continue
+        rows[name] = connection.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+        with _sqlite_counts_lock:
+            _sqlite_counts[(database, name)] = (now + SQLITE_COUNT_TTL, rows[name])
+    return rows
+
+
+def _sqlite_rows(connection, sql: str) -> int:
+    tables = set(inspect(connection).get_table_names())
+    aliases = {alias: table for table, alias in _SQL_ALIAS.findall(sql) if table in tables}
+    # Solo los pasos del nivel superior: los de las subconsultas ya se cuentan en su tabla
+    scanned = []
+    for _, parent, _, detail in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"):
+        step = _SQLITE_STEP.match(detail)
+        if parent == 0 and step and step.group(1) == "SCAN" and step.group(2) != "CONSTANT":
+            scanned.append(aliases.get(step.group(2), step.group(2)))
+    # Solo se cuentan las tablas recorridas; todas si hay que conocer la más grande
+    needed = tables if any(name not in tables for name in scanned) else set(scanned)
+    counts = _sqlite_table_rows(connection, needed)
+    largest = max(counts.values(), default=0)
+    rows = 1
+    for name in scanned:
+        rows *= max(counts.get(name, largest), 1)
+    return rows
+
+
+_ESTIMATORS = {"mysql": _mysql_rows, "mariadb": _mysql_rows, "postgresql": _postgresql_rows, "sqlite": _sqlite_rows}
+
+
+def estimate_query(engine: Engine, sql: str, confirm_rows: Optional[int] = None,
+                   max_rows: Optional[int] = None) -> QueryEstimate:
+    confirm_rows = confirm_rows or int(os.getenv("SQL_GOVERNOR_CONFIRM_ROWS", "100000"))
+    max_rows = max_rows or int(os.getenv("SQL_GOVERNOR_MAX_ROWS", "10000000"))
+    estimator = _ESTIMATORS.get(engine.dialect.name)
+    try:
+        with deadline_scope(EXPLAIN_TIMEOUT), engine.connect() as connection:
+            rows = estimator(connection, sql.strip().rstrip(";")) if estimator else None
+    except Exception as e:
+        logger.info("No se pudo obtener el plan de una consulta de la consola SQL: %s", e)
+        rows = None
+
+    if rows is None:
+        return QueryEstimate(None, "confirm", "No se ha podido estimar el coste de la consulta.")
+    if rows > max_rows:
+        return QueryEstimate(rows, "reject",
+                             f"La consulta recorrería unas {rows} filas (máximo {max_rows}). Añada filtros o condiciones de join.")
+    if rows > confirm_rows:
+        return QueryEstimate(rows, "confirm", f"La consulta recorrería unas {rows} filas.")
+    return QueryEstimate(rows, "run", f"Filas estimadas: {rows}.")
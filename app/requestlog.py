@@ -0,0 +1,97 @@
+import re
+import time
+import uuid
+import json
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from logging_config import REQUEST_LOGGER_NAME, request_id_var
+
+'''
+Log estructurado de peticiones. Por cada petición se escribe una línea JSON en el log de peticiones
+(REQUEST_LOG_FILE, ver logging_config) con la ruta, el código de estado, la latencia, el número de sentencias
+SQL y su tiempo, y un identificador de correlación.
+
+El identificador se toma de la cabecera X-Request-ID si el cliente la envía (y es válida) o se genera uno
+nuevo; se devuelve en la respuesta y se añade a todos los mensajes del log de la aplicación emitidos durante
+la petición, de modo que se pueden relacionar ambos logs.
+'''
+
+request_logger = logging.getLogger(REQUEST_LOGGER_NAME)
+
+# Estadísticas de base de datos de la petición en curso; el diccionario es compartido con los hilos del threadpool
+_db_stats: ContextVar[Optional[dict]] = ContextVar("db_stats", default=None)
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if _db_stats.get() is not None:
+        conn.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = _db_stats.get()
+    if stats is None:
+        return
+    stats["db_statements"] += 1
+    started = conn.info.pop("statement_started", None)
+    if started is not None:
+        stats["db_time"] += time.perf_counter() - started
+
+
+def route_template(scope: Scope) -> Optional[str]:
+    # Plantilla de la ruta (/students/{student_id}) en lugar de la URL concreta; None si no hubo coincidencia
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class RequestLogMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id", "")
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        stats = {"db_statements": 0, "db_time": 0.0}
+        status = {"code": 500}
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                MutableHeaders(raw=message.setdefault("headers", [])).append("X-Request-ID", request_id)
+            await send(message)
+
+        request_token = request_id_var.set(request_id)
+        stats_token = _db_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            latency = time.perf_counter() - started
+            _db_stats.reset(stats_token)
+            request_id_var.reset(request_token)
+            if request_logger.isEnabledFor(logging.INFO):
+                request_logger.info(json.dumps({
+                    "ts": time.time(),
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "route": route_template(scope),
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "latency_ms": round(latency * 1000, 3),
+                    "db_statements": stats["db_statements"],
+                    "db_time_ms": round(stats["db_time"] * 1000, 3),
+                }))
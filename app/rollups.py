@@ -0,0 +1,357 @@
+import os
+import time
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, delete, func, distinct
+from sqlalchemy.orm import Session
+
+from models import (Student, Inscription, Level, Instrument, Teacher, TeachersInstruments, PacksInstruments,
+                    OutboxEvent, OutboxCursor, RollupInscription, RollupInstrument, RollupLevel, RollupTeacher,
+                    RollupMonth)
+from crud.inscriptions_crud import get_packs_by_instrument, compute_fee_breakdown
+from outbox import relay_batch, _utcnow
+
+'''
+Tablas de resumen (rollups) del panel de análisis de la GUI: facturación por instrumento, inscripciones por
+nivel, estudiantes por profesor e inscripciones por mes. Cada gráfico del panel es una lectura de una tabla
+pequeña en lugar de un agregado con varios joins sobre las tablas de la escuela.
+
+La base es rollup_inscriptions, con una fila por inscripción y su importe (con los descuentos de pack y
+familiar). Cuando cambia un estudiante, una inscripción, un precio o un pack, se recalculan las filas de los
+estudiantes afectados y solo las filas de los resúmenes (instrumentos, niveles, meses, profesores) que tocan.
+
+Los cambios se leen del outbox (ver outbox.py) con su propio cursor, "rollups", en la misma transacción en la que
+se actualizan los resúmenes: un lote se aplica entero o no se aplica. Los cambios que no pasan por el outbox
+(profesores y sus instrumentos, nombres de niveles) se recogen en la reconstrucción completa periódica.
+Mientras exista el cursor "rollups", el relay del outbox no purga los eventos que este proceso no ha leído.
+
+Uso (desde el directorio app):
+    python rollups.py --rebuild --once    reconstrucción completa
+    python rollups.py                     actualización incremental continua
+
+Configuración por variables de entorno:
+    ROLLUP_POLL_INTERVAL: segundos de espera cuando no hay eventos nuevos (por defecto 5).
+    ROLLUP_REBUILD_INTERVAL: segundos entre reconstrucciones completas (por defecto 3600; 0 las desactiva).
+    ROLLUP_BATCH_SIZE: eventos por lote (por defecto 500).
+'''
+
+logger = logging.getLogger("music_app")
+
+CURSOR_NAME = "rollups"
+
+# Tamaño de las listas de IDs en las consultas IN
+CHUNK_SIZE = 500
+
+
+def _chunks(ids: Iterable, size: int = CHUNK_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _month(value) -> str:
+    return value.strftime("%Y-%m")
+
+
+def _inscription_rows(db: Session, student_ids: List[int]) -> List[RollupInscription]:
+    # Filas de rollup_inscriptions de los estudiantes indicados, con las mismas reglas que calculate_student_fees
+    rows = db.execute(
+        select(Inscription, Student, Level, Instrument)
+        .join(Student, Inscription.student_id == Student.id)
+        .join(Level, Inscription.level_id == Level.id)
+        .join(Instrument, Level.instruments_id == Instrument.id)
+        .where(Inscription.student_id.in_(student_ids))
+        .order_by(Inscription.student_id, Inscription.id)
+    ).all()
+    packs_by_instrument = get_packs_by_instrument(db, [instrument.id for _, _, _, instrument in rows])
+
+    by_student = defaultdict(list)
+    for row in rows:
+        by_student[row[1].id].append(row)
+
+    result = []
+    for student_rows in by_student.values():
+        student = student_rows[0][1]
+        breakdown = compute_fee_breakdown(student, [instrument for _, _, _, instrument in student_rows], packs_by_instrument)
+        factor = Decimal('0.90') if student.family_id else Decimal('1')
+        for (inscription, _, level, instrument), line in zip(student_rows, breakdown['lines']):
+            result.append(RollupInscription(
+                inscription_id=inscription.id,
+                student_id=student.id,
+                instrument_id=instrument.id,
+                level_id=level.id,
+                month=_month(inscription.registration_date),
+                amount=(Decimal(str(line['price'])) * factor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+            ))
+    return result
+
+
+def _refresh_instruments(db: Session, instrument_ids: Optional[Set[int]] = None):
+    # None: todos los instrumentos
+    stats = (
+        select(RollupInscription.instrument_id, func.count(), func.count(distinct(RollupInscription.student_id)),
+               func.sum(RollupInscription.amount))
+        .group_by(RollupInscription.instrument_id)
+    )
+    instruments = select(Instrument)
+    if instrument_ids is not None:
+        stats = stats.where(RollupInscription.instrument_id.in_(instrument_ids))
+        instruments = instruments.where(Instrument.id.in_(instrument_ids))
+        db.execute(delete(RollupInstrument).where(RollupInstrument.instrument_id.in_(instrument_ids)))
+    else:
+        db.execute(delete(RollupInstrument))
+    by_id = {row[0]: row[1:] for row in db.execute(stats)}
+    db.add_all([
+        RollupInstrument(instrument_id=instrument.id, name=instrument.name,
+                         inscriptions=by_id.get(instrument.id, (0, 0, 0))[0],
+                         students=by_id.get(instrument.id, (0, 0, 0))[1],
+                         revenue=by_id.get(instrument.id, (0, 0, 0))[2] or Decimal('0'))
+        for instrument in db.scalars(instruments)
+    ])
+
+
+def _refresh_levels(db: Session, level_ids: Optional[Set[int]] = None):
+    stats = select(RollupInscription.level_id, func.count()).group_by(RollupInscription.level_id)
+    levels = select(Level, Instrument.name).join(Instrument, Level.instruments_id == Instrument.id)
+    if level_ids is not None:
+        stats = stats.where(RollupInscription.level_id.in_(level_ids))
+        levels = levels.where(Level.id.in_(level_ids))
+        db.execute(delete(RollupLevel).where(RollupLevel.level_id.in_(level_ids)))
+    else:
+        db.execute(delete(RollupLevel))
+    counts = dict(db.execute(stats).all())
+    db.add_all([
+        RollupLevel(level_id=level.id, instrument_name=name, level=level.level, inscriptions=counts.get(level.id, 0))
+        for level, name in db.execute(levels)
+    ])
+
+
+def _refresh_months(db: Session, months: Optional[Set[str]] = None):
+    stats = select(RollupInscription.month, func.count()).group_by(RollupInscription.month)
+    if months is not None:
+        stats = stats.where(RollupInscription.month.in_(months))
+        db.execute(delete(RollupMonth).where(RollupMonth.month.in_(months)))
+    else:
+        db.execute(delete(RollupMonth))
+    db.add_all([RollupMonth(month=month, registrations=count) for month, count in db.execute(stats)])
+
+
+def _refresh_teachers(db: Session, instrument_ids: Optional[Set[int]] = None):
+    # Profesores de los instrumentos indicados (None: todos los profesores)
+    teachers = select(Teacher)
+    if instrument_ids is not None:
+        teacher_ids = set(db.scalars(
+            select(TeachersInstruments.teacher_id).where(TeachersInstruments.instrument_id.in_(instrument_ids))))
+        if not teacher_ids:
+            return
+        teachers = teachers.where(Teacher.id.in_(teacher_ids))
+        db.execute(delete(RollupTeacher).where(RollupTeacher.teacher_id.in_(teacher_ids)))
+    else:
+        db.execute(delete(RollupTeacher))
+    stats = (
+        select(TeachersInstruments.teacher_id, func.count(distinct(RollupInscription.student_id)))
+        .join(RollupInscription, RollupInscription.instrument_id == TeachersInstruments.instrument_id)
+        .group_by(TeachersInstruments.teacher_id)
+    )
+    if instrument_ids is not None:
+        stats = stats.where(TeachersInstruments.teacher_id.in_(teacher_ids))
+    counts = dict(db.execute(stats).all())
+    db.add_all([
+        RollupTeacher(teacher_id=teacher.id, teacher_name=f"{teacher.first_name} {teacher.last_name}",
+                      students=counts.get(teacher.id, 0))
+        for teacher in db.scalars(teachers)
+    ])
+
+
+def refresh_students(db: Session, student_ids: Iterable[int]) -> int:
+    '''
+    Recalcula las filas de los estudiantes indicados y los resúmenes a los que afectan, sin confirmar la
+    transacción. Devuelve el número de estudiantes recalculados.
+    '''
+    student_ids = set(student_ids)
+    instrument_ids, level_ids, months = set(), set(), set()
+    for chunk in _chunks(student_ids):
+        previous = db.execute(
+            select(RollupInscription.instrument_id, RollupInscription.level_id, RollupInscription.month)
+            .where(RollupInscription.student_id.in_(chunk))).all()
+        current = _inscription_rows(db, chunk)
+        for instrument_id, level_id, month in previous + [(r.instrument_id, r.level_id, r.month) for r in current]:
+            instrument_ids.add(instrument_id)
+            level_ids.add(level_id)
+            months.add(month)
+        db.execute(delete(RollupInscription).where(RollupInscription.student_id.in_(chunk)))
+        db.add_all(current)
+    db.flush()
+
+    if instrument_ids:
+        _refresh_instruments(db, instrument_ids)
+        _refresh_levels(db, level_ids)
+        _refresh_months(db, months)
+        _refresh_teachers(db, instrument_ids)
+    return len(student_ids)
+
+
+def rebuild(db: Session):
+    # Reconstrucción completa, sin confirmar la transacción
+    db.execute(delete(RollupInscription))
+    student_ids = db.scalars(select(Student.id).order_by(Student.id)).all()
+    for chunk in _chunks(student_ids):
+        db.add_all(_inscription_rows(db, chunk))
+        db.flush()
+    _refresh_instruments(db)
+    _refresh_levels(db)
+    _refresh_months(db)
+    _refresh_teachers(db)
+
+
+def rebuild_and_reset_cursor(db: Session):
+    # Los eventos anteriores a la reconstrucción ya están incluidos en ella; los posteriores se aplican después
+    # (aplicar dos veces un evento no cambia el resultado)
+    last_event_id = db.scalar(select(func.max(OutboxEvent.id))) or 0
+    rebuild(db)
+    cursor = db.get(OutboxCursor, CURSOR_NAME)
+    if cursor is None:
+        cursor = OutboxCursor(name=CURSOR_NAME)
+        db.add(cursor)
+    cursor.last_event_id = last_event_id
+    cursor.updated_at = _utcnow()
+    db.commit()
+    logger.info("Resúmenes del panel de análisis reconstruidos")
+
+
+def affected_students(db: Session, messages: List[dict]) -> Optional[Set[int]]:
+    '''
+    Estudiantes afectados por los eventos del outbox. None si hace falta una reconstrucción completa
+    (un pack borrado: sus instrumentos ya no se conocen).
+    '''
+    students: Set[int] = set()
+    inscription_ids: Set[int] = set()
+    instrument_ids: Set[int] = set()
+    pack_ids: Set[int] = set()
+    for message in messages:
+        aggregate, payload = message["aggregate"], message["payload"]
+        if aggregate == "student":
+            students.add(message["aggregate_id"])
+        elif aggregate == "inscription":
+            # El estudiante actual y, si la inscripción cambió de estudiante o se borró, el que tenía antes
+            inscription_ids.add(message["aggregate_id"])
+            if payload.get("student_id"):
+                students.add(payload["student_id"])
+        elif aggregate == "instrument":
+            instrument_ids.add(message["aggregate_id"])
+        elif aggregate == "pack":
+            if message["type"] == "pack.deleted":
+                return None
+            pack_ids.add(message["aggregate_id"])
+            if payload.get("instrument_id"):
+                instrument_ids.add(payload["instrument_id"])
+
+    for chunk in _chunks(pack_ids):
+        instrument_ids.update(db.scalars(select(PacksInstruments.instrument_id).where(PacksInstruments.packs_id.in_(chunk))))
+    for chunk in _chunks(inscription_ids):
+        students.update(db.scalars(select(RollupInscription.student_id).where(RollupInscription.inscription_id.in_(chunk))))
+    for chunk in _chunks(instrument_ids):
+        students.update(db.scalars(select(distinct(RollupInscription.student_id)).where(RollupInscription.instrument_id.in_(chunk))))
+        # Estudiantes inscritos en el instrumento que aún no tuvieran filas
+        students.update(db.scalars(
+            select(distinct(Inscription.student_id))
+            .join(Level, Inscription.level_id == Level.id)
+            .where(Level.instruments_id.in_(chunk))))
+    return students
+
+
+class RollupSink:
+    '''Destino del outbox que aplica los eventos a los resúmenes en la sesión del relay (ver relay_batch).'''
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def send(self, messages: List[dict]):
+        students = affected_students(self.db, messages)
+        if students is None:
+            rebuild(self.db)
+        elif students:
+            refresh_students(self.db, students)
+
+
+def apply_pending(db: Session, batch_size: int = 500, gap_timeout: float = 30.0) -> int:
+    # Aplica el siguiente lote de eventos; el cursor avanza en la misma transacción que los resúmenes
+    return relay_batch(db, RollupSink(db), CURSOR_NAME, batch_size, gap_timeout)
+
+
+def read_dashboard(db: Session) -> Dict:
+    # Datos del panel de análisis: lecturas directas de las tablas de resumen
+    cursor = db.get(OutboxCursor, CURSOR_NAME)
+    return {
+        "updated_at": cursor.updated_at if cursor else None,
+        "revenue_by_instrument": [
+            {"instrument": r.name, "revenue": float(r.revenue), "inscriptions": r.inscriptions, "students": r.students}
+            for r in db.scalars(select(RollupInstrument).order_by(RollupInstrument.revenue.desc()))],
+        "enrollment_by_level": [
+            {"instrument": r.instrument_name, "level": r.level, "inscriptions": r.inscriptions}
+            for r in db.scalars(select(RollupLevel).order_by(RollupLevel.instrument_name, RollupLevel.level))],
+        "students_by_teacher": [
+            {"teacher": r.teacher_name, "students": r.students}
+            for r in db.scalars(select(RollupTeacher).order_by(RollupTeacher.students.desc()))],
+        "registrations_by_month": [
+            {"month": r.month, "registrations": r.registrations}
+            for r in db.scalars(select(RollupMonth).order_by(RollupMonth.month))],
+    }
+
+
+def run(session_factory: Callable[[], Session], poll_interval: float = 5.0, rebuild_interval: float = 3600.0,
+        batch_size: int = 500, gap_timeout: float = 30.0, once: bool = False, force_rebuild: bool = False,
+        stop: Optional[threading.Event] = None):
+    # Aplica los eventos pendientes y reconstruye los resúmenes cada rebuild_interval segundos (o si no existen)
+    stop = stop or threading.Event()
+    last_rebuild = None
+    while not stop.is_set():
+        with session_factory() as db:
+            try:
+                due = rebuild_interval > 0 and (last_rebuild is None or time.monotonic() - last_rebuild >= rebuild_interval)
+                if force_rebuild or db.get(OutboxCursor, CURSOR_NAME) is None or due:
+                    rebuild_and_reset_cursor(db)
+                    last_rebuild = time.monotonic()
+                    force_rebuild = False
+                applied = apply_pending(db, batch_size, gap_timeout)
+            except Exception as e:
+                db.rollback()
+                logger.error("Error al actualizar los resúmenes del panel de análisis: %s", e)
+                if once:
+                    raise
+                applied = 0
+        if applied == 0:
+            if once:
+                break
+            stop.wait(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Actualiza las tablas de resumen del panel de análisis")
+    parser.add_argument("--rebuild", action="store_true", help="Reconstruir los resúmenes antes de empezar")
+    parser.add_argument("--once", action="store_true", help="Aplicar lo pendiente y terminar")
+    args = parser.parse_args()
+
+    from db import SessionLocal, engine
+    from models import Base
+    from logging_config import setup_logger
+    setup_logger()
+    Base.metadata.create_all(bind=engine)
+    run(
+        SessionLocal,
+        poll_interval=float(os.getenv("ROLLUP_POLL_INTERVAL", "5")),
+        rebuild_interval=0 if args.once else float(os.getenv("ROLLUP_REBUILD_INTERVAL", "3600")),
+        batch_size=int(os.getenv("ROLLUP_BATCH_SIZE", "500")),
+        gap_timeout=float(os.getenv("OUTBOX_GAP_TIMEOUT", "30")),
+        once=args.once,
+        force_rebuild=args.rebuild,
+    )
+
+
+if __name__ == "__main__":
+    main()
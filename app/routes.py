@@ -1,21 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+from typing import List, Optional, Union
 from decimal import Decimal
-
-from db import get_db
-from crud.inscriptions_crud import create_inscription, delete_inscription, get_inscriptions, get_inscription, get_inscriptions_by_student, calculate_student_fees, generate_fee_report,update_inscription
-from crud.students_crud import get_students, create_student, delete_student, update_student, get_student
+from datetime import date
+
+from db import get_db, get_session_factory
+from admission import admission_controller
+from idempotency import run_idempotent
+from jobs import report_queue, snapshot
+from feed import change_broadcaster, event_stream, KEEPALIVE_SECONDS, FEED_ENTITIES
+from metrics import registry
+from profiling import ProfilingRoute, profile_store, require_admin
+from tracing import TracingRoute
+from rollups import read_dashboard
+from crud.inscriptions_crud import create_inscription, delete_inscription, get_inscriptions, get_inscription, get_inscriptions_by_student, calculate_student_fees, generate_fee_report,update_inscription, get_student_dashboard, get_inscriptions_page, get_fee_report_page, PAGE_SIZE
+from crud.students_crud import get_students, create_student, delete_student, update_student, get_student, delete_students_bulk, search_students
 from crud import teacher_crud, instruments_crud, students_crud
-from crud.levels_crud import create_level, delete_level, update_level, get_levels, get_level
-from crud.packs_crud import create_pack, delete_pack, update_pack, get_packs, get_pack
+from crud.levels_crud import create_level, delete_level, update_level, get_levels, get_level, get_levels_by_ids
+from crud.packs_crud import create_pack, delete_pack, update_pack, get_packs, get_pack, get_packs_by_ids
 from crud.teacher_instruments_crud import get_teacher_instruments,get_teachers_instruments,update_teachers_instruments,create_teachers_instruments,delete_teacher_instruments
 from crud.pack_instruments_crud import create_packs_instruments, delete_packs_instruments, update_packs_instruments, get_pack_instruments, get_packs_instruments
 from schemas import Student, StudentCreate, Inscription, InscriptionCreate, InscriptionDetail,\
         FeeReport, Instrument, CreateInstrument, UpdateInstrument, Teacher, CreateTeacher, \
         Level, LevelCreate, LevelUpdate, Pack, PackCreate, PackUpdate, PacksInstruments, PacksInstrumentsCreate, \
         PacksInstrumentsUpdate, TeachersInstruments, TeachersInstrumentsCreate, TeachersInstrumentsUpdate, \
-        UpdateTeacher
+        UpdateTeacher, BatchResult, StudentDashboard, StudentBulkDelete, BulkDeleteResult, ReportJob, StudentSearchResult, \
+        InscriptionPage, FeeReportPage
 
 '''
 Este código define una API utilizando FastAPI para manejar operaciones CRUD (Crear, Leer, Actualizar, Eliminar) relacionadas 
@@ -23,14 +36,50 @@ con estudiantes, inscripciones, profesores, instrumentos, niveles, packs y asoci
 La interacción con la base de datos se maneja a través de SQLAlchemy.
 '''
 
-router = APIRouter()
+class AppRoute(TracingRoute, ProfilingRoute):
+    # Spans de trazas (ver tracing.py) y perfilado de una petición con X-Profile (ver profiling.py)
+    pass
+
+router = APIRouter(route_class=AppRoute)
+
+# Número máximo de IDs admitidos en una consulta por lotes
+MAX_BATCH_IDS = 500
+
+def parse_ids(ids: str) -> List[int]:
+    # Convierte "1,2,3" en [1, 2, 3] sin duplicados y manteniendo el orden
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="El parámetro ids debe ser una lista de enteros separados por comas")
+    parsed = list(dict.fromkeys(parsed))
+    if not parsed:
+        raise HTTPException(status_code=422, detail="El parámetro ids no puede estar vacío")
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=422, detail=f"Como máximo se admiten {MAX_BATCH_IDS} ids por consulta")
+    return parsed
+
+def batch_result(records, ids: List[int]) -> dict:
+    # Ordena los registros según los IDs pedidos y lista los que no existen
+    by_id = {record.id: record for record in records}
+    return {
+        "items": [by_id[i] for i in ids if i in by_id],
+        "missing": [i for i in ids if i not in by_id],
+    }
 
 @router.post("/students/", response_model=Student, tags=["students"])
-def create_students(student: StudentCreate, db: Session = Depends(get_db)):
-    db_student = create_student(db=db, student=student)
-    if db_student is None:
-        raise HTTPException(status_code=400, detail=f"Ya existe un estudiante con el nombre '{student.first_name}' y apellido '{student.last_name}', con '{student.age}' años")
-    return db_student
+def create_students(student: StudentCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        db_student = create_student(db=db, student=student)
+        if db_student is None:
+            raise HTTPException(status_code=400, detail=f"Ya existe un estudiante con el nombre '{student.first_name}' y apellido '{student.last_name}', con '{student.age}' años")
+        return db_student
+    return run_idempotent(db, idempotency_key, "POST /students/", student, create, Student)
+
+# Declarada antes que /students/{student_id} para que "search" no se interprete como un id
+@router.get("/students/search", response_model=StudentSearchResult, tags=["students"])
+def search_students_route(q: str = "", skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=200),
+                          db: Session = Depends(get_db)):
+    return search_students(db, q, skip=skip, limit=limit)
 
 @router.get("/students/{student_id}", response_model=Student, tags=["students"])
 def read_student(student_id: int, db: Session = Depends(get_db)):
@@ -39,8 +88,11 @@ def read_student(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Estudiante no encontrado")
     return db_student
 
-@router.get("/students/", response_model=List[Student], tags=["students"])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/students/", response_model=Union[List[Student], BatchResult[Student]], tags=["students"])
+def read_students(skip: int = 0, limit: int = 100, ids: Optional[str] = None, db: Session = Depends(get_db)):
+    if ids is not None:
+        student_ids = parse_ids(ids)
+        return batch_result(students_crud.get_students_by_ids(db, student_ids), student_ids)
     try:
         students = get_students(db, skip=skip, limit=limit)
         return students
@@ -54,6 +106,11 @@ def update_students(student_id: int, student: StudentCreate, db: Session = Depen
         raise HTTPException(status_code=404, detail="Student not found")
     return updated_student
 
+@router.post("/students/bulk-delete", response_model=BulkDeleteResult, tags=["students"])
+def bulk_delete_students(request: StudentBulkDelete, db: Session = Depends(get_db)):
+    # Borra varios estudiantes y sus inscripciones; los IDs inexistentes se ignoran
+    return {"deleted": delete_students_bulk(db, request.ids)}
+
 @router.delete("/students/{student_id}", tags=["students"])
 def delete_students(student_id: int, db: Session = Depends(get_db)):
     success = delete_student(db, student_id)
@@ -62,13 +119,34 @@ def delete_students(student_id: int, db: Session = Depends(get_db)):
     return {"message": "Student deleted successfully"}
 
 @router.post("/inscriptions/", response_model=Inscription, tags=["inscriptions"])
-def create_inscriptions(inscription: InscriptionCreate, db: Session = Depends(get_db)):
-    return create_inscription(db=db, inscription=inscription)
+def create_inscriptions(inscription: InscriptionCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        return create_inscription(db=db, inscription=inscription)
+    return run_idempotent(db, idempotency_key, "POST /inscriptions/", inscription, create, Inscription)
 
 @router.get("/inscriptions/", response_model=List[InscriptionDetail], tags=["inscriptions"])
 def read_inscriptions(db: Session = Depends(get_db)):
     return get_inscriptions(db)
 
+def page_cursor(after_value: Optional[str], after_id: Optional[int]):
+    # Cursor de la página anterior (next_cursor), recibido como after_value y after_id
+    if after_value is None and after_id is None:
+        return None
+    if after_value is None or after_id is None:
+        raise HTTPException(status_code=422, detail="after_value y after_id deben indicarse juntos")
+    return after_value, after_id
+
+# Declarada antes que /inscriptions/{inscription_id} para que "page" no se interprete como un id
+@router.get("/inscriptions/page", response_model=InscriptionPage, tags=["inscriptions"])
+def read_inscriptions_page(sort: str = "registration_date", descending: bool = True, student: Optional[str] = None,
+                           instrument: Optional[str] = None, level: Optional[str] = None,
+                           date_from: Optional[date] = None, date_to: Optional[date] = None,
+                           after_value: Optional[str] = None, after_id: Optional[int] = None,
+                           limit: int = Query(PAGE_SIZE, ge=1, le=200), db: Session = Depends(get_db)):
+    return get_inscriptions_page(db, sort=sort, descending=descending, student=student, instrument=instrument,
+                                 level=level, date_from=date_from, date_to=date_to,
+                                 after=page_cursor(after_value, after_id), limit=limit)
+
 @router.get("/inscriptions/{inscription_id}", response_model=Inscription, tags=["inscriptions"])
 def read_inscription(inscription_id: int, db: Session = Depends(get_db)):
     db_inscription = get_inscription(db, inscription_id)
@@ -105,14 +183,93 @@ def calculate_student_fee(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Student not found")
     return float(fee)
 
+@router.get("/students/{student_id}/dashboard", response_model=StudentDashboard, tags=["students"])
+def read_student_dashboard(student_id: int, db: Session = Depends(get_db)):
+    dashboard = get_student_dashboard(db, student_id)
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+    return dashboard
+
 @router.get("/fee_report/", response_model=List[FeeReport], tags=["fees"])
 def get_fee_report(db: Session = Depends(get_db)):
     return generate_fee_report(db)
 
+@router.get("/fee_report/page", response_model=FeeReportPage, tags=["fees"])
+def get_fee_report_page_route(sort: str = "student", descending: bool = False, student: Optional[str] = None,
+                              family: Optional[bool] = None, min_inscriptions: int = Query(0, ge=0),
+                              after_value: Optional[str] = None, after_id: Optional[int] = None,
+                              limit: int = Query(PAGE_SIZE, ge=1, le=200), db: Session = Depends(get_db)):
+    return get_fee_report_page(db, sort=sort, descending=descending, student=student, family=family,
+                               min_inscriptions=min_inscriptions, after=page_cursor(after_value, after_id), limit=limit)
+
+# Tablas de las que depende el informe de tarifas: un cambio en cualquiera invalida el informe en caché
+FEE_REPORT_TABLES = ("students", "inscriptions", "levels", "instruments", "packs", "packs_instruments")
+
+@router.post("/reports/fees", response_model=ReportJob, status_code=202, tags=["fees"])
+def request_fee_report(response: Response, db: Session = Depends(get_db), session_factory=Depends(get_session_factory)):
+    # Encola el informe de tarifas; el resultado se consulta en GET /reports/{id} desde cualquier worker
+    job = report_queue.submit(db, "fees", generate_fee_report, session_factory, FEE_REPORT_TABLES)
+    response.headers["Location"] = f"/reports/{job.id}"
+    return snapshot(job)
+
+@router.get("/reports/{job_id}", response_model=ReportJob, tags=["fees"])
+def read_report(job_id: str, db: Session = Depends(get_db)):
+    job = report_queue.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    return snapshot(job)
+
+@router.get("/analytics/", tags=["analytics"])
+def read_analytics(db: Session = Depends(get_db)):
+    # Panel de análisis: lecturas de las tablas de resumen (ver rollups.py)
+    return read_dashboard(db)
+
+@router.get("/changes/stream", tags=["changes"])
+async def stream_changes(last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+                         entities: Optional[str] = None, db: Session = Depends(get_db)):
+    # Server-Sent Events con los cambios confirmados por cualquier proceso (ver feed.py);
+    # ?entities=students,inscriptions filtra por tabla
+    wanted = None
+    if entities:
+        wanted = {e.strip() for e in entities.split(",") if e.strip()}
+        unknown = wanted - set(FEED_ENTITIES)
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Entidades desconocidas: {', '.join(sorted(unknown))}")
+    # El historial se lee de la base de datos fuera del bucle de eventos
+    subscriber, backlog, reset = await run_in_threadpool(
+        change_broadcaster.subscribe, db, last_event_id or None, wanted, asyncio.get_running_loop())
+    return StreamingResponse(
+        event_stream(change_broadcaster, subscriber, backlog, reset, KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/test/", tags=["test"])
 def test_endpoint():
     return {"message": "Test endpoint is working"}
 
+@router.get("/metrics", tags=["metrics"])
+async def read_metrics():
+    # Formato de texto de Prometheus
+    return Response(registry.exposition(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/admission/", tags=["admission"])
+async def read_admission_status():
+    # Peticiones en curso, en cola y rechazadas por cada clase de ruta
+    return admission_controller.snapshot()
+
+@router.get("/admin/profiles", tags=["admin"], dependencies=[Depends(require_admin)])
+def list_profiles():
+    # Perfiles guardados por cualquier worker, del más reciente al más antiguo
+    return profile_store.list()
+
+@router.get("/admin/profiles/{profile_id}", tags=["admin"], dependencies=[Depends(require_admin)])
+def read_profile(profile_id: str):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return profile
+
 
 
 @router.get("/teachers/{teacher_id}", response_model=Teacher, tags=["teachers"])
@@ -122,19 +279,24 @@ def read_teacher(teacher_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Profesor no encontrado")
     return db_teacher
 
-@router.get("/teachers/", response_model=List[Teacher], tags=["teachers"])
-def read_teachers(db: Session = Depends(get_db)):
+@router.get("/teachers/", response_model=Union[List[Teacher], BatchResult[Teacher]], tags=["teachers"])
+def read_teachers(ids: Optional[str] = None, db: Session = Depends(get_db)):
+    if ids is not None:
+        teacher_ids = parse_ids(ids)
+        return batch_result(teacher_crud.get_teachers_by_ids(db, teacher_ids), teacher_ids)
     teachers = teacher_crud.get_teachers(db)
     if teachers is None:
         raise HTTPException(status_code=404, detail="Ningún profesor registrado")
     return teachers
 
 @router.post("/teachers/", response_model=Teacher, tags=["teachers"])
-def create_teacher(teacher: CreateTeacher, db: Session = Depends(get_db)):
-    teacher = teacher_crud.create_teacher(db, teacher=teacher)
-    if teacher is None:
-        raise HTTPException(status_code=404, detail="Ya existe el profesor")
-    return teacher
+def create_teacher(teacher: CreateTeacher, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        new_teacher = teacher_crud.create_teacher(db, teacher=teacher)
+        if new_teacher is None:
+            raise HTTPException(status_code=404, detail="Ya existe el profesor")
+        return new_teacher
+    return run_idempotent(db, idempotency_key, "POST /teachers/", teacher, create, Teacher)
 
 @router.put("/teachers/{teacher_id}", response_model=Teacher, tags=["teachers"])
 def update_teacher(teacher_id: int, teacher: UpdateTeacher, db: Session = Depends(get_db)):
@@ -158,20 +320,25 @@ def read_instrument(instrument_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Instrumento no encontrado")
     return db_instrument
 
-@router.get("/instruments/", response_model=List[Instrument], tags=["instruments"])
-def read_instruments(db: Session = Depends(get_db)):
+@router.get("/instruments/", response_model=Union[List[Instrument], BatchResult[Instrument]], tags=["instruments"])
+def read_instruments(ids: Optional[str] = None, db: Session = Depends(get_db)):
+    if ids is not None:
+        instrument_ids = parse_ids(ids)
+        return batch_result(instruments_crud.get_instruments_by_ids(db, instrument_ids), instrument_ids)
     instruments = instruments_crud.get_all_instruments(db)
     if instruments is None:
         raise HTTPException(status_code=404, detail="Ningún instrumento registrado")
     return instruments
 
 @router.post("/instruments/", response_model=Instrument, tags=["instruments"])
-def create_instrument(instrument: CreateInstrument, db: Session = Depends(get_db)):
-    try:
-        new_instrument = instruments_crud.create_instrument(db, name=instrument.name, price=instrument.price)
-        return new_instrument
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+def create_instrument(instrument: CreateInstrument, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        try:
+            new_instrument = instruments_crud.create_instrument(db, name=instrument.name, price=instrument.price)
+            return new_instrument
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return run_idempotent(db, idempotency_key, "POST /instruments/", instrument, create, Instrument)
 
 @router.put("/instruments/{instrument_id}", response_model=Instrument, tags=["instruments"])
 def update_instrument(instrument_id: int, instrument: UpdateInstrument, db: Session = Depends(get_db)):
@@ -203,16 +370,21 @@ def read_level(level_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Nivel no encontrado")
     return db_level
 
-@router.get("/levels/", response_model=List[Level], tags=["levels"])
-def read_levels(db: Session = Depends(get_db)):
+@router.get("/levels/", response_model=Union[List[Level], BatchResult[Level]], tags=["levels"])
+def read_levels(ids: Optional[str] = None, db: Session = Depends(get_db)):
+    if ids is not None:
+        level_ids = parse_ids(ids)
+        return batch_result(get_levels_by_ids(db, level_ids), level_ids)
     return get_levels(db)
 
 @router.post("/levels/", response_model=Level, tags=["levels"])
-def create_levels(level: LevelCreate, db: Session = Depends(get_db)):
-    db_level = create_level(db, instruments_id=level.instruments_id, level=level.level)
-    if db_level is None:
-        raise HTTPException(status_code=400, detail="El nivel ya existe")
-    return db_level
+def create_levels(level: LevelCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        db_level = create_level(db, instruments_id=level.instruments_id, level=level.level)
+        if db_level is None:
+            raise HTTPException(status_code=400, detail="El nivel ya existe")
+        return db_level
+    return run_idempotent(db, idempotency_key, "POST /levels/", level, create, Level)
 
 @router.put("/levels/{level_id}", response_model=Level, tags=["levels"])
 def update_levels(level_id: int, level_update: LevelUpdate, db: Session = Depends(get_db)):
@@ -235,16 +407,21 @@ def read_pack(pack_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Pack no encontrado")
     return db_pack
 
-@router.get("/packs/", response_model=List[Pack], tags=["packs"])
-def read_packs(db: Session = Depends(get_db)):
+@router.get("/packs/", response_model=Union[List[Pack], BatchResult[Pack]], tags=["packs"])
+def read_packs(ids: Optional[str] = None, db: Session = Depends(get_db)):
+    if ids is not None:
+        pack_ids = parse_ids(ids)
+        return batch_result(get_packs_by_ids(db, pack_ids), pack_ids)
     return get_packs(db)
 
 @router.post("/packs/", response_model=Pack, tags=["packs"])
-def create_packs(pack: PackCreate, db: Session = Depends(get_db)):
-    db_pack = create_pack(db, pack=pack.pack, discount_1=pack.discount_1, discount_2=pack.discount_2)
-    if db_pack is None:
-        raise HTTPException(status_code=400, detail="El pack ya existe")
-    return db_pack
+def create_packs(pack: PackCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        db_pack = create_pack(db, pack=pack.pack, discount_1=pack.discount_1, discount_2=pack.discount_2)
+        if db_pack is None:
+            raise HTTPException(status_code=400, detail="El pack ya existe")
+        return db_pack
+    return run_idempotent(db, idempotency_key, "POST /packs/", pack, create, Pack)
 
 @router.put("/packs/{pack_id}", response_model=Pack, tags=["packs"])
 def update_packs(pack_id: int, pack_update: PackUpdate, db: Session = Depends(get_db)):
@@ -273,11 +450,13 @@ def read_packs_instruments(db: Session = Depends(get_db)):
     return get_packs_instruments(db)
 
 @router.post("/packs_instruments/", response_model=PacksInstruments, tags=["packs_instruments"])
-def create_pack_instruments(packs_instruments: PacksInstrumentsCreate, db: Session = Depends(get_db)):
-    db_pack_instruments = create_packs_instruments(db, packs_id=packs_instruments.packs_id, instrument_id=packs_instruments.instrument_id)
-    if db_pack_instruments is None:
-        raise HTTPException(status_code=400, detail="El pack de instrumentos ya existe")
-    return db_pack_instruments
+def create_pack_instruments(packs_instruments: PacksInstrumentsCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        db_pack_instruments = create_packs_instruments(db, packs_id=packs_instruments.packs_id, instrument_id=packs_instruments.instrument_id)
+        if db_pack_instruments is None:
+            raise HTTPException(status_code=400, detail="El pack de instrumentos ya existe")
+        return db_pack_instruments
+    return run_idempotent(db, idempotency_key, "POST /packs_instruments/", packs_instruments, create, PacksInstruments)
 
 @router.put("/packs_instruments/{packs_instruments_id}", response_model=PacksInstruments, tags=["packs_instruments"])
 def update_pack_instrument(packs_instruments_id: int, packs_instruments_update: PacksInstrumentsUpdate, db: Session = Depends(get_db)):
@@ -305,11 +484,13 @@ def read_teachers_instruments(db: Session = Depends(get_db)):
     return get_teachers_instruments(db)
 
 @router.post("/teachers_instruments/", response_model=TeachersInstruments, tags=["teachers_instruments"])
-def create_teacher_instrument(teachers_instruments: TeachersInstrumentsCreate, db: Session = Depends(get_db)):
-    db_teachers_instruments = create_teachers_instruments(db, teacher_id=teachers_instruments.teacher_id, instrument_id=teachers_instruments.instrument_id)
-    if db_teachers_instruments is None:
-        raise HTTPException(status_code=400, detail="La asociación de profesor e instrumento ya existe")
-    return db_teachers_instruments
+def create_teacher_instrument(teachers_instruments: TeachersInstrumentsCreate, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def create():
+        db_teachers_instruments = create_teachers_instruments(db, teacher_id=teachers_instruments.teacher_id, instrument_id=teachers_instruments.instrument_id)
+        if db_teachers_instruments is None:
+            raise HTTPException(status_code=400, detail="La asociación de profesor e instrumento ya existe")
+        return db_teachers_instruments
+    return run_idempotent(db, idempotency_key, "POST /teachers_instruments/", teachers_instruments, create, TeachersInstruments)
 
 @router.put("/teachers_instruments/{teachers_instruments_id}", response_model=TeachersInstruments, tags=["teachers_instruments"])
 def update_teachers_instrument(teachers_instruments_id: int, teachers_instruments_update: TeachersInstrumentsUpdate, db: Session = Depends(get_db)):
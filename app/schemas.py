@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from decimal import Decimal
-from typing import Optional
-from datetime import date
+from typing import Any, Optional, List, Generic, Tuple, TypeVar
+from datetime import date, datetime
 
 class CreateTeacher(BaseModel):
 	first_name: str
@@ -56,6 +56,14 @@ class StudentCreate(StudentBase):
     pass
 
 
+class StudentBulkDelete(BaseModel):
+    ids: List[int]
+
+
+class BulkDeleteResult(BaseModel):
+    deleted: int
+
+
 class Student(StudentBase):
     id: int
 
@@ -104,6 +112,23 @@ class FeeReport(BaseModel):
     class Config:
         orm_mode = True
 
+class FeeLine(BaseModel):
+    inscription_id: int
+    instrument_id: int
+    instrument_name: str
+    level: str
+    base_price: float
+    pack: Optional[str] = None
+    discount: float
+    price: float
+
+
+class FeeBreakdown(BaseModel):
+    lines: List[FeeLine]
+    subtotal: float
+    family_discount: bool
+    total_fee: float
+
 class LevelCreate(BaseModel):
     instruments_id: int
     level: str
@@ -132,6 +157,12 @@ class PackUpdate(BaseModel):
     class Config:
         orm_mode = True
         
+class StudentDashboard(BaseModel):
+    student: Student
+    inscriptions: List[InscriptionDetail]
+    fee: FeeBreakdown
+    packs: List[Pack]
+
 class PacksInstrumentsCreate(BaseModel):
     
     packs_id: int
@@ -160,3 +191,39 @@ class TeachersInstrumentsUpdate(BaseModel):
         orm_mode = True
 
 
+T = TypeVar("T")
+
+class ReportJob(BaseModel):
+    # Estado de un informe en segundo plano; result solo está disponible cuando status es "done"
+    id: str
+    kind: str
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class StudentSearchResult(BaseModel):
+    # Página de resultados de /students/search; has_more indica si hay más resultados a partir de skip + limit
+    items: List[Student]
+    skip: int
+    limit: int
+    has_more: bool
+
+
+class InscriptionPage(BaseModel):
+    # Página de /inscriptions/page; next_cursor es [valor de la columna de orden, id] de la última fila, o None
+    items: List[InscriptionDetail]
+    next_cursor: Optional[Tuple[Any, int]] = None
+
+
+class FeeReportPage(BaseModel):
+    items: List[FeeReport]
+    next_cursor: Optional[Tuple[Any, int]] = None
+
+
+class BatchResult(BaseModel, Generic[T]):
+    # Resultado de una consulta por lotes (?ids=1,2,3): registros en el orden pedido e IDs no encontrados
+    items: List[T]
+    missing: List[int]
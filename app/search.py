@@ -0,0 +1,27 @@
+import re
+import unicodedata
+from typing import List
+
+'''
+Normalización de texto para las búsquedas por nombre.
+
+Las palabras del nombre y del apellido de cada estudiante se guardan en minúsculas y sin acentos en la tabla
+student_search_tokens, una fila por palabra: "José María Pérez" -> jose, maria, perez. Buscar "mar pe" exige
+que el estudiante tenga una palabra que empiece por "mar" y otra que empiece por "pe" (token LIKE 'mar%'),
+sin distinguir mayúsculas ni acentos. Como el patrón no empieza por un comodín, cada término se resuelve
+con un rango del índice de la tabla en lugar de recorrer todos los estudiantes.
+'''
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    # Minúsculas y sin marcas diacríticas (á -> a, ñ -> n, ü -> u)
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def search_tokens(text: str) -> List[str]:
+    # Palabras normalizadas, sin repetir; solo contienen letras y números, así que no hace falta escaparlas en LIKE
+    return list(dict.fromkeys(token for token in _SEPARATORS.split(normalize(text)) if token))
+
@@ -0,0 +1,51 @@
+import os
+
+import uvicorn
+
+'''
+Arranque de la API en modo producción con uvicorn.
+
+Se lanza con "python server.py" y se configura mediante variables de entorno:
+    APP_HOST: interfaz en la que escucha el servidor (por defecto 127.0.0.1).
+    APP_PORT: puerto (por defecto 8000).
+    WEB_CONCURRENCY: número de procesos worker (por defecto 1).
+    UVICORN_LOOP: bucle de eventos, "uvloop" o "asyncio" (por defecto uvloop).
+    UVICORN_HTTP: implementación HTTP, "httptools" o "h11" (por defecto httptools).
+    UVICORN_BACKLOG: número máximo de conexiones pendientes de aceptar (por defecto 2048).
+    UVICORN_KEEPALIVE: segundos que se mantiene abierta una conexión keep-alive inactiva (por defecto 5).
+
+Cada worker importa la aplicación por separado, por lo que el engine y el pool de conexiones de db.py
+se crean dentro de cada worker y nunca se comparten entre procesos. Las tareas de arranque que modifican
+datos (p. ej. guardar las palabras de búsqueda que falten) se ejecutan una sola vez, antes de lanzar los
+workers, para que varios procesos no las hagan a la vez.
+'''
+
+def server_options() -> dict:
+    return {
+        "host": os.getenv("APP_HOST", "127.0.0.1"),
+        "port": int(os.getenv("APP_PORT", "8000")),
+        "workers": int(os.getenv("WEB_CONCURRENCY", "1")),
+        "loop": os.getenv("UVICORN_LOOP", "uvloop"),
+        "http": os.getenv("UVICORN_HTTP", "httptools"),
+        "backlog": int(os.getenv("UVICORN_BACKLOG", "2048")),
+        "timeout_keep_alive": int(os.getenv("UVICORN_KEEPALIVE", "5")),
+    }
+
+def prepare_database():
+    # Tablas nuevas y palabras de búsqueda de los estudiantes creados antes de existir la tabla (ver search.py)
+    from db import engine, SessionLocal
+    from models import Base
+    from crud.students_crud import backfill_search_tokens
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        backfill_search_tokens(db)
+    # Los workers crean su propio pool
+    engine.dispose()
+
+def run():
+    prepare_database()
+    # Con varios workers uvicorn necesita la ruta de importación de la aplicación, no el objeto
+    uvicorn.run("main:app", **server_options())
+
+if __name__ == "__main__":
+    run()
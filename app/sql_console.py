@@ -0,0 +1,286 @@
+import os
+import csv
+import time
+import uuid
+import logging
+import tempfile
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from deadlines import deadline_scope, DeadlineExceeded
+
+'''
+Ejecución de las consultas de la consola SQL de la GUI en segundo plano, con cancelación.
+
+Cada consulta se ejecuta en su propio hilo y su propia conexión, con un cursor del lado del servidor
+(stream_results): las filas se leen por páginas a medida que llegan, y la GUI muestra el número de filas y el
+tiempo transcurrido mientras la consulta sigue en curso. Hace falta un driver con cursores del lado del
+servidor (psycopg2, pymysql, mysqlclient; SQLite lee las filas a medida que se piden): con otros, como
+mysql-connector, el driver lee el resultado entero antes de devolver la primera página (ver
+query_governor.streaming_url, que cambia el driver de MySQL de la consola). En memoria se conservan como máximo
+SQL_CONSOLE_MAX_ROWS filas para verlas por páginas; si se pide exportar, el resultado completo se escribe en un
+fichero CSV o Parquet página a página, sin cargarlo entero en memoria.
+
+Cancelar una consulta la detiene en el servidor, no solo en la GUI:
+    - MySQL/MariaDB: KILL QUERY con el id de la conexión que la ejecuta, desde otra conexión.
+    - PostgreSQL: pg_cancel_backend con el pid del proceso que la ejecuta.
+    - SQLite: interrupt() sobre la conexión.
+Las sentencias que modifican datos se confirman al terminar; si se cancelan, se revierten.
+
+Al cumplirse SQL_CONSOLE_TIMEOUT la consulta se detiene en el servidor de la misma forma, aunque este no la haya
+cortado: en MySQL max_execution_time solo limita los SELECT, no los UPDATE, DELETE o DDL del Super-user.
+
+Configuración por variables de entorno:
+    SQL_CONSOLE_PAGE_SIZE: filas leídas del servidor por página (por defecto 500).
+    SQL_CONSOLE_MAX_ROWS: filas que se conservan para verlas en la GUI (por defecto 100000).
+    SQL_CONSOLE_TIMEOUT: tiempo máximo de ejecución de cada consulta en segundos (por defecto 300).
+'''
+
+logger = logging.getLogger("music_app")
+
+# Parquet es opcional; pyarrow solo se importa al exportar
+EXPORT_FORMATS = ("csv", "parquet") if importlib.util.find_spec("pyarrow") is not None else ("csv",)
+
+
+def _config(name: str, default: str) -> float:
+    return float(os.getenv(name, default))
+
+
+class _CsvExport:
+    def __init__(self, path: str, columns: List[str]):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetExport:
+    def __init__(self, path: str, columns: List[str]):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self._writer = None
+
+    def write(self, rows: List[tuple]):
+        pa = self._pa
+        data = {name: [row[i] for row in rows] for i, name in enumerate(self.columns)}
+        if self._writer is None:
+            table = pa.Table.from_pydict(data)
+            # Las columnas sin valores en la primera página se guardan como texto
+            schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+            self._writer = self._pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(pa.Table.from_pydict(data, schema=self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            pa = self._pa
+            self._pq.write_table(pa.table({name: pa.array([], pa.string()) for name in self.columns}), self.path)
+
+
+EXPORTERS = {"csv": _CsvExport, "parquet": _ParquetExport}
+
+
+class QueryJob:
+    '''Consulta en curso o terminada. status: running, done, cancelled o failed.'''
+
+    def __init__(self, engine: Engine, sql: str, export_format: Optional[str] = None,
+                 page_size: Optional[int] = None, max_rows: Optional[int] = None, timeout: Optional[float] = None):
+        if export_format is not None and export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato de exportación no disponible: {export_format}")
+        self.id = uuid.uuid4().hex
+        self.engine = engine
+        self.sql = sql
+        self.export_format = export_format
+        self.page_size = page_size or int(_config("SQL_CONSOLE_PAGE_SIZE", "500"))
+        self.max_rows = max_rows or int(_config("SQL_CONSOLE_MAX_ROWS", "100000"))
+        self.timeout = timeout or _config("SQL_CONSOLE_TIMEOUT", "300")
+
+        self.status = "running"
+        self.columns: List[str] = []
+        self.rows: List[tuple] = []
+        self.row_count = 0
+        self.rowcount: Optional[int] = None
+        self.returns_rows = False
+        self.error: Optional[str] = None
+        self.export_path: Optional[str] = None
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._timed_out = threading.Event()
+        self._kill = None
+        # SQLite no tiene cursores del lado del servidor, pero también lee las filas a medida que se piden
+        self.streaming = bool(engine.dialect.supports_server_side_cursors) or engine.dialect.name == "sqlite"
+        if not self.streaming:
+            logger.warning("El driver %s no lee los resultados por páginas: la consulta se leerá entera antes de mostrarse",
+                           engine.dialect.driver)
+        self._thread = threading.Thread(target=self._run, name=f"sql-console-{self.id[:8]}", daemon=True)
+
+    def start(self) -> "QueryJob":
+        self._thread.start()
+        return self
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def truncated(self) -> bool:
+        return self.row_count > len(self.rows)
+
+    def page(self, number: int, size: int) -> List[tuple]:
+        with self._lock:
+            return self.rows[number * size:(number + 1) * size]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def cancel(self):
+        # Marca la consulta como cancelada y la detiene en el servidor si está en ejecución
+        if self.status != "running":
+            return
+        self._cancelled.set()
+        kill = self._kill
+        if kill is not None:
+            try:
+                kill()
+            except Exception as e:
+                logger.warning("No se pudo cancelar la consulta en el servidor: %s", e)
+
+    def _control_connection(self):
+        # Conexión aparte, fuera del pool: el pool de la consola puede estar lleno de consultas en curso
+        return create_engine(self.engine.url, poolclass=NullPool).connect()
+
+    def _server_kill(self, connection):
+        # Función que detiene la sentencia en curso de la conexión
+        dialect = self.engine.dialect.name
+        if dialect in ("mysql", "mariadb"):
+            connection_id = connection.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+            def kill():
+                with self._control_connection() as other:
+                    other.exec_driver_sql(f"KILL QUERY {int(connection_id)}")
+            return kill
+        if dialect == "postgresql":
+            pid = connection.exec_driver_sql("SELECT pg_backend_pid()").scalar()
+            def kill():
+                with self._control_connection() as other:
+                    other.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+            return kill
+        if dialect == "sqlite":
+            return connection.connection.dbapi_connection.interrupt
+        return None
+
+    def _expire(self):
+        # Vigilante del tiempo máximo: detiene en el servidor la sentencia que este no ha cortado
+        kill = self._kill
+        if self.status != "running" or kill is None:
+            return
+        self._timed_out.set()
+        try:
+            kill()
+        except Exception as e:
+            logger.warning("No se pudo detener la consulta que excedió el tiempo límite: %s", e)
+
+    def _run(self):
+        exporter = None
+        watchdog = None
+        try:
+            with deadline_scope(self.timeout), self.engine.connect() as connection:
+                self._kill = self._server_kill(connection)
+                if self._cancelled.is_set():
+                    raise InterruptedError()
+                watchdog = threading.Timer(max(self.timeout - self.elapsed, 0), self._expire)
+                watchdog.daemon = True
+                watchdog.start()
+                connection = connection.execution_options(stream_results=True, max_row_buffer=self.page_size)
+                with connection.begin() as transaction:
+                    result = connection.execute(text(self.sql))
+                    self.returns_rows = result.returns_rows
+                    if not result.returns_rows:
+                        self.rowcount = result.rowcount
+                    else:
+                        self.columns = list(result.keys())
+                        if self.export_format:
+                            handle, self.export_path = tempfile.mkstemp(prefix="sql_console_", suffix=f".{self.export_format}")
+                            os.close(handle)
+                            exporter = EXPORTERS[self.export_format](self.export_path, self.columns)
+                        for partition in result.partitions(self.page_size):
+                            if self._cancelled.is_set():
+                                raise InterruptedError()
+                            rows = [tuple(row) for row in partition]
+                            if exporter is not None:
+                                exporter.write(rows)
+                            with self._lock:
+                                room = self.max_rows - len(self.rows)
+                                if room > 0:
+                                    self.rows.extend(rows[:room])
+                                self.row_count += len(rows)
+                            if exporter is None and self.row_count >= self.max_rows:
+                                # Sin exportación no hace falta leer más filas de las que se pueden ver
+                                break
+                        result.close()
+                    if self._cancelled.is_set() or self._timed_out.is_set():
+                        raise InterruptedError()
+                    transaction.commit()
+            self.status = "done"
+        except Exception as e:
+            if self._cancelled.is_set():
+                self.status = "cancelled"
+            else:
+                self.status = "failed"
+                timed_out = (isinstance(e, DeadlineExceeded) or self._timed_out.is_set()
+                             or self.elapsed >= self.timeout)
+                self.error = "La consulta excedió el tiempo límite de ejecución." if timed_out else str(e)
+                logger.warning("Error en una consulta de la consola SQL: %s", e)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            self._kill = None
+            if exporter is not None:
+                exporter.close()
+            if self.status != "done" and self.export_path:
+                os.remove(self.export_path)
+                self.export_path = None
+            self.finished = time.monotonic()
+
+
+class QueryRegistry:
+    '''Consultas de la consola por id, compartidas por las ejecuciones del script de Streamlit del proceso.'''
+
+    def __init__(self, retained: int = 20):
+        self.retained = retained
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, QueryJob]" = OrderedDict()
+
+    def submit(self, engine: Engine, sql: str, **options) -> QueryJob:
+        job = QueryJob(engine, sql, **options)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Se descartan las consultas terminadas más antiguas y sus ficheros exportados
+            for old_id in [i for i, j in self._jobs.items() if j.status != "running"][:max(0, len(self._jobs) - self.retained)]:
+                old = self._jobs.pop(old_id)
+                if old.export_path and os.path.exists(old.export_path):
+                    os.remove(old.export_path)
+        return job.start()
+
+    def get(self, job_id: Optional[str]) -> Optional[QueryJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
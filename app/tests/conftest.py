@@ -2,7 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from datetime import date
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -20,6 +20,16 @@ engine = create_engine(DATABASE_URL_TEST,
 					   connect_args={"check_same_thread": False},
 					   poolclass=StaticPool)
 
+# pysqlite no emite BEGIN por sí mismo y un RELEASE SAVEPOINT sin BEGIN confirma los cambios: se desactiva su
+# gestión de transacciones y se emite BEGIN explícitamente, para que los savepoints de db_session funcionen
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+	dbapi_connection.isolation_level = None
+
+@event.listens_for(engine, "begin")
+def _emit_begin(conn):
+	conn.exec_driver_sql("BEGIN")
+
 TestingSessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 Base.metadata.create_all(bind=engine)
@@ -28,7 +38,9 @@ Base.metadata.create_all(bind=engine)
 def db_session():
 	connection = engine.connect()
 	transaction = connection.begin()
-	session = TestingSessionLocal(bind=connection)
+	# Los commit y rollback de las funciones CRUD actúan sobre un savepoint: la transacción del fixture
+	# sigue abierta hasta el final del test
+	session = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
 	yield session
 	session.close()
 	transaction.rollback()
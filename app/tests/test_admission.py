@@ -0,0 +1,42 @@
+import asyncio
+
+from admission import Gate, classify_request
+
+'''Tests para el control de admisión de peticiones.'''
+
+
+def test_classify_request():
+	assert classify_request("GET", "/fee_report/") == "heavy"
+	assert classify_request("GET", "/inscriptions/") == "heavy"
+	assert classify_request("GET", "/inscriptions/1") == "cheap"
+	assert classify_request("POST", "/students/") == "write"
+
+def test_gate_rejects_when_queue_full():
+	async def scenario():
+		gate = Gate(limit=1, max_queue=1)
+		assert await gate.acquire(timeout=1)
+		# El segundo espera en cola, el tercero se rechaza al estar la cola llena
+		waiting = asyncio.ensure_future(gate.acquire(timeout=1))
+		await asyncio.sleep(0)
+		assert gate.snapshot()["queued"] == 1
+		assert await gate.acquire(timeout=1) is False
+		# Al liberar, el hueco pasa al que estaba en cola
+		gate.release()
+		assert await waiting is True
+		assert gate.snapshot()["in_flight"] == 1
+		gate.release()
+		assert gate.snapshot() == {"limit": 1, "max_queue": 1, "in_flight": 0, "queued": 0, "rejected": 1}
+	asyncio.run(scenario())
+
+def test_gate_queue_timeout():
+	async def scenario():
+		gate = Gate(limit=1, max_queue=5)
+		await gate.acquire(timeout=1)
+		assert await gate.acquire(timeout=0.01) is False
+		assert gate.snapshot()["queued"] == 0
+	asyncio.run(scenario())
+
+def test_admission_status_endpoint(client):
+	res = client.get("/admission/")
+	assert res.status_code == 200
+	assert set(res.json()) == {"cheap", "heavy", "write"}
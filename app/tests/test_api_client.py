@@ -0,0 +1,41 @@
+import pytest
+
+from api_client import ApiClient, ApiError
+
+'''Tests para el cliente de la API que usa la GUI en modo API.'''
+
+
+@pytest.fixture
+def api(client):
+	# TestClient es un httpx.Client: el cliente llama a la aplicación sin servidor
+	return ApiClient(client=client)
+
+def test_instrument_and_teacher_operations(api, teacher):
+	instrument = api.create_instrument("Violín", 40.5)
+	assert instrument.name == "Violín"
+	assert float(api.update_instrument(instrument.id, price=45).price) == 45
+	assert api.update_instrument(999999, price=45) is None
+	assert any(i["id"] == instrument.id for i in api.list_instruments())
+	assert api.delete_instrument(instrument.id) is True
+	assert api.delete_instrument(instrument.id) is False
+
+	created = api.create_teacher(teacher)
+	with pytest.raises(ApiError) as error:
+		api.create_teacher(teacher)
+	assert error.value.status_code == 400
+	assert api.update_teacher(created.id, {"phone": "600000000"}).phone == "600000000"
+	assert api.update_teacher(999999, {"phone": "600000000"}) is None
+	assert api.delete_teacher(created.id) is True
+	assert api.delete_teacher(created.id) is False
+
+def test_inscriptions_page_cursor_round_trip(api, client, student, inscription):
+	for i in range(3):
+		student_id = client.post("/students/", json=dict(student, first_name=f"Alumno{i}")).json()["id"]
+		api.create_inscription(dict(inscription, student_id=student_id))
+	first = api.get_inscriptions_page(limit=2)
+	second = api.get_inscriptions_page(after=first["next_cursor"], limit=2)
+	assert len(first["items"]) == 2 and len(second["items"]) == 1
+	assert second["next_cursor"] is None
+	ids = {row["inscription_id"] for row in first["items"] + second["items"]}
+	assert len(ids) == 3
+	assert client.get("/inscriptions/page", params={"after_value": "no-es-fecha", "after_id": 1}).status_code == 422
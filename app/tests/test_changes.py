@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import ChangeLogEntry
+from feed import ChangeBroadcaster, event_stream
+
+'''Tests para el canal de cambios (Server-Sent Events).'''
+
+
+def last_log_id(db_session):
+	return db_session.scalar(select(func.max(ChangeLogEntry.id))) or 0
+
+def add_entries(db_session, count, age_seconds=0, start=None):
+	start = (last_log_id(db_session) if start is None else start - 1)
+	for i in range(1, count + 1):
+		db_session.add(ChangeLogEntry(id=start + i, entity="students", entity_id=start + i, op="created", version=1,
+									  created_at=datetime.utcnow() - timedelta(seconds=age_seconds)))
+	db_session.commit()
+	return [start + i for i in range(1, count + 1)]
+
+def test_crud_changes_are_logged(client, db_session, inscription, student):
+	start = last_log_id(db_session)
+	new_student = client.post("/students/", json=student).json()
+	inscription["student_id"] = new_student["id"]
+	new_inscription = client.post("/inscriptions/", json=inscription).json()
+	client.put(f"/students/{new_student['id']}", json=dict(student, phone="600090000"))
+	client.delete(f"/students/{new_student['id']}")
+	entries = db_session.scalars(select(ChangeLogEntry).where(ChangeLogEntry.id > start).order_by(ChangeLogEntry.id)).all()
+	assert [(e.entity, e.entity_id, e.op) for e in entries] == [
+		("students", new_student["id"], "created"),
+		("inscriptions", new_inscription["id"], "created"),
+		("students", new_student["id"], "updated"),
+		("students", new_student["id"], "deleted"),
+		("inscriptions", new_inscription["id"], "deleted"),
+	]
+	# La versión es la compartida de la tabla, la misma para todos los procesos
+	assert entries[3].version == entries[2].version + 1
+
+def test_resume_from_last_event_id(db_session):
+	async def run():
+		ids = add_entries(db_session, 3)
+		broadcaster = ChangeBroadcaster(max_pending=2)
+		subscriber, backlog, reset = broadcaster.subscribe(db_session, last_event_id=str(ids[0]))
+		assert not reset and [e["event_id"] for e in backlog] == ids[1:]
+		# Más cambios perdidos de los que se recuperan: el cliente debe recargar
+		assert broadcaster.subscribe(db_session, last_event_id=str(ids[0] - 1))[2]
+		# Id que no se ha asignado nunca (p. ej. de otra base de datos) o que no es un id
+		assert broadcaster.subscribe(db_session, last_event_id=str(ids[-1] + 50))[2]
+		assert broadcaster.subscribe(db_session, last_event_id="abc")[2]
+		# Id ya borrado de la tabla
+		db_session.query(ChangeLogEntry).filter(ChangeLogEntry.id <= ids[1]).delete()
+		assert broadcaster.subscribe(db_session, last_event_id=str(ids[0]))[2]
+	asyncio.run(run())
+
+def test_event_stream_delivers_committed_changes(client, db_session, student, instrument):
+	async def run():
+		broadcaster = ChangeBroadcaster()
+		subscriber, backlog, reset = broadcaster.subscribe(db_session, entities={"students"})
+		stream = event_stream(broadcaster, subscriber, backlog, reset, keepalive=5)
+		assert await stream.__anext__() == "retry: 3000\n\n"
+		# Cambios confirmados por otra sesión (otro worker o la GUI): se leen de change_log
+		client.post("/instruments/", json=instrument)
+		new_student = client.post("/students/", json=student).json()
+		assert broadcaster.poll(db_session) == 2
+		event = await stream.__anext__()
+		entry_id = last_log_id(db_session)
+		assert event.startswith(f"id: {entry_id}\nevent: change\n") and f'"id": {new_student["id"]}' in event
+		await stream.aclose()
+		assert subscriber not in broadcaster._subscribers
+	asyncio.run(run())
+
+def test_poll_waits_for_recent_gap(db_session):
+	async def run():
+		broadcaster = ChangeBroadcaster(gap_timeout=30)
+		subscriber, _, _ = broadcaster.subscribe(db_session)
+		# Falta el id siguiente: puede ser una transacción aún sin confirmar
+		gap = last_log_id(db_session) + 1
+		add_entries(db_session, 1, start=gap + 1)
+		assert broadcaster.poll(db_session) == 0
+		# Pasado el tiempo de espera, el hueco es una transacción revertida
+		db_session.query(ChangeLogEntry).filter(ChangeLogEntry.id == gap + 1).update(
+			{"created_at": datetime.utcnow() - timedelta(seconds=60)})
+		db_session.commit()
+		assert broadcaster.poll(db_session) == 1
+		assert broadcaster.last_id == gap + 1
+		broadcaster.unsubscribe(subscriber)
+	asyncio.run(run())
+
+def test_stream_resets_unknown_last_event_id(db_session):
+	async def run():
+		broadcaster = ChangeBroadcaster()
+		subscriber, backlog, reset = broadcaster.subscribe(db_session, last_event_id="otro-3")
+		stream = event_stream(broadcaster, subscriber, backlog, reset, keepalive=5)
+		await stream.__anext__()
+		assert await stream.__anext__() == f"id: {broadcaster.last_id}\nevent: reset\ndata: {{}}\n\n"
+		await stream.aclose()
+	asyncio.run(run())
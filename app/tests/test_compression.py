@@ -0,0 +1,44 @@
+from compression import parse_accept_encoding, select_encoding
+
+'''Tests para el middleware de compresión de respuestas.'''
+
+
+def test_accept_encoding_negotiation():
+	assert parse_accept_encoding("gzip;q=0.5, br") == {"gzip": 0.5, "br": 1.0}
+	assert select_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+	assert select_encoding("gzip;q=0", ["gzip"]) is None
+	assert select_encoding("identity", ["gzip"]) is None
+
+def test_large_response_is_gzipped(client, db_session):
+	from models import Instrument
+	for i in range(100):
+		db_session.add(Instrument(name="instrument" + str(i), price=40))
+	db_session.commit()
+	res = client.get("/instruments/", headers={"Accept-Encoding": "gzip"})
+	assert res.status_code == 200
+	assert res.headers["content-encoding"] == "gzip"
+	assert "Accept-Encoding" in res.headers["vary"]
+	assert len(res.json()) == 100
+
+def test_small_response_not_compressed(client):
+	res = client.get("/test/", headers={"Accept-Encoding": "gzip"})
+	assert res.status_code == 200
+	assert "content-encoding" not in res.headers
+
+def test_streaming_response_compressed_incrementally():
+	from fastapi import FastAPI
+	from fastapi.responses import StreamingResponse
+	from fastapi.testclient import TestClient
+	from compression import CompressionMiddleware
+
+	app = FastAPI()
+	app.add_middleware(CompressionMiddleware, minimum_size=10)
+
+	@app.get("/stream")
+	def stream():
+		return StreamingResponse(iter([b"a" * 100, b"b" * 100]), media_type="text/plain")
+
+	res = TestClient(app).get("/stream", headers={"Accept-Encoding": "gzip"})
+	assert res.headers["content-encoding"] == "gzip"
+	assert "content-length" not in res.headers
+	assert res.text == "a" * 100 + "b" * 100
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from deadlines import DeadlineMiddleware, DeadlineExceeded, deadline_scope
+
+'''Tests para los plazos por petición y los timeouts de sentencias.'''
+
+
+def test_slow_request_returns_504():
+	app = FastAPI()
+	app.add_middleware(DeadlineMiddleware)
+
+	@app.get("/slow")
+	def slow():
+		time.sleep(0.3)
+		return {"ok": True}
+
+	client = TestClient(app)
+	res = client.get("/slow", headers={"X-Request-Timeout": "0.05"})
+	assert res.status_code == 504
+	res = client.get("/slow")
+	assert res.status_code == 200
+
+def test_sqlite_statement_interrupted_by_deadline():
+	engine = create_engine("sqlite://")
+	runaway = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c")
+	with engine.connect() as conn:
+		with deadline_scope(0.05), pytest.raises(OperationalError):
+			conn.execute(runaway)
+		# Fuera del plazo la conexión vuelve a funcionar con normalidad
+		assert conn.execute(text("SELECT 1")).scalar() == 1
+
+def test_expired_deadline_blocks_new_statements():
+	engine = create_engine("sqlite://")
+	with engine.connect() as conn:
+		with deadline_scope(-1), pytest.raises(DeadlineExceeded):
+			conn.execute(text("SELECT 1"))
+
+def test_interrupted_connection_runs_long_queries_afterwards():
+	# Tras una sentencia interrumpida no queda el progress handler en la conexión ni en el pool
+	engine = create_engine("sqlite://")
+	runaway = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c")
+	long_query = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 200000) SELECT count(*) FROM c")
+	with engine.connect() as conn:
+		with deadline_scope(0.05), pytest.raises(OperationalError):
+			conn.execute(runaway)
+		time.sleep(0.1)
+		assert conn.execute(long_query).scalar() == 200000
+		with deadline_scope(0.05), pytest.raises(OperationalError):
+			conn.execute(runaway)
+	time.sleep(0.1)
+	with engine.connect() as conn:
+		assert conn.execute(long_query).scalar() == 200000
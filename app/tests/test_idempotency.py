@@ -0,0 +1,83 @@
+import time
+from datetime import datetime, timedelta
+
+import routes
+from models import Student, IdempotencyKey
+from idempotency import _sha256
+from schemas import StudentCreate
+
+'''Tests para las claves de idempotencia de las rutas de creación.'''
+
+
+def test_retry_returns_stored_response(client, db_session, student):
+	headers = {"Idempotency-Key": "abc-123"}
+	first = client.post("/students/", json=student, headers=headers)
+	assert first.status_code == 200
+	retry = client.post("/students/", json=student, headers=headers)
+	assert retry.status_code == 200
+	assert retry.json() == first.json()
+	assert retry.headers["Idempotent-Replayed"] == "true"
+	assert db_session.query(Student).count() == 1
+
+def test_client_error_is_replayed(client, inscription):
+	# El estudiante no existe: el 404 se guarda y se devuelve igual en el reintento
+	inscription["student_id"] = 99
+	headers = {"Idempotency-Key": "insc-1"}
+	first = client.post("/inscriptions/", json=inscription, headers=headers)
+	assert first.status_code == 404
+	retry = client.post("/inscriptions/", json=inscription, headers=headers)
+	assert retry.status_code == 404
+	assert retry.headers["Idempotent-Replayed"] == "true"
+
+def test_key_reused_with_other_payload(client, student):
+	headers = {"Idempotency-Key": "abc-123"}
+	client.post("/students/", json=student, headers=headers)
+	student["age"] = 31
+	res = client.post("/students/", json=student, headers=headers)
+	assert res.status_code == 422
+
+def test_concurrent_request_in_progress(client, db_session, student):
+	# Simula otra petición con la misma clave y el mismo cuerpo que todavía no ha terminado
+	db_session.add(IdempotencyKey(key_hash=_sha256("POST /students/:abc-123"),
+								  request_hash=_sha256(StudentCreate(**student).model_dump_json()),
+								  expires_at=datetime.utcnow() + timedelta(hours=1)))
+	db_session.commit()
+	res = client.post("/students/", json=student, headers={"Idempotency-Key": "abc-123"})
+	assert res.status_code == 409
+	assert res.headers["Retry-After"] == "1"
+	assert db_session.query(Student).count() == 0
+
+def test_expired_key_runs_again(client, db_session, student):
+	db_session.add(IdempotencyKey(key_hash=_sha256("POST /students/:old"), request_hash="x" * 64, status_code=200,
+								  response_body="{}", expires_at=datetime.utcnow() - timedelta(seconds=1)))
+	db_session.commit()
+	res = client.post("/students/", json=student, headers={"Idempotency-Key": "old"})
+	assert res.status_code == 200
+	assert "Idempotent-Replayed" not in res.headers
+
+def test_retry_after_deadline_runs_again(client, db_session, student, monkeypatch):
+	# La primera petición vence su plazo dentro de la operación: la clave se libera y el reintento la ejecuta
+	create_student = routes.create_student
+	def slow_create(db, student):
+		time.sleep(0.2)
+		return create_student(db=db, student=student)
+	monkeypatch.setattr(routes, "create_student", slow_create)
+	res = client.post("/students/", json=student, headers={"Idempotency-Key": "slow-1", "X-Request-Timeout": "0.1"})
+	assert res.status_code == 504
+	time.sleep(0.4)  # el handler abandonado termina en segundo plano
+	monkeypatch.undo()
+
+	res = client.post("/students/", json=student, headers={"Idempotency-Key": "slow-1"})
+	assert res.status_code == 200
+	assert "Idempotent-Replayed" not in res.headers
+	assert db_session.query(Student).count() == 1
+
+def test_stale_reservation_is_taken_over(client, db_session, student):
+	# Reserva de una petición que no terminó (p. ej. el proceso se cayó) cuyo plazo de reserva ha pasado
+	db_session.add(IdempotencyKey(key_hash=_sha256("POST /students/:crashed"),
+								  request_hash=_sha256(StudentCreate(**student).model_dump_json()),
+								  expires_at=datetime.utcnow() - timedelta(seconds=1)))
+	db_session.commit()
+	res = client.post("/students/", json=student, headers={"Idempotency-Key": "crashed"})
+	assert res.status_code == 200
+	assert db_session.query(Student).count() == 1
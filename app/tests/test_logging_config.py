@@ -0,0 +1,60 @@
+import os
+import logging
+
+from logging_config import setup_logger, shutdown_logger, DroppingQueueHandler
+
+'''Tests para la configuración del logger con cola y rotación de archivos.'''
+
+
+def queue_handlers(logger):
+	return [h for h in logger.handlers if isinstance(h, DroppingQueueHandler)]
+
+def test_setup_logger_is_idempotent():
+	logger = setup_logger()
+	assert setup_logger() is logger
+	assert len(queue_handlers(logger)) == 1
+
+def test_logs_are_written_by_listener(tmp_path, monkeypatch):
+	shutdown_logger()
+	monkeypatch.setenv("LOG_FILE", str(tmp_path / "app.log"))
+	monkeypatch.setenv("LOG_MAX_BYTES", "200")
+	try:
+		logger = setup_logger()
+		for i in range(10):
+			logger.info("Mensaje de prueba %s", i)
+		# Por debajo del nivel configurado: no se formatea ni se encola
+		logger.debug("Mensaje oculto %s", object())
+		shutdown_logger()
+		files = sorted(p.name for p in tmp_path.iterdir())
+		assert len(files) > 1, "Error, log file not rotated by size"
+		content = "".join((tmp_path / name).read_text(encoding="utf-8") for name in files)
+		assert all(f"Mensaje de prueba {i}" in content for i in range(10))
+		assert "Mensaje oculto" not in content
+	finally:
+		shutdown_logger()
+		monkeypatch.undo()
+		setup_logger()
+
+def test_each_worker_writes_its_own_file(tmp_path, monkeypatch):
+	shutdown_logger()
+	monkeypatch.setenv("LOG_FILE", str(tmp_path / "app.log"))
+	monkeypatch.setenv("REQUEST_LOG_FILE", str(tmp_path / "requests.log"))
+	monkeypatch.setenv("WEB_CONCURRENCY", "4")
+	try:
+		setup_logger().info("Mensaje del worker")
+		shutdown_logger()
+		# Varios workers no rotan el mismo archivo: cada proceso tiene el suyo
+		assert sorted(p.name for p in tmp_path.iterdir()) == [f"app.{os.getpid()}.log", f"requests.{os.getpid()}.log"]
+		assert "Mensaje del worker" in (tmp_path / f"app.{os.getpid()}.log").read_text(encoding="utf-8")
+	finally:
+		shutdown_logger()
+		monkeypatch.undo()
+		setup_logger()
+
+def test_full_queue_drops_records():
+	import queue
+	handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+	record = logging.LogRecord("music_app", logging.INFO, __file__, 1, "mensaje", None, None)
+	handler.handle(record)
+	handler.handle(record)
+	assert handler.dropped == 1
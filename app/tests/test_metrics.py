@@ -0,0 +1,52 @@
+from sqlalchemy import create_engine
+
+import metrics
+from metrics import Counter, Histogram, Registry, HTTP_REQUESTS, CACHE_REQUESTS, record_cache
+
+'''Tests para las métricas en formato Prometheus.'''
+
+
+def test_histogram_exposition():
+	registry = Registry()
+	histogram = registry.register(Histogram("latencia_seconds", "Latencia", ("route",), buckets=(0.1, 1.0)))
+	counter = registry.register(Counter("peticiones_total", "Peticiones", ("route",)))
+	histogram.observe(0.05, ("/a",))
+	histogram.observe(0.5, ("/a",))
+	histogram.observe(5, ("/a",))
+	counter.inc(('/"b"',))
+	lines = registry.exposition().splitlines()
+	assert "# TYPE latencia_seconds histogram" in lines
+	# Los buckets son acumulados
+	assert 'latencia_seconds_bucket{route="/a",le="0.1"} 1' in lines
+	assert 'latencia_seconds_bucket{route="/a",le="1.0"} 2' in lines
+	assert 'latencia_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+	assert 'latencia_seconds_count{route="/a"} 3' in lines
+	assert 'peticiones_total{route="/\\"b\\""} 1' in lines
+
+def test_request_metrics_by_route_template(client, student):
+	client.post("/students/", json=student)
+	before = HTTP_REQUESTS.value(("GET", "/students/{student_id}", "200"))
+	client.get("/students/1")
+	assert HTTP_REQUESTS.value(("GET", "/students/{student_id}", "200")) == before + 1
+	res = client.get("/metrics")
+	assert res.status_code == 200 and res.headers["content-type"].startswith("text/plain")
+	body = res.text
+	assert 'http_request_duration_seconds_count{method="GET",route="/students/{student_id}"}' in body
+	assert 'db_statements_total{operation="SELECT"}' in body
+	assert "db_pool_checked_out" in body and 'admission_in_flight{route_class="cheap"}' in body
+
+def test_cache_hit_ratio(client):
+	hits, misses = CACHE_REQUESTS.value(("prueba", "hit")), CACHE_REQUESTS.value(("prueba", "miss"))
+	assert hits == misses == 0
+	record_cache("prueba", True)
+	record_cache("prueba", True)
+	record_cache("prueba", False)
+	assert 'cache_hit_ratio{cache="prueba"} 0.6666666666666666' in client.get("/metrics").text
+
+def test_pool_metrics_with_sqlite_memory_pool(monkeypatch):
+	# SingletonThreadPool tiene size como atributo: sus gauges se omiten en lugar de fallar
+	monkeypatch.setattr(metrics, "registry", Registry())
+	metrics.register_pool_metrics(create_engine("sqlite:///:memory:"))
+	lines = metrics.registry.exposition().splitlines()
+	assert "# TYPE db_pool_size gauge" in lines
+	assert not any(line.startswith("db_pool_size ") for line in lines)
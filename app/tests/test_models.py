@@ -297,4 +297,110 @@ def test_inscriptions_delete(client, inscription, student):
 	client.delete("/inscriptions/1")
 	assert res.status_code == 200, f"Error, expected:200, not:{res.status_code} {res.content}"
 	res = client.get("/inscriptions/1")
-	assert res.status_code == 404, "Error delete data"
\ No newline at end of file
+	assert res.status_code == 404, "Error delete data"
+'''Tests for batch retrieval'''
+def test_students_batch_get(client, db_session):
+	for i in range(3):
+		db_session.add(Student(first_name="student" + str(i), last_name="test", age=20, phone="555", mail="s@test.com"))
+	db_session.commit()
+	res = client.get("/students/?ids=3,99,1")
+	assert res.status_code == 200, f"Error, expected:200, not:{res.status_code}"
+	data = res.json()
+	assert [s["id"] for s in data["items"]] == [3, 1], "Error, input order not kept"
+	assert data["missing"] == [99]
+
+def test_batch_get_invalid_ids(client):
+	res = client.get("/instruments/?ids=1,abc")
+	assert res.status_code == 422
+
+def test_levels_and_packs_batch_get(client, level, pack):
+	client.post("/levels/", json=level)
+	client.post("/packs/", json=pack)
+	data = client.get("/levels/?ids=1,2").json()
+	assert [l["id"] for l in data["items"]] == [1] and data["missing"] == [2]
+	data = client.get("/packs/?ids=5,1").json()
+	assert [p["id"] for p in data["items"]] == [1] and data["missing"] == [5]
+
+'''Tests for the student dashboard'''
+def test_student_dashboard(client, db_session, student):
+	from models import PacksInstruments, Inscription
+	from datetime import date
+	piano = Instrument(name="Piano", price=40)
+	guitar = Instrument(name="Guitarra", price=30)
+	pack = Pack(pack="Pack 1", discount_1=50, discount_2=50)
+	db_session.add_all([piano, guitar, pack])
+	db_session.flush()
+	levels = [Level(instruments_id=piano.id, level="Básico"), Level(instruments_id=guitar.id, level="Básico")]
+	db_session.add_all(levels)
+	db_session.add_all([PacksInstruments(instrument_id=piano.id, packs_id=pack.id),
+						PacksInstruments(instrument_id=guitar.id, packs_id=pack.id)])
+	db_session.commit()
+	new_student = client.post("/students/", json=student).json()
+	for level in levels:
+		db_session.add(Inscription(student_id=new_student["id"], level_id=level.id, registration_date=date(2024, 3, 12)))
+	db_session.commit()
+
+	res = client.get(f"/students/{new_student['id']}/dashboard")
+	assert res.status_code == 200, f"Error, expected:200, not:{res.status_code}"
+	data = res.json()
+	assert data["student"]["id"] == new_student["id"]
+	assert len(data["inscriptions"]) == 2
+	assert [p["pack"] for p in data["packs"]] == ["Pack 1"]
+	# 40 + 30 con un 50% de descuento = 55, con descuento familiar del 10% = 49.5
+	assert data["fee"]["subtotal"] == 55.0
+	assert data["fee"]["total_fee"] == 49.5
+	assert data["fee"]["total_fee"] == client.get(f"/students/{new_student['id']}/fee").json()
+
+def test_student_fee_two_levels_same_instrument(client, db_session, student):
+	from models import Inscription
+	from datetime import date
+	piano = Instrument(name="Piano", price=40)
+	db_session.add(piano)
+	db_session.flush()
+	levels = [Level(instruments_id=piano.id, level="Básico"), Level(instruments_id=piano.id, level="Medio")]
+	db_session.add_all(levels)
+	db_session.commit()
+	new_student = client.post("/students/", json=dict(student, family_id=False)).json()
+	for level in levels:
+		db_session.add(Inscription(student_id=new_student["id"], level_id=level.id, registration_date=date(2024, 3, 12)))
+	db_session.commit()
+
+	# Cada nivel se cobra: 40 + 40
+	fee = client.get(f"/students/{new_student['id']}/fee").json()
+	dashboard = client.get(f"/students/{new_student['id']}/dashboard").json()
+	page = client.get("/fee_report/page").json()
+	report = client.get("/fee_report/").json()
+	assert fee == 80.0
+	assert dashboard["fee"]["total_fee"] == fee
+	assert [i["total_fee"] for i in page["items"] if i["student_id"] == new_student["id"]] == [fee]
+	assert [r["total_fee"] for r in report if r["student_id"] == new_student["id"]] == [fee]
+
+def test_student_dashboard_fail(client):
+	res = client.get("/students/1/dashboard")
+	assert res.status_code == 404
+
+'''Tests for database-level cascades'''
+def test_student_delete_cascades_inscriptions(client, db_session, inscription, student):
+	from models import Inscription
+	new_student = client.post("/students/", json=student).json()
+	inscription["student_id"] = new_student["id"]
+	client.post("/inscriptions/", json=inscription)
+	res = client.delete(f"/students/{new_student['id']}")
+	assert res.status_code == 200, f"Error, expected:200, not:{res.status_code} {res.content}"
+	assert db_session.query(Inscription).count() == 0, "Error, inscriptions not deleted"
+
+def test_instrument_delete_with_levels_fail(client, level):
+	client.post("/levels/", json=level)
+	res = client.delete(f"/instruments/{level['instruments_id']}")
+	assert res.status_code == 400, f"Error, expected:400, not:{res.status_code}"
+
+def test_students_bulk_delete(client, db_session):
+	from crud.students_crud import delete_students_bulk
+	for i in range(5):
+		db_session.add(Student(first_name="student" + str(i), last_name="test", age=20, phone="555", mail="s@test.com"))
+	db_session.commit()
+	res = client.post("/students/bulk-delete", json={"ids": [1, 2, 99]})
+	assert res.status_code == 200, f"Error, expected:200, not:{res.status_code}"
+	assert res.json() == {"deleted": 2}
+	assert delete_students_bulk(db_session, [3, 4, 5], chunk_size=2) == 3
+	assert db_session.query(Student).count() == 0
@@ -0,0 +1,84 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import OutboxEvent, OutboxCursor
+from outbox import relay_batch, SQLiteSink, FileSink
+from crud.students_crud import delete_students_bulk
+
+'''Tests para el outbox transaccional y su relay.'''
+
+
+def add_event(db_session, event_id, age_seconds=0):
+	db_session.add(OutboxEvent(id=event_id, event_type="student.created", aggregate="student", aggregate_id=event_id,
+							   payload="{}", created_at=datetime.utcnow() - timedelta(seconds=age_seconds)))
+	db_session.commit()
+
+def test_crud_writes_outbox_events(client, db_session, inscription, student):
+	# Los fixtures ya han creado packs e instrumentos
+	start = db_session.query(OutboxEvent).count()
+	new_student = client.post("/students/", json=student).json()
+	inscription["student_id"] = new_student["id"]
+	new_inscription = client.post("/inscriptions/", json=inscription).json()
+	# Una inscripción de un estudiante inexistente no deja ningún evento
+	client.post("/inscriptions/", json=dict(inscription, student_id=99))
+	client.put("/instruments/1", json={"price": 99})
+	events = db_session.query(OutboxEvent).order_by(OutboxEvent.id).all()[start:]
+	assert [e.event_type for e in events] == ["student.created", "inscription.created", "instrument.price_changed"]
+	payload = json.loads(events[1].payload)
+	assert payload == {"id": new_inscription["id"], "student_id": new_student["id"],
+					   "level_id": inscription["level_id"], "registration_date": "2024-03-12"}
+
+def test_relay_delivers_and_advances_cursor(db_session, tmp_path):
+	sink = SQLiteSink(str(tmp_path / "events.db"))
+	for event_id in (1, 2, 3):
+		add_event(db_session, event_id)
+	assert relay_batch(db_session, sink, batch_size=2) == 2
+	assert relay_batch(db_session, sink, batch_size=2) == 1
+	assert relay_batch(db_session, sink, batch_size=2) == 0
+	assert db_session.get(OutboxCursor, "default").last_event_id == 3
+	# Una entrega repetida (al menos una vez) no duplica eventos en el destino
+	sink.send([{"id": 1, "type": "student.created", "aggregate": "student", "aggregate_id": 1,
+				"created_at": "", "payload": {}}])
+	with sqlite3.connect(tmp_path / "events.db") as conn:
+		assert conn.execute("SELECT id FROM events ORDER BY id").fetchall() == [(1,), (2,), (3,)]
+
+def test_relay_failure_keeps_cursor(db_session, tmp_path):
+	class BrokenSink:
+		def send(self, messages):
+			raise ConnectionError("destino no disponible")
+	add_event(db_session, 1)
+	with pytest.raises(ConnectionError):
+		relay_batch(db_session, BrokenSink(), name="broken")
+	assert db_session.get(OutboxCursor, "broken") is None
+	assert relay_batch(db_session, FileSink(str(tmp_path / "events.jsonl")), name="broken") == 1
+
+def test_relay_waits_on_recent_gap(db_session, tmp_path):
+	sink = FileSink(str(tmp_path / "events.jsonl"))
+	add_event(db_session, 1)
+	# El evento 2 puede pertenecer a una transacción todavía sin confirmar
+	add_event(db_session, 3)
+	assert relay_batch(db_session, sink, gap_timeout=30) == 1
+	assert relay_batch(db_session, sink, gap_timeout=30) == 0
+	db_session.get(OutboxEvent, 3).created_at = datetime.utcnow() - timedelta(seconds=60)
+	db_session.commit()
+	assert relay_batch(db_session, sink, gap_timeout=30) == 1
+	lines = (tmp_path / "events.jsonl").read_text().splitlines()
+	assert [json.loads(line)["id"] for line in lines] == [1, 3]
+
+def test_student_delete_records_cascaded_inscriptions(client, db_session, inscription, student):
+	student_ids = [client.post("/students/", json=student).json()["id"] for _ in range(2)]
+	inscription_ids = [client.post("/inscriptions/", json=dict(inscription, student_id=student_id)).json()["id"]
+					   for student_id in student_ids]
+	start = db_session.query(OutboxEvent).count()
+	assert client.delete(f"/students/{student_ids[0]}").status_code == 200
+	events = db_session.query(OutboxEvent).order_by(OutboxEvent.id).all()[start:]
+	assert [(e.event_type, e.aggregate_id) for e in events] == [("inscription.deleted", inscription_ids[0]),
+																  ("student.deleted", student_ids[0])]
+	assert json.loads(events[0].payload)["student_id"] == student_ids[0]
+	delete_students_bulk(db_session, [student_ids[1]])
+	events = db_session.query(OutboxEvent).order_by(OutboxEvent.id).all()[start + 2:]
+	assert [(e.event_type, e.aggregate_id) for e in events] == [("inscription.deleted", inscription_ids[1]),
+																  ("student.deleted", student_ids[1])]
@@ -0,0 +1,100 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from models import Student, Instrument, Level, Pack, PacksInstruments, Inscription
+from crud.inscriptions_crud import get_inscriptions_page, get_fee_report_page, calculate_student_fees
+
+'''Tests para las páginas por keyset de inscripciones e informe de tarifas.'''
+
+
+def make_school(db_session):
+	# Dos instrumentos en el mismo pack y 7 alumnos con 1 o 2 inscripciones
+	piano = Instrument(name="Piano", price=35)
+	guitar = Instrument(name="Guitarra", price=30)
+	pack = Pack(pack="Pack 1", discount_1=25, discount_2=35)
+	db_session.add_all([piano, guitar, pack])
+	db_session.flush()
+	db_session.add_all([PacksInstruments(instrument_id=piano.id, packs_id=pack.id),
+						PacksInstruments(instrument_id=guitar.id, packs_id=pack.id)])
+	piano_level = Level(instruments_id=piano.id, level="Básico")
+	guitar_level = Level(instruments_id=guitar.id, level="Medio")
+	db_session.add_all([piano_level, guitar_level])
+	db_session.flush()
+	students = []
+	for i in range(7):
+		student = Student(first_name=f"Alumno{i}", last_name=f"Paginado{i % 3}", age=20, phone="600", mail="a@b.c",
+						  family_id=i % 2 == 0)
+		db_session.add(student)
+		db_session.flush()
+		db_session.add(Inscription(student_id=student.id, level_id=piano_level.id, registration_date=date(2024, 1, 1 + i % 2)))
+		if i % 3 == 0:
+			db_session.add(Inscription(student_id=student.id, level_id=guitar_level.id, registration_date=date(2024, 2, 1)))
+		students.append(student)
+	db_session.flush()
+	return students
+
+def all_pages(fetch, db_session, limit, **params):
+	rows, cursor, pages = [], None, 0
+	while True:
+		page = fetch(db_session, after=cursor, limit=limit, **params)
+		rows += page["items"]
+		pages += 1
+		cursor = page["next_cursor"]
+		if cursor is None:
+			return rows, pages
+
+def test_inscription_pages_cover_all_rows_in_order(db_session):
+	make_school(db_session)
+	rows, pages = all_pages(get_inscriptions_page, db_session, 3)
+	assert pages == 4
+	ids = [row["inscription_id"] for row in rows]
+	assert len(ids) == 10 and len(set(ids)) == 10
+	keys = [(row["registration_date"], row["inscription_id"]) for row in rows]
+	assert keys == sorted(keys, reverse=True)
+
+	rows, _ = all_pages(get_inscriptions_page, db_session, 2, sort="student", descending=False)
+	assert [row["student_name"][-1] for row in rows] == sorted(row["student_name"][-1] for row in rows)
+
+def test_inscription_filters(db_session):
+	make_school(db_session)
+	rows, _ = all_pages(get_inscriptions_page, db_session, 2, instrument="guit")
+	assert len(rows) == 3 and {row["instrument_name"] for row in rows} == {"Guitarra"}
+	rows, _ = all_pages(get_inscriptions_page, db_session, 2, student="paginado1", date_from=date(2024, 1, 2))
+	assert {row["student_name"] for row in rows} == {"Alumno1 Paginado1"}
+
+def test_fee_report_page_matches_student_fees(db_session):
+	students = make_school(db_session)
+	rows, pages = all_pages(get_fee_report_page, db_session, 2, sort="inscription_count", descending=True)
+	assert pages == 4 and len(rows) == 7
+	assert [row["inscription_count"] for row in rows] == [2, 2, 2, 1, 1, 1, 1]
+	for row in rows:
+		assert row["total_fee"] == float(calculate_student_fees(db_session, row["student_id"]))
+
+	family, _ = all_pages(get_fee_report_page, db_session, 10, family=True, min_inscriptions=2)
+	assert [row["student_id"] for row in family] == [students[0].id, students[6].id]
+
+def query_plans(db_session, operation):
+	# Plan (EXPLAIN QUERY PLAN) de cada SELECT que ejecuta la operación
+	connection = db_session.connection()
+	statements = []
+	def capture(conn, cursor, statement, parameters, context, executemany):
+		if statement.lstrip().upper().startswith("SELECT"):
+			statements.append((statement, parameters))
+	event.listen(connection, "before_cursor_execute", capture)
+	try:
+		operation()
+	finally:
+		event.remove(connection, "before_cursor_execute", capture)
+	return [[row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+			for statement, parameters in statements]
+
+def test_indexed_sorts_do_not_sort_every_row(db_session):
+	make_school(db_session)
+	# La página por fecha recorre el índice (registration_date, id) y la del informe el de (last_name, id)
+	for operation in (lambda: get_inscriptions_page(db_session, limit=2),
+					  lambda: get_fee_report_page(db_session, limit=2)):
+		page_plan = query_plans(db_session, operation)[0]
+		assert not any("TEMP B-TREE" in step for step in page_plan), page_plan
+		assert any("ix_inscriptions_registration_date_id" in step or "ix_students_last_name_id" in step
+				   for step in page_plan), page_plan
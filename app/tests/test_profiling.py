@@ -0,0 +1,53 @@
+import os
+import uuid
+
+import pytest
+
+from profiling import ProfileStore, profile_store
+
+'''Tests para el perfilado bajo demanda de peticiones.'''
+
+TOKEN = "secreto"
+
+
+@pytest.fixture
+def profiling_enabled(monkeypatch):
+	monkeypatch.setenv("PROFILE_TOKEN", TOKEN)
+
+def test_profile_request(client, student, profiling_enabled):
+	client.post("/students/", json=student)
+	res = client.get("/students/1", headers={"X-Profile": "1", "X-Admin-Token": TOKEN})
+	assert res.status_code == 200 and res.json()["first_name"] == student["first_name"]
+	profile_id = res.headers["X-Profile-ID"]
+
+	profile = client.get(f"/admin/profiles/{profile_id}", headers={"X-Admin-Token": TOKEN}).json()
+	assert profile["route"] == "/students/{student_id}" and profile["status"] == 200
+	assert profile["components_ms"]["sqlalchemy"] > 0
+	assert any("get_student" in f["function"] for f in profile["top_functions"])
+	assert profile["call_tree"]
+	listed = client.get("/admin/profiles", headers={"X-Admin-Token": TOKEN}).json()
+	assert listed[0]["id"] == profile_id
+	# Otro worker lee el mismo directorio
+	assert ProfileStore(profile_store.directory).get(profile_id)["route"] == "/students/{student_id}"
+
+def test_profile_store_keeps_latest(tmp_path):
+	store = ProfileStore(str(tmp_path), retained=2)
+	ids = [uuid.uuid4().hex for _ in range(3)]
+	for i, profile_id in enumerate(ids):
+		store.add({"id": profile_id, "request_id": None, "method": "GET", "path": "/", "route": "/",
+				   "status": 200, "wall_ms": 1.0, "created_at": i})
+		os.utime(tmp_path / f"{profile_id}.json", (i, i))
+	assert [p["id"] for p in store.list()] == ids[:0:-1]
+	assert store.get(ids[0]) is None and store.get("../otro") is None
+
+def test_profile_requires_token(client, profiling_enabled):
+	count = len(profile_store.list())
+	res = client.get("/students/?profile=1", headers={"X-Admin-Token": "otro"})
+	assert res.status_code == 200 and "X-Profile-ID" not in res.headers
+	assert len(profile_store.list()) == count
+	assert client.get("/admin/profiles", headers={"X-Admin-Token": "otro"}).status_code == 403
+
+def test_profiling_disabled_without_token(client, monkeypatch):
+	monkeypatch.delenv("PROFILE_TOKEN", raising=False)
+	assert client.get("/admin/profiles").status_code == 404
+	assert "X-Profile-ID" not in client.get("/students/", headers={"X-Profile": "1"}).headers
@@ -0,0 +1,58 @@
+import importlib.util
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from query_governor import create_console_engine, estimate_query, streaming_url
+
+'''Tests para la estimación de coste y el pool de solo lectura de la consola SQL.'''
+
+
+@pytest.fixture
+def console_url(tmp_path):
+	url = f"sqlite:///{tmp_path / 'console.db'}"
+	with create_engine(url).begin() as connection:
+		connection.execute(text("CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT)"))
+		connection.execute(text("CREATE TABLE inscriptions (id INTEGER PRIMARY KEY, student_id INTEGER)"))
+		connection.execute(text("INSERT INTO students (name) VALUES " + ",".join(["('a')"] * 200)))
+		connection.execute(text("INSERT INTO inscriptions (student_id) VALUES " + ",".join(["(1)"] * 300)))
+	return url
+
+def test_estimate_rejects_or_asks_confirmation_for_large_scans(console_url):
+	engine = create_console_engine(console_url)
+	lookup = estimate_query(engine, "SELECT * FROM students WHERE id = 3", confirm_rows=1000, max_rows=50000)
+	assert lookup.verdict == "run" and lookup.rows == 1
+	scan = estimate_query(engine, "SELECT * FROM inscriptions", confirm_rows=100, max_rows=50000)
+	assert scan.verdict == "confirm" and scan.rows == 300
+	cross = estimate_query(engine, "SELECT * FROM inscriptions i, students s;", confirm_rows=1000, max_rows=50000)
+	assert cross.verdict == "reject" and cross.rows == 60000
+	assert estimate_query(engine, "SELECT * FROM no_existe").verdict == "confirm"
+
+def test_estimate_reuses_table_sizes(console_url):
+	engine = create_console_engine(console_url)
+	assert estimate_query(engine, "SELECT * FROM inscriptions").rows == 300
+	with create_engine(console_url).begin() as connection:
+		connection.execute(text("INSERT INTO inscriptions (student_id) VALUES " + ",".join(["(1)"] * 100)))
+	# El tamaño contado se guarda y no se vuelve a contar en cada EXPLAIN
+	assert estimate_query(engine, "SELECT * FROM inscriptions").rows == 300
+	# Con estadísticas de ANALYZE se usan las de sqlite_stat1
+	with create_engine(console_url).begin() as connection:
+		connection.execute(text("ANALYZE"))
+	assert estimate_query(engine, "SELECT * FROM inscriptions").rows == 400
+
+def test_console_engine_is_read_only_unless_requested(console_url):
+	with pytest.raises(OperationalError):
+		with create_console_engine(console_url).begin() as connection:
+			connection.execute(text("DELETE FROM students"))
+	with create_console_engine(console_url, read_only=False).begin() as connection:
+		assert connection.execute(text("DELETE FROM students WHERE id = 1")).rowcount == 1
+
+def test_console_uses_streaming_mysql_driver(monkeypatch):
+	url = "mysql+mysqlconnector://root:clave@db:3306/music_school"
+	# mysql-connector lee el resultado entero: la consola se conecta con pymysql si está instalado
+	monkeypatch.setattr(importlib.util, "find_spec", lambda name: object())
+	assert streaming_url(url) == "mysql+pymysql://root:clave@db:3306/music_school"
+	monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+	assert streaming_url(url) == url
+	assert streaming_url("sqlite:///consola.db") == "sqlite:///consola.db"
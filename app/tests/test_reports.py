@@ -0,0 +1,68 @@
+import pytest
+
+import routes
+from db import get_session_factory
+from main import app
+from jobs import JobQueue
+from models import Student
+
+'''Tests para los informes en segundo plano con caché.'''
+
+
+@pytest.fixture
+def report_client(client, db_session, monkeypatch):
+	# Cola nueva en cada test para no reutilizar informes de otros tests; los trabajos usan la sesión del test
+	queue = JobQueue(max_workers=1)
+	monkeypatch.setattr(routes, "report_queue", queue)
+	app.dependency_overrides[get_session_factory] = lambda: lambda: db_session
+	yield client, queue
+	del app.dependency_overrides[get_session_factory]
+
+def wait_report(client, queue, job_id):
+	assert queue.wait(job_id, 5)
+	return client.get(f"/reports/{job_id}").json()
+
+def test_fee_report_job(report_client, student):
+	client, queue = report_client
+	client.post("/students/", json=student)
+	res = client.post("/reports/fees")
+	assert res.status_code == 202, f"Error, expected:202, not:{res.status_code}"
+	job_id = res.json()["id"]
+	assert res.headers["Location"] == f"/reports/{job_id}"
+	data = wait_report(client, queue, job_id)
+	assert data["status"] == "done"
+	assert data["result"] == client.get("/fee_report/").json()
+
+def test_fee_report_cached_until_data_changes(report_client, student):
+	client, queue = report_client
+	first = client.post("/reports/fees").json()["id"]
+	assert wait_report(client, queue, first)["result"] == []
+	assert client.post("/reports/fees").json()["id"] == first, "Error, report not reused"
+	client.post("/students/", json=student)
+	second = client.post("/reports/fees").json()["id"]
+	assert second != first, "Error, cached report not invalidated"
+	assert len(wait_report(client, queue, second)["result"]) == 1
+
+def test_report_not_found(client):
+	assert client.get("/reports/unknown").status_code == 404
+
+def test_report_shared_across_queues(report_client, db_session, student):
+	# Otro worker (otra cola, mismo almacenamiento) ve el trabajo y reutiliza su resultado
+	client, queue = report_client
+	first = client.post("/reports/fees").json()["id"]
+	wait_report(client, queue, first)
+	other = JobQueue(max_workers=1)
+	assert other.get(db_session, first).status == "done"
+	assert other.submit(db_session, "fees", None, None, routes.FEE_REPORT_TABLES).id == first
+
+def test_write_from_another_process_invalidates_report(report_client, db_session):
+	# Un cambio confirmado sin pasar por la API (p. ej. desde la GUI) también invalida el informe: la versión
+	# de las tablas se guarda en la base de datos
+	client, queue = report_client
+	first = client.post("/reports/fees").json()["id"]
+	wait_report(client, queue, first)
+	db_session.add(Student(first_name="Otro", last_name="Proceso", age=20, phone="6", mail="a@b.c"))
+	db_session.commit()
+	second = client.post("/reports/fees").json()["id"]
+	assert second != first
+	assert len(wait_report(client, queue, second)["result"]) == 1
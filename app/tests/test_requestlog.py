@@ -0,0 +1,44 @@
+import json
+import logging
+
+from logging_config import SamplingFilter, REQUEST_LOGGER_NAME
+
+'''Tests para el log estructurado de peticiones y el muestreo de mensajes.'''
+
+
+def request_records(caplog):
+	return [json.loads(r.getMessage()) for r in caplog.records if r.name == REQUEST_LOGGER_NAME]
+
+def test_request_log_record(client, caplog, student):
+	client.post("/students/", json=student)
+	caplog.clear()
+	with caplog.at_level(logging.INFO, logger=REQUEST_LOGGER_NAME):
+		res = client.get("/students/1", headers={"X-Request-ID": "abc-123"})
+	assert res.headers["X-Request-ID"] == "abc-123"
+	[record] = request_records(caplog)
+	assert record["request_id"] == "abc-123"
+	assert record["route"] == "/students/{student_id}" and record["path"] == "/students/1"
+	assert record["status"] == 200
+	assert record["db_statements"] >= 1
+	assert record["latency_ms"] > 0
+
+def test_request_id_generated_and_unmatched_route(client, caplog):
+	with caplog.at_level(logging.INFO, logger=REQUEST_LOGGER_NAME):
+		res = client.get("/no-existe", headers={"X-Request-ID": "no valido"})
+	[record] = request_records(caplog)
+	assert res.headers["X-Request-ID"] == record["request_id"] != "no valido"
+	assert record["status"] == 404 and record["route"] is None
+
+def test_sampling_keeps_errors():
+	sampler = SamplingFilter(0)
+	def record(level, request_id):
+		r = logging.LogRecord("music_app", level, __file__, 1, "mensaje", None, None)
+		r.request_id = request_id
+		return r
+	assert not sampler.filter(record(logging.INFO, "abc"))
+	assert sampler.filter(record(logging.ERROR, "abc"))
+	# Con una tasa intermedia, todos los mensajes de una petición corren la misma suerte
+	sampler = SamplingFilter(0.5)
+	decisions = {rid: sampler.filter(record(logging.INFO, rid)) for rid in map(str, range(200))}
+	assert all(sampler.filter(record(logging.INFO, rid)) == kept for rid, kept in decisions.items())
+	assert 0 < sum(decisions.values()) < 200
@@ -0,0 +1,69 @@
+from models import RollupInscription, RollupInstrument, RollupLevel, RollupMonth, RollupTeacher
+from rollups import rebuild_and_reset_cursor, apply_pending, read_dashboard
+
+'''Tests para las tablas de resumen del panel de análisis.'''
+
+
+def make_school(client):
+	piano = client.post("/instruments/", json={"name": "Piano", "price": 40}).json()["id"]
+	guitar = client.post("/instruments/", json={"name": "Guitarra", "price": 30}).json()["id"]
+	pack = client.post("/packs/", json={"pack": "Pack 1", "discount_1": 50, "discount_2": 50}).json()["id"]
+	for instrument_id in (piano, guitar):
+		client.post("/packs_instruments/", json={"instrument_id": instrument_id, "packs_id": pack})
+	levels = [client.post("/levels/", json={"instruments_id": i, "level": "Básico"}).json()["id"] for i in (piano, guitar)]
+	teacher = client.post("/teachers/", json={"first_name": "Ana", "last_name": "Sol", "phone": "6", "mail": "a@b.c"}).json()["id"]
+	client.post("/teachers_instruments/", json={"teacher_id": teacher, "instrument_id": guitar})
+	return piano, guitar, levels
+
+def add_student(client, name, family, level_ids, registration_date="2024-03-12"):
+	student_id = client.post("/students/", json={"first_name": name, "last_name": "Rollup", "age": 20, "phone": "6",
+												 "mail": "a@b.c", "family_id": family}).json()["id"]
+	for level_id in level_ids:
+		client.post("/inscriptions/", json={"student_id": student_id, "level_id": level_id,
+											"registration_date": registration_date})
+	return student_id
+
+def revenue(db_session):
+	return {r.name: float(r.revenue) for r in db_session.query(RollupInstrument)}
+
+def test_rebuild_matches_fees(client, db_session):
+	piano, guitar, levels = make_school(client)
+	add_student(client, "Uno", False, levels)
+	add_student(client, "Dos", True, levels[:1], "2024-04-01")
+	rebuild_and_reset_cursor(db_session)
+
+	# Uno: piano 40 + guitarra 30 con un 50 % (pack); Dos: piano 40 con un 10 % (familia)
+	assert revenue(db_session) == {"Piano": 76.0, "Guitarra": 15.0}
+	total = sum(fee["total_fee"] for fee in client.get("/fee_report/").json())
+	assert sum(revenue(db_session).values()) == total
+	assert {r.level_id: r.inscriptions for r in db_session.query(RollupLevel)} == {levels[0]: 2, levels[1]: 1}
+	assert {r.month: r.registrations for r in db_session.query(RollupMonth)} == {"2024-03": 2, "2024-04": 1}
+	assert [(r.teacher_name, r.students) for r in db_session.query(RollupTeacher)] == [("Ana Sol", 1)]
+	dashboard = read_dashboard(db_session)
+	assert dashboard["updated_at"] is not None
+	assert dashboard["revenue_by_instrument"][0]["instrument"] == "Piano"
+
+def test_incremental_refresh_from_outbox(client, db_session):
+	piano, guitar, levels = make_school(client)
+	student = add_student(client, "Uno", False, levels[:1])
+	rebuild_and_reset_cursor(db_session)
+	assert revenue(db_session) == {"Piano": 40.0, "Guitarra": 0.0}
+
+	# Nueva inscripción: la guitarra pasa a ser la segunda clase del pack
+	client.post("/inscriptions/", json={"student_id": student, "level_id": levels[1], "registration_date": "2024-05-02"})
+	assert apply_pending(db_session, gap_timeout=0) > 0
+	assert revenue(db_session) == {"Piano": 40.0, "Guitarra": 15.0}
+	assert {r.month: r.registrations for r in db_session.query(RollupMonth)} == {"2024-03": 1, "2024-05": 1}
+	assert [r.students for r in db_session.query(RollupTeacher)] == [1]
+
+	# Cambio de precio: la guitarra es ahora la más cara y el descuento pasa al piano
+	client.put(f"/instruments/{guitar}", json={"price": 50})
+	apply_pending(db_session, gap_timeout=0)
+	assert revenue(db_session) == {"Piano": 20.0, "Guitarra": 50.0}
+
+	# Al borrar el estudiante desaparecen sus inscripciones (ON DELETE CASCADE) y sus importes
+	client.delete(f"/students/{student}")
+	apply_pending(db_session, gap_timeout=0)
+	assert db_session.query(RollupInscription).count() == 0
+	assert revenue(db_session) == {"Piano": 0.0, "Guitarra": 0.0}
+	assert db_session.query(RollupMonth).count() == 0
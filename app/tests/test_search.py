@@ -0,0 +1,79 @@
+from sqlalchemy import select
+
+from models import Student, StudentSearchToken, name_search_filter
+from search import search_tokens
+from crud.students_crud import backfill_search_tokens
+
+'''Tests para la búsqueda de estudiantes por nombre.'''
+
+
+def make_student(client, student, first_name, last_name):
+	res = client.post("/students/", json=dict(student, first_name=first_name, last_name=last_name))
+	assert res.status_code == 200
+	return res.json()["id"]
+
+def test_normalization():
+	assert search_tokens("José María Pérez-Núñez") == ["jose", "maria", "perez", "nunez"]
+	assert search_tokens("  MARÍA  pe%_ ") == ["maria", "pe"]
+
+def test_search_prefix_accents_and_case(client, student):
+	jose = make_student(client, student, "José María", "Pérez")
+	make_student(client, student, "Marta", "López")
+	ids = lambda q: [s["id"] for s in client.get("/students/search", params={"q": q}).json()["items"]]
+	assert ids("jose") == [jose]
+	assert ids("MAR PER") == [jose]
+	assert ids("pérez josé") == [jose]
+	# Solo se busca por el comienzo de cada palabra
+	assert ids("erez") == []
+	assert len(ids("mar")) == 2
+
+def test_search_tokens_updated(client, student):
+	student_id = make_student(client, student, "Ana", "Ruiz")
+	client.put(f"/students/{student_id}", json=dict(student, first_name="Inés", last_name="Ruiz"))
+	res = client.get("/students/search", params={"q": "ines"}).json()
+	assert [s["id"] for s in res["items"]] == [student_id]
+	assert client.get("/students/search", params={"q": "ana"}).json()["items"] == []
+
+def test_search_pagination(client, student):
+	for i in range(5):
+		make_student(client, student, f"Alumno{i}", "Paginado")
+	first = client.get("/students/search", params={"q": "paginado", "limit": 3}).json()
+	second = client.get("/students/search", params={"q": "paginado", "skip": 3, "limit": 3}).json()
+	assert len(first["items"]) == 3 and first["has_more"]
+	assert len(second["items"]) == 2 and not second["has_more"]
+	assert client.get("/students/search", params={"limit": 500}).status_code == 422
+
+def test_search_uses_token_index(db_session):
+	# Cada término es un rango del índice de palabras, no un recorrido de la tabla
+	stmt = select(Student).where(*name_search_filter("mar pe"))
+	compiled = stmt.compile(db_session.get_bind())
+	params = tuple(compiled.construct_params()[name] for name in compiled.positiontup)
+	plan = [row[3] for row in db_session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+	token_steps = [step for step in plan if "student_search_tokens" in step]
+	assert len(token_steps) == 2
+	assert all(step.startswith("SEARCH") and "(token>? AND token<?)" in step for step in token_steps), plan
+
+def test_backfill_search_tokens(client, db_session, student):
+	student_id = make_student(client, student, "Lucía", "Gómez")
+	db_session.execute(StudentSearchToken.__table__.delete())
+	assert backfill_search_tokens(db_session, batch_size=1) == 1
+	assert [s["id"] for s in client.get("/students/search", params={"q": "luc gom"}).json()["items"]] == [student_id]
+
+def test_backfill_skips_batch_indexed_by_another_process(client, db_session, student, monkeypatch):
+	import crud.students_crud as students_crud
+	ids = [make_student(client, student, f"Alumno{i}", "Concurrente") for i in range(2)]
+	db_session.execute(StudentSearchToken.__table__.delete())
+	db_session.commit()
+	real_index = students_crud.index_student_name
+	def index_with_other_process(connection, student_id, first_name, last_name):
+		real_index(connection, student_id, first_name, last_name)
+		if student_id == ids[0]:
+			# Otro worker inserta a la vez las mismas palabras
+			connection.execute(StudentSearchToken.__table__.insert().values(token="alumno0", student_id=student_id))
+	monkeypatch.setattr(students_crud, "index_student_name", index_with_other_process)
+	# El lote en conflicto se deja al otro proceso y se siguen indexando los demás
+	assert backfill_search_tokens(db_session, batch_size=1) == 1
+	search = lambda: [s["id"] for s in client.get("/students/search", params={"q": "concurrente"}).json()["items"]]
+	assert search() == [ids[1]]
+	monkeypatch.undo()
+	assert backfill_search_tokens(db_session) == 1 and search() == ids
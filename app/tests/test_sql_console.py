@@ -0,0 +1,61 @@
+import csv
+import time
+import contextlib
+
+from sqlalchemy import create_engine
+
+import sql_console
+from sql_console import QueryRegistry
+
+'''Tests para las consultas en segundo plano de la consola SQL de la GUI.'''
+
+NUMBERS = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 1200) SELECT x, x * 2 AS doble FROM n"
+MANY = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 50000000) SELECT x FROM n"
+ENDLESS = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+
+
+def make_engine(tmp_path):
+	return create_engine(f"sqlite:///{tmp_path / 'console.db'}")
+
+def test_streams_pages_and_exports_full_result(tmp_path):
+	job = QueryRegistry().submit(make_engine(tmp_path), NUMBERS, export_format="csv", page_size=100, max_rows=500)
+	assert job.wait(10)
+	assert job.status == "done"
+	assert job.columns == ["x", "doble"]
+	assert job.row_count == 1200 and len(job.rows) == 500 and job.truncated
+	assert job.page(1, 100)[0] == (101, 202)
+
+	with open(job.export_path, newline="") as export:
+		rows = list(csv.reader(export))
+	assert rows[0] == ["x", "doble"] and len(rows) == 1201
+	assert rows[-1] == ["1200", "2400"]
+
+def test_cancel_stops_statement_on_server(tmp_path):
+	registry = QueryRegistry()
+	job = registry.submit(make_engine(tmp_path), ENDLESS)
+	time.sleep(0.3)
+	assert job.status == "running"
+	job.cancel()
+	assert job.wait(5)
+	assert job.status == "cancelled"
+	assert registry.get(job.id) is job
+
+def test_timeout_stops_write_statement_on_server(tmp_path, monkeypatch):
+	# Servidor que no limita la sentencia (en MySQL, max_execution_time no se aplica a las que no son SELECT):
+	# la detiene el vigilante de la consulta
+	monkeypatch.setattr(sql_console, "deadline_scope", lambda seconds: contextlib.nullcontext())
+	job = QueryRegistry().submit(make_engine(tmp_path), f"CREATE TABLE total AS {ENDLESS}", timeout=0.3)
+	assert job.wait(5)
+	assert job.status == "failed"
+	assert job.error == "La consulta excedió el tiempo límite de ejecución."
+
+def test_rows_appear_while_statement_runs(tmp_path):
+	job = QueryRegistry().submit(make_engine(tmp_path), MANY, page_size=100, max_rows=10 ** 9)
+	assert job.streaming
+	deadline = time.monotonic() + 5
+	while job.row_count == 0 and time.monotonic() < deadline:
+		time.sleep(0.01)
+	# Las primeras páginas ya se ven mientras el servidor sigue produciendo filas
+	assert job.row_count > 0 and job.status == "running"
+	job.cancel()
+	assert job.wait(5)
@@ -0,0 +1,68 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from tracing import TracingMiddleware, parse_traceparent, otlp_request
+
+'''Tests para las trazas de peticiones.'''
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class MemoryExporter:
+	def __init__(self):
+		self.traces = []
+
+	def export(self, spans):
+		self.traces.append(spans)
+
+
+def traced_client(client, sample_rate=1.0):
+	# El fixture client ya sustituye la sesión de base de datos; se añade el middleware de trazas por fuera
+	exporter = MemoryExporter()
+	return TestClient(TracingMiddleware(app, exporter=exporter, sample_rate=sample_rate)), exporter
+
+def test_trace_spans(client, student):
+	traced, exporter = traced_client(client)
+	res = traced.post("/students/", json=student, headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+	assert res.status_code == 200
+	[spans] = exporter.traces
+	by_name = {span.name: span for span in spans}
+	root = by_name["POST /students/"]
+	assert root.trace.trace_id == TRACE_ID and root.parent_span_id == PARENT_ID
+	assert root.attributes["http.status_code"] == 200
+	assert res.headers["traceparent"] == f"00-{TRACE_ID}-{root.span_id}-01"
+
+	route = by_name["route /students/"]
+	endpoint = by_name["endpoint create_students"]
+	crud = by_name["crud.students_crud.create_student"]
+	assert route.parent_span_id == root.span_id
+	assert endpoint.parent_span_id == route.span_id and crud.parent_span_id == endpoint.span_id
+	assert by_name["serialize response"].parent_span_id == route.span_id
+	sql = [s for s in spans if s.attributes.get("db.operation") == "INSERT"]
+	assert sql and all(s.parent_span_id == crud.span_id for s in sql)
+	assert all(s.end_ns >= s.start_ns for s in spans)
+
+def test_unsampled_request_not_traced(client):
+	traced, exporter = traced_client(client)
+	res = traced.get("/students/", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+	assert res.status_code == 200 and exporter.traces == [] and "traceparent" not in res.headers
+	traced, exporter = traced_client(client, sample_rate=0)
+	traced.get("/students/")
+	assert exporter.traces == []
+
+def test_traceparent_and_otlp_format(client):
+	assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+	assert parse_traceparent("00-xyz-1-01") is None
+	assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+
+	traced, exporter = traced_client(client)
+	traced.get("/students/999")
+	[spans] = exporter.traces
+	request = otlp_request(spans, "academia-musica")
+	otlp_spans = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+	root = next(s for s in otlp_spans if "parentSpanId" not in s)
+	assert root["name"] == "GET /students/{student_id}" and root["kind"] == 2
+	assert {"key": "http.status_code", "value": {"intValue": "404"}} in root["attributes"]
+	# El error del endpoint queda marcado en su span
+	assert any(s["status"].get("code") == 2 for s in otlp_spans if s["name"].startswith("endpoint "))
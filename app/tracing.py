@@ -0,0 +1,412 @@
+import os
+import re
+import json
+import time
+import queue
+import random
+import inspect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+'''
+Trazas ligeras por petición, activables con TRACING_ENABLED=1.
+
+Cada petición trazada genera spans para:
+    - La petición (TracingMiddleware), con método, ruta y código de estado.
+    - El handler de la ruta, la función del endpoint y la serialización de la respuesta (TracingRoute).
+    - Cada función de crud/ que recibe una sesión (instrument_module, aplicado en crud/__init__.py).
+    - Cada sentencia SQL (eventos del engine).
+
+El contexto de traza se toma de la cabecera traceparent (W3C Trace Context) si el cliente la envía, de modo
+que los spans se enlazan con la traza del llamante; la respuesta devuelve la cabecera traceparent del span
+de la petición.
+
+Las trazas terminadas se escriben desde un hilo en segundo plano en TRACE_FILE, una línea por traza con el
+formato JSON de OTLP (ExportTraceServiceRequest), que se puede reenviar a un collector de OpenTelemetry. Si
+la cola se llena, las trazas se descartan en lugar de bloquear la petición.
+
+Sin petición trazada en curso, las funciones instrumentadas solo consultan una variable de contexto.
+
+Configuración por variables de entorno:
+    TRACING_ENABLED: 1 activa las trazas (por defecto 0).
+    TRACE_FILE: archivo de trazas (por defecto traces.jsonl).
+    TRACE_SAMPLE_RATE: fracción de las peticiones sin traceparent que se trazan (por defecto 1).
+    TRACE_SERVICE_NAME: nombre del servicio en las trazas (por defecto academia-musica).
+'''
+
+logger = logging.getLogger("music_app")
+
+# Tipos de span de OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# Códigos de estado de OTLP
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Longitud máxima de las sentencias SQL guardadas en los spans
+MAX_STATEMENT_LENGTH = 2000
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_span_id", "name", "kind", "start_ns", "end_ns", "attributes",
+                 "status", "status_message")
+
+    def __init__(self, trace: "Trace", name: str, kind: int, parent_span_id: Optional[str],
+                 attributes: Optional[dict] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = 0
+        self.status_message = ""
+
+    def set_error(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            self.trace.finished(self)
+
+    def child(self, name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[dict] = None,
+              start_ns: Optional[int] = None) -> "Span":
+        return Span(self.trace, name, kind, self.span_id, attributes, start_ns)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+
+class Trace:
+    '''Spans terminados de una petición; los hilos del threadpool añaden los suyos a la misma lista.'''
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def finished(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+# Span en curso; None fuera de una petición trazada
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[dict] = None):
+    # Span hijo del span en curso; no hace nada si la petición no se está trazando
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    span = parent.child(name, kind, attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        span.end()
+
+
+def traced(func: Callable = None, *, name: Optional[str] = None) -> Callable:
+    # Decorador que crea un span por llamada (con el nombre módulo.función por defecto)
+    if func is None:
+        return functools.partial(traced, name=name)
+    span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return await func(*args, **kwargs)
+            with start_span(span_name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with start_span(span_name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_module(module) -> int:
+    '''
+    Envuelve con traced() las funciones públicas del módulo que reciben la sesión como primer parámetro
+    (las funciones CRUD). Se sustituyen en el propio módulo, así que también se trazan las llamadas entre
+    ellas y las importaciones posteriores reciben la versión instrumentada. Devuelve cuántas se envolvieron.
+    '''
+    count = 0
+    for attr, value in list(vars(module).items()):
+        if attr.startswith("_") or not inspect.isfunction(value) or value.__module__ != module.__name__:
+            continue
+        if getattr(value, "__traced__", False):
+            continue
+        parameters = list(inspect.signature(value).parameters)
+        if not parameters or parameters[0] != "db":
+            continue
+        wrapped = traced(value)
+        wrapped.__traced__ = True
+        setattr(module, attr, wrapped)
+        count += 1
+    return count
+
+
+def parse_traceparent(value: Optional[str]):
+    # Devuelve (trace_id, parent_span_id, sampled) o None si la cabecera no es válida
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_span(span: Span) -> dict:
+    data = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+        "status": {"code": span.status, "message": span.status_message} if span.status else {},
+    }
+    if span.parent_span_id:
+        data["parentSpanId"] = span.parent_span_id
+    return data
+
+
+def otlp_request(spans: List[Span], service_name: str) -> dict:
+    # Formato JSON de ExportTraceServiceRequest de OTLP
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "academia.tracing"}, "spans": [otlp_span(s) for s in spans]}],
+    }]}
+
+
+class FileSpanExporter:
+    '''Escribe las trazas como líneas JSON de OTLP desde un hilo en segundo plano.'''
+
+    def __init__(self, path: str, service_name: str = "academia-musica", max_queue: int = 1000):
+        self.path = path
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(otlp_request(spans, self.service_name)) + "\n")
+            except Exception as e:
+                logger.error("Error al escribir trazas: %s", e)
+            finally:
+                self._queue.task_done()
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp, exporter: Optional[FileSpanExporter] = None, sample_rate: Optional[float] = None):
+        self.app = app
+        self.exporter = exporter or FileSpanExporter(
+            os.getenv("TRACE_FILE", "traces.jsonl"),
+            service_name=os.getenv("TRACE_SERVICE_NAME", "academia-musica"),
+        )
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "1")) if sample_rate is None else sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if parent is not None:
+            trace_id, parent_span_id, sampled = parent
+        else:
+            trace_id, parent_span_id, sampled = None, None, random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(trace_id)
+        span = Span(trace, f"{scope['method']} {scope['path']}", SPAN_KIND_SERVER, parent_span_id, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+
+        async def send_with_traceparent(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    span.status = STATUS_ERROR
+                message.setdefault("headers", []).append((b"traceparent", span.traceparent().encode()))
+            await send(message)
+
+        token = _current.set(span)
+        try:
+            await self.app(scope, receive, send_with_traceparent)
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                # Nombre con la plantilla de la ruta, como recomiendan las convenciones de OpenTelemetry
+                span.name = f"{scope['method']} {route}"
+                span.attributes["http.route"] = route
+            span.end()
+            self.exporter.export(trace.spans)
+
+
+def _traced_endpoint(endpoint: Callable) -> Callable:
+    # Span de la función del endpoint; anota cuándo termina para medir después la serialización
+    name = f"endpoint {endpoint.__name__}"
+    if getattr(endpoint, "__traced__", False):
+        # include_router vuelve a crear las rutas con el endpoint ya envuelto
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            span = _current.get()
+            if span is None:
+                return await endpoint(*args, **kwargs)
+            try:
+                with start_span(name):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                span.attributes["_endpoint_end_ns"] = time.time_ns()
+        async_wrapper.__traced__ = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        span = _current.get()
+        if span is None:
+            return endpoint(*args, **kwargs)
+        try:
+            with start_span(name):
+                return endpoint(*args, **kwargs)
+        finally:
+            span.attributes["_endpoint_end_ns"] = time.time_ns()
+    wrapper.__traced__ = True
+    return wrapper
+
+
+class TracingRoute(APIRoute):
+    '''Ruta de FastAPI con spans para el handler, el endpoint y la serialización de la respuesta.'''
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def tracing_handler(request: Request):
+            if _current.get() is None:
+                return await handler(request)
+            with start_span(f"route {self.path}", attributes={"http.route": self.path}) as span:
+                try:
+                    return await handler(request)
+                finally:
+                    # Desde el final del endpoint hasta la respuesta: validación y serialización del resultado
+                    endpoint_end = span.attributes.pop("_endpoint_end_ns", None)
+                    if endpoint_end is not None:
+                        span.child("serialize response", start_ns=endpoint_end).end()
+
+        return tracing_handler
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    conn.info["trace_span"] = parent.child(operation, SPAN_KIND_CLIENT, {
+        "db.system": conn.dialect.name,
+        "db.statement": statement[:MAX_STATEMENT_LENGTH],
+        "db.operation": operation,
+    })
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_sql_span(conn, cursor, statement, parameters, context, executemany):
+    span = conn.info.pop("trace_span", None)
+    if span is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.attributes["db.rows_affected"] = cursor.rowcount
+        span.end()
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_sql_span(context):
+    conn = context.connection
+    span = conn.info.pop("trace_span", None) if conn is not None else None
+    if span is not None:
+        span.set_error(context.original_exception)
+        span.end()
+
+
+def tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "0") == "1"